@@ -2,7 +2,7 @@ import os
 import tempfile
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
 
 @dataclass(frozen=True)
@@ -14,6 +14,17 @@ class Settings:
     max_uncompressed_bytes: int
     max_images_per_job: int
     allowed_extensions: Tuple[str, ...]
+    # None keeps the defaults of src.utils.streaming.PipelineOptions
+    pipeline_workers: Optional[int] = None
+    pipeline_queue_size: Optional[int] = None
+    # fraction of the jobs processed with --profile, see src/utils/profiling.py
+    profile_sample_rate: float = 0.0
+    # None keeps memory.max_rss_mb of the template's config.json
+    max_rss_mb: Optional[int] = None
+    # JSON Lines file the spans of the jobs are appended to, see src/utils/tracing.py
+    trace_file: Optional[str] = None
+    # annotated images rendered on their first GET instead of during the job
+    defer_annotated_images: bool = True
 
     @property
     def auth_enabled(self) -> bool:
@@ -38,4 +49,19 @@ def get_settings() -> Settings:
         ),
         max_images_per_job=int(os.environ.get("OMR_MAX_IMAGES_PER_JOB", "50")),
         allowed_extensions=(".png", ".jpg", ".jpeg"),
+        pipeline_workers=_optional_int(os.environ.get("OMR_PIPELINE_WORKERS")),
+        pipeline_queue_size=_optional_int(os.environ.get("OMR_PIPELINE_QUEUE_SIZE")),
+        profile_sample_rate=float(os.environ.get("OMR_PROFILE_SAMPLE_RATE", "0")),
+        max_rss_mb=_optional_int(os.environ.get("OMR_MAX_RSS_MB")),
+        trace_file=os.environ.get("OMR_TRACE_FILE", "").strip() or None,
+        defer_annotated_images=os.environ.get("OMR_DEFER_ANNOTATED_IMAGES", "1")
+        .strip()
+        .lower()
+        not in {"0", "false", "no", "off"},
     )
+
+
+def _optional_int(value: Optional[str]) -> Optional[int]:
+    if value is None or not value.strip():
+        return None
+    return int(value)
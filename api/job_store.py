@@ -84,6 +84,22 @@ class JobStore:
             return False
         return now - modified > timedelta(seconds=self.ttl_seconds)
 
+    def get_usage(self) -> tuple[int, int]:
+        """(job directories, bytes on disk) of the store"""
+        jobs, size = 0, 0
+        for job_dir in self.root_dir.iterdir():
+            if not job_dir.is_dir():
+                continue
+            jobs += 1
+            for path in job_dir.rglob("*"):
+                try:
+                    if path.is_file():
+                        size += path.stat().st_size
+                except FileNotFoundError:
+                    # removed by a cleanup in the meantime
+                    continue
+        return jobs, size
+
     def cleanup_workspace(self, path: Path):
         temp_root = Path(tempfile.gettempdir())
         try:
@@ -1,12 +1,14 @@
 import json
 import os
+from datetime import datetime
 from typing import Optional
 
 os.environ.setdefault("OMR_HEADLESS", "1")
 
 from fastapi import Depends, FastAPI, File, Form, HTTPException, UploadFile
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 
+from api import metrics
 from api.auth import require_v1_auth
 from api.job_store import JobStoreError
 from api.models import ErrorResponse, JobResponse, ProcessResponse, TemplateListResponse
@@ -24,6 +26,19 @@ def get_processor() -> OMRProcessor:
     return OMRProcessor()
 
 
+def get_server_timing(job_document: dict) -> str:
+    """Server-Timing header of a job: its duration and the total of each stage"""
+    entries = []
+    if job_document.get("completed_at"):
+        duration = datetime.fromisoformat(
+            job_document["completed_at"]
+        ) - datetime.fromisoformat(job_document["created_at"])
+        entries.append(f"job;dur={duration.total_seconds() * 1000:.1f}")
+    for stage, stats in job_document.get("stage_timings", {}).items():
+        entries.append(f"{stage};dur={stats['total'] * 1000:.1f}")
+    return ", ".join(entries)
+
+
 @app.get("/")
 async def root():
     return {"message": "OMRChecker API está rodando!"}
@@ -34,6 +49,12 @@ async def healthz():
     return {"status": "ok"}
 
 
+@app.get("/metrics", dependencies=[Depends(require_v1_auth)])
+async def get_metrics(processor: OMRProcessor = Depends(get_processor)):
+    content = metrics.render(job_store_usage=processor.job_store.get_usage())
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
+
+
 @app.get(
     "/v1/templates",
     response_model=TemplateListResponse,
@@ -60,6 +81,7 @@ async def get_v1_template(
     dependencies=[Depends(require_v1_auth)],
 )
 async def create_omr_job(
+    response: Response,
     file: UploadFile = File(..., description="Arquivo ZIP com as imagens dos gabaritos"),
     template_id: str = Form(...),
     source_type: str = Form(...),
@@ -86,6 +108,7 @@ async def create_omr_job(
         source_id=source_id,
         metadata=parsed_metadata,
     )
+    response.headers["Server-Timing"] = get_server_timing(job_document)
     return processor.serialize_job_document(job_document)
 
 
@@ -94,8 +117,14 @@ async def create_omr_job(
     response_model=JobResponse,
     dependencies=[Depends(require_v1_auth)],
 )
-async def get_omr_job(job_id: str, processor: OMRProcessor = Depends(get_processor)):
-    return processor.serialize_job_document(processor.get_job(job_id))
+async def get_omr_job(
+    job_id: str,
+    response: Response,
+    processor: OMRProcessor = Depends(get_processor),
+):
+    job_document = processor.get_job(job_id)
+    response.headers["Server-Timing"] = get_server_timing(job_document)
+    return processor.serialize_job_document(job_document)
 
 
 @app.get(
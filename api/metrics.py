@@ -0,0 +1,284 @@
+"""
+Process-local metrics of the API, rendered by /metrics in the Prometheus text
+exposition format (version 0.0.4), without a client library or external service.
+
+Each uvicorn worker keeps its own values, scrape every worker (or run one per
+container) to see all of them.
+"""
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.utils.instrumentation import STAGE_TIMINGS
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120
+)
+SIZE_BUCKETS = tuple(64 * 1024 * 4**power for power in range(8))  # 64 KB to 1 GB
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)
+    )
+    return f"{{{pairs}}}"
+
+
+class Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], float] = {}
+        if not self.label_names:
+            # rendered as 0 before the first update
+            self.values[()] = 0
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {self.label_names}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self.lock:
+            values = sorted(self.values.items())
+        for label_values, value in values:
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(map(float, buckets))) + (float("inf"),)
+        # label values -> (count per bucket, sum)
+        self.series: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.series.get(key, ([0] * len(self.buckets), 0.0))
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[index] += 1
+                    break
+            self.series[key] = (counts, total + value)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self.lock:
+            series = sorted(
+                (key, (list(counts), total))
+                for key, (counts, total) in self.series.items()
+            )
+        for label_values, (counts, total) in series:
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.label_names + ("le",),
+                    label_values + (_format_value(upper_bound),),
+                )
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.label_names, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+JOBS = REGISTRY.register(
+    Counter(
+        "omr_jobs_total",
+        "Jobs by final status (completed, failed, rejected before processing).",
+        ["status"],
+    )
+)
+JOBS_IN_PROGRESS = REGISTRY.register(
+    Gauge("omr_jobs_in_progress", "Jobs being extracted or processed.")
+)
+JOB_SECONDS = REGISTRY.register(
+    Histogram("omr_job_seconds", "Processing time of a job.", ["template_id"])
+)
+SHEETS = REGISTRY.register(
+    Counter(
+        "omr_sheets_total",
+        "Sheets by outcome (processed, needs_review, failed).",
+        ["template_id", "outcome"],
+    )
+)
+SHEET_SECONDS = REGISTRY.register(
+    Histogram(
+        "omr_sheet_seconds",
+        "Time from decoding a sheet to writing its csv row, queue waits included.",
+        ["template_id"],
+    )
+)
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "omr_stage_seconds",
+        "Time of each pipeline stage of a sheet, see src/utils/instrumentation.py.",
+        ["template_id", "stage"],
+    )
+)
+SHEETS_IN_FLIGHT = REGISTRY.register(
+    Gauge(
+        "omr_pipeline_sheets_in_flight",
+        "Decoded sheets not written yet, the depth of the pipeline queues.",
+    )
+)
+UPLOAD_BYTES = REGISTRY.register(
+    Histogram("omr_upload_bytes", "Size of the uploaded ZIPs.", buckets=SIZE_BUCKETS)
+)
+TEMPLATE_CACHE = REGISTRY.register(
+    Counter(
+        "omr_template_cache_total",
+        "Template registry lookups served from the cache (hit) or loaded (miss).",
+        ["result"],
+    )
+)
+ANNOTATED_IMAGES = REGISTRY.register(
+    Counter(
+        "omr_annotated_images_total",
+        "Deferred annotated images rendered on their first request (rendered, failed).",
+        ["result"],
+    )
+)
+ANNOTATED_IMAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "omr_annotated_image_seconds",
+        "Time to render a deferred annotated image, preprocessing included.",
+    )
+)
+JOB_STORE_JOBS = REGISTRY.register(
+    Gauge("omr_job_store_jobs", "Job directories in the job store.")
+)
+JOB_STORE_BYTES = REGISTRY.register(
+    Gauge("omr_job_store_bytes", "Disk usage of the job store.")
+)
+
+
+@contextmanager
+def track_job(template_id: str) -> Iterator[None]:
+    """Counts the job in progress and feeds the stage timings of its pipeline
+    into the sheet and stage histograms"""
+    in_flight = [0]
+    lock = threading.Lock()
+
+    def listener(stage: str, start: float, end: float, failed: bool):
+        if stage == "sheet":
+            SHEET_SECONDS.observe(end - start, template_id=template_id)
+            with lock:
+                in_flight[0] -= 1
+            SHEETS_IN_FLIGHT.dec()
+            return
+        STAGE_SECONDS.observe(end - start, template_id=template_id, stage=stage)
+        if stage == "decode" and not failed:
+            with lock:
+                in_flight[0] += 1
+            SHEETS_IN_FLIGHT.inc()
+
+    JOBS_IN_PROGRESS.inc()
+    STAGE_TIMINGS.add_listener(listener)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_TIMINGS.remove_listener(listener)
+        JOB_SECONDS.observe(perf_counter() - start, template_id=template_id)
+        JOBS_IN_PROGRESS.dec()
+        # sheets of a failed pipeline are never written
+        SHEETS_IN_FLIGHT.dec(in_flight[0])
+
+
+def record_job_document(job_document: dict):
+    JOBS.inc(status=job_document["status"])
+    summary = job_document["summary"]
+    for outcome in ["processed", "needs_review", "failed"]:
+        SHEETS.inc(
+            summary.get(outcome, 0),
+            template_id=job_document["template_id"],
+            outcome=outcome,
+        )
+
+
+def render(job_store_usage: Optional[Tuple[int, int]] = None) -> str:
+    if job_store_usage is not None:
+        jobs, size = job_store_usage
+        JOB_STORE_JOBS.set(jobs)
+        JOB_STORE_BYTES.set(size)
+    return REGISTRY.render()
@@ -42,6 +42,33 @@ class JobSummary(BaseModel):
     failed: int
 
 
+class StageTiming(BaseModel):
+    count: int
+    failures: int
+    mean: float
+    p50: float
+    p95: float
+    max: float
+    total: float
+
+
+class HotFunction(BaseModel):
+    function: str
+    calls: int
+    own_s: float
+    cumulative_s: float
+
+
+class MemoryUsage(BaseModel):
+    # RSS of the API process while the job ran
+    start_rss_mb: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    end_rss_mb: Optional[float] = None
+    max_rss_mb: Optional[int] = None
+    limit_hit: bool = False
+    degraded: List[str] = Field(default_factory=list)
+
+
 class JobResponse(BaseModel):
     job_id: str
     status: str
@@ -53,6 +80,14 @@ class JobResponse(BaseModel):
     summary: JobSummary
     sheets: List[SheetResult] = Field(default_factory=list)
     errors: List[str] = Field(default_factory=list)
+    stage_timings: Dict[str, StageTiming] = Field(default_factory=dict)
+    # only for the jobs sampled by OMR_PROFILE_SAMPLE_RATE
+    hot_functions: List[HotFunction] = Field(default_factory=list)
+    memory: Optional[MemoryUsage] = None
+    # of the spans of the job, when OMR_TRACE_FILE is set
+    trace_id: Optional[str] = None
+    # annotated images rendered on their first request
+    annotated_images_deferred: bool = False
 
 
 class TemplateListResponse(BaseModel):
@@ -1,18 +1,25 @@
 import csv
+import json
 import os
+import random
 import uuid
 import zipfile
 from datetime import datetime, timezone
 from pathlib import Path
+from time import perf_counter
 from typing import Dict, List, Optional
 
+from api import metrics
 from api.config import Settings, get_settings
 from api.job_store import JobStore, JobStoreError
 from api.models import OMRResult, ProcessResponse
 from api.template_registry import RegisteredTemplate, TemplateRegistry, TemplateRegistryError
 from api.utils import FileHandler
 from main import entry_point_for_args
+from src.annotate import annotate_sheet
+from src.defaults import CONFIG_DEFAULTS
 from src.logger import logger
+from src.utils.tracing import TRACER
 
 
 class OMRProcessingError(Exception):
@@ -48,10 +55,58 @@ class OMRProcessor:
         source_id: Optional[str] = None,
         metadata: Optional[dict] = None,
     ) -> dict:
-        template = self.registry.get_template(template_id)
-        if not template.manifest.is_active:
-            raise OMRProcessingError(f"Template '{template_id}' is inactive")
+        metrics.UPLOAD_BYTES.observe(len(zip_content))
+        try:
+            template = self.registry.get_template(template_id)
+            if not template.manifest.is_active:
+                raise OMRProcessingError(f"Template '{template_id}' is inactive")
+        except (OMRProcessingError, TemplateRegistryError):
+            metrics.JOBS.inc(status="rejected")
+            raise
+
+        if self.settings.trace_file:
+            TRACER.export_to(self.settings.trace_file)
+        job_attributes = {
+            "omr.template_id": template_id,
+            "omr.source_type": source_type,
+            "omr.upload_bytes": len(zip_content),
+        }
+        # registered template ids only, the labels of the metrics stay bounded
+        with metrics.track_job(template_id), TRACER.span(
+            "omr.job", job_attributes
+        ) as job_span:
+            try:
+                job_document = self._run_job(
+                    template=template,
+                    upload_filename=upload_filename,
+                    zip_content=zip_content,
+                    source_type=source_type,
+                    source_id=source_id,
+                    metadata=metadata,
+                )
+            except OMRProcessingError:
+                metrics.JOBS.inc(status="rejected")
+                raise
+            if job_span is not None:
+                job_span.set_attribute("omr.job_id", job_document["job_id"])
+                job_span.set_attribute("omr.status", job_document["status"])
+                job_span.set_attribute("omr.sheets", job_document["summary"]["total"])
+        metrics.record_job_document(job_document)
+        return job_document
 
+    def _run_job(
+        self,
+        *,
+        template: RegisteredTemplate,
+        upload_filename: str,
+        zip_content: bytes,
+        source_type: str,
+        source_id: Optional[str],
+        metadata: Optional[dict],
+    ) -> dict:
+        template_id = template.manifest.id
+        started = perf_counter()
+        job_span = TRACER.get_current_span()
         job_id = str(uuid.uuid4())
         created_at = self._now()
         job_dir = self.job_store.create_job_dir(job_id)
@@ -83,6 +138,10 @@ class OMRProcessor:
         if not success:
             self.job_store.delete_job(job_id)
             raise OMRProcessingError(message)
+        annotated_images_deferred = (
+            self.settings.defer_annotated_images
+            and self._defer_annotated_images(workspace)
+        )
 
         output_dir = workspace / "outputs"
         args = {
@@ -91,6 +150,12 @@ class OMRProcessor:
             "debug": False,
             "autoAlign": False,
             "setLayout": False,
+            "timings": True,
+            "workers": self.settings.pipeline_workers,
+            "queue_size": self.settings.pipeline_queue_size,
+            "profile": random.random() < self.settings.profile_sample_rate,
+            "memory": True,
+            "max_rss_mb": self.settings.max_rss_mb,
         }
 
         job_document = {
@@ -101,6 +166,9 @@ class OMRProcessor:
             "source_id": source_id,
             "metadata": metadata or {},
             "upload_filename": upload_filename,
+            # of the omr.job span when OMR_TRACE_FILE is set
+            "trace_id": job_span.trace_id if job_span else None,
+            "annotated_images_deferred": annotated_images_deferred,
         }
 
         try:
@@ -110,6 +178,7 @@ class OMRProcessor:
                 workspace=workspace,
                 template=template,
                 image_files=image_files,
+                annotated_images_deferred=annotated_images_deferred,
             )
             job_document.update(
                 status="completed",
@@ -117,6 +186,9 @@ class OMRProcessor:
                 summary=self._build_summary(sheets),
                 sheets=sheets,
                 errors=[],
+                stage_timings=self._read_stage_timings(output_dir),
+                hot_functions=self._read_hot_functions(output_dir),
+                memory=self._read_memory(output_dir),
             )
         except Exception as exc:
             logger.error(
@@ -133,8 +205,16 @@ class OMRProcessor:
                 summary=self._build_summary(failed_sheets),
                 sheets=failed_sheets,
                 errors=[str(exc)],
+                stage_timings=self._read_stage_timings(output_dir),
+                hot_functions=self._read_hot_functions(output_dir),
+                memory=self._read_memory(output_dir),
             )
 
+        logger.info(
+            f"event=omr_job_finished job_id={job_id} template_id={template_id} "
+            f"status={job_document['status']} sheets={job_document['summary']['total']} "
+            f"duration_ms={(perf_counter() - started) * 1000:.1f}"
+        )
         self.job_store.save_job(job_id, job_document)
         return job_document
 
@@ -145,12 +225,39 @@ class OMRProcessor:
         job_document = self.get_job(job_id)
         for sheet in job_document["sheets"]:
             if sheet["sheet_id"] == sheet_id:
-                artifact_path = sheet.get("annotated_image_path")
-                if artifact_path and Path(artifact_path).exists():
-                    return Path(artifact_path)
+                artifact_path = self._get_annotated_image(job_document, sheet)
+                if artifact_path is not None:
+                    return artifact_path
                 raise JobStoreError(f"Sheet '{sheet_id}' has no annotated artifact")
         raise JobStoreError(f"Sheet '{sheet_id}' not found")
 
+    def _get_annotated_image(self, job_document: dict, sheet: dict) -> Optional[Path]:
+        """The annotated image of a sheet, rendered and kept in the job the first
+        time it is asked for when the job deferred it"""
+        artifact_path = sheet.get("annotated_image_path")
+        if artifact_path and Path(artifact_path).exists():
+            return Path(artifact_path)
+        input_path = sheet.get("annotation_input_path")
+        if not input_path:
+            return None
+
+        job_id = job_document["job_id"]
+        workspace = self.job_store.get_workspace_path(job_id)
+        started = perf_counter()
+        try:
+            artifact_path = annotate_sheet(workspace, input_path, workspace / "outputs")
+        except Exception as exc:
+            metrics.ANNOTATED_IMAGES.inc(result="failed")
+            logger.error(
+                f"event=omr_annotation_failed job_id={job_id} sheet_id={sheet['sheet_id']} error={exc}"
+            )
+            return None
+        metrics.ANNOTATED_IMAGES.inc(result="rendered")
+        metrics.ANNOTATED_IMAGE_SECONDS.observe(perf_counter() - started)
+        sheet["annotated_image_path"] = str(artifact_path)
+        self.job_store.save_job(job_id, job_document)
+        return artifact_path
+
     def serialize_job_document(self, job_document: dict) -> dict:
         serialized = {**job_document}
         serialized["sheets"] = []
@@ -180,10 +287,10 @@ class OMRProcessor:
             if legacy_data is None:
                 continue
 
-            artifact_path = sheet.get("annotated_image_path")
+            artifact_path = self._get_annotated_image(job_document, sheet)
             processed_image = ""
-            if artifact_path and Path(artifact_path).exists():
-                processed_image = FileHandler.image_to_base64(Path(artifact_path))
+            if artifact_path is not None:
+                processed_image = FileHandler.image_to_base64(artifact_path)
 
             results.append(
                 OMRResult(
@@ -214,6 +321,7 @@ class OMRProcessor:
         workspace: Path,
         template: RegisteredTemplate,
         image_files: List[Path],
+        annotated_images_deferred: bool = False,
     ) -> List[dict]:
         output_dir = workspace / "outputs"
         rows_by_filename = self._read_output_rows(output_dir)
@@ -231,6 +339,7 @@ class OMRProcessor:
                 template=template,
                 row_bundle=row_bundle,
                 workspace=workspace,
+                annotated_images_deferred=annotated_images_deferred,
             )
             sheets.append(sheet)
         return sheets
@@ -301,6 +410,36 @@ class OMRProcessor:
 
         return rows_by_filename
 
+    def _read_stage_timings(self, output_dir: Path) -> Dict[str, dict]:
+        results_dir = output_dir / "Results"
+        if not results_dir.exists():
+            return {}
+        candidates = list(results_dir.glob("StageTimings_*.json"))
+        if not candidates:
+            return {}
+        with open(max(candidates, key=os.path.getctime), encoding="utf-8") as handle:
+            return json.load(handle)
+
+    def _read_hot_functions(self, output_dir: Path) -> List[dict]:
+        results_dir = output_dir / "Results"
+        if not results_dir.exists():
+            return []
+        candidates = list(results_dir.glob("Profile_*.json"))
+        if not candidates:
+            return []
+        with open(max(candidates, key=os.path.getctime), encoding="utf-8") as handle:
+            return json.load(handle)["hot_functions"]
+
+    def _read_memory(self, output_dir: Path) -> Optional[dict]:
+        results_dir = output_dir / "Results"
+        if not results_dir.exists():
+            return None
+        candidates = list(results_dir.glob("Memory_*.json"))
+        if not candidates:
+            return None
+        with open(max(candidates, key=os.path.getctime), encoding="utf-8") as handle:
+            return json.load(handle)
+
     def _normalize_sheet(
         self,
         *,
@@ -309,6 +448,7 @@ class OMRProcessor:
         template: RegisteredTemplate,
         row_bundle: dict,
         workspace: Path,
+        annotated_images_deferred: bool = False,
     ) -> dict:
         row = row_bundle["row"]
         kind = row_bundle["kind"]
@@ -351,8 +491,12 @@ class OMRProcessor:
             filename=filename,
             workspace=workspace,
         )
+        # rendered on the first request, from the raw reads of the sheet
+        annotation_input_path = None
+        if annotated_images_deferred and kind != "errors":
+            annotation_input_path = row.get("input_path") or None
         annotated_url = None
-        if artifact_path is not None:
+        if artifact_path is not None or annotation_input_path is not None:
             annotated_url = f"/v1/omr-jobs/{job_id}/sheets/{sheet_id}/artifacts/annotated"
 
         return {
@@ -375,9 +519,25 @@ class OMRProcessor:
             "attention_flags": attention_flags,
             "annotated_image_url": annotated_url,
             "annotated_image_path": str(artifact_path) if artifact_path else None,
+            "annotation_input_path": annotation_input_path,
             "legacy_data": self._build_legacy_data(row) if kind == "results" else None,
         }
 
+    def _defer_annotated_images(self, workspace: Path) -> bool:
+        """Turns save_detections off and save_raw_reads on in the config.json of
+        the job, unless the template saves no annotated images at all"""
+        config_path = workspace / "config.json"
+        config = {}
+        if config_path.exists():
+            with open(config_path, encoding="utf-8") as handle:
+                config = json.load(handle)
+        outputs = config.setdefault("outputs", {})
+        if not outputs.get("save_detections", CONFIG_DEFAULTS.outputs.save_detections):
+            return False
+        outputs.update(save_detections=False, save_raw_reads=True)
+        config_path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+        return True
+
     def _build_legacy_data(self, row: dict) -> Dict[str, str]:
         return {
             key: value
@@ -1,10 +1,12 @@
 import re
+import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from pydantic import BaseModel
 
+from api.metrics import TEMPLATE_CACHE
 from src.utils.parsing import custom_sort_output_columns, open_template_with_defaults, parse_fields
 
 
@@ -40,6 +42,10 @@ class RegisteredTemplate:
 
 class TemplateRegistry:
     manifest_filename = "manifest.json"
+    # template dir -> (stats of its json files, template), shared by the registries
+    # of all requests and reloaded when one of the files changes
+    _cache: Dict[Path, Tuple[tuple, RegisteredTemplate]] = {}
+    _cache_lock = threading.Lock()
 
     def __init__(self, root_dir: Path = Path("samples")):
         self.root_dir = Path(root_dir)
@@ -55,7 +61,7 @@ class TemplateRegistry:
             manifest_path = template_dir / self.manifest_filename
             if not manifest_path.exists():
                 continue
-            templates.append(self._load_registered_template(template_dir, manifest_path))
+            templates.append(self._get_registered_template(template_dir, manifest_path))
         return templates
 
     def list_templates(self) -> List[RegisteredTemplate]:
@@ -70,6 +76,35 @@ class TemplateRegistry:
                 return template
         raise TemplateRegistryError(f"Template '{template_id}' not found")
 
+    def _get_registered_template(
+        self, template_dir: Path, manifest_path: Path
+    ) -> RegisteredTemplate:
+        file_stats = self._get_file_stats(
+            [manifest_path, template_dir / "template.json", template_dir / "config.json"]
+        )
+        cache_key = template_dir.resolve()
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+        if cached is not None and cached[0] == file_stats:
+            TEMPLATE_CACHE.inc(result="hit")
+            return cached[1]
+        TEMPLATE_CACHE.inc(result="miss")
+        template = self._load_registered_template(template_dir, manifest_path)
+        with self._cache_lock:
+            self._cache[cache_key] = (file_stats, template)
+        return template
+
+    def _get_file_stats(self, paths: List[Path]) -> tuple:
+        file_stats = []
+        for path in paths:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                file_stats.append(None)
+                continue
+            file_stats.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(file_stats)
+
     def _load_registered_template(
         self, template_dir: Path, manifest_path: Path
     ) -> RegisteredTemplate:
@@ -11,13 +11,16 @@ from api.main import app, get_processor
 from api.services import OMRProcessor
 from api.template_registry import TemplateRegistry
 from src.tests.test_samples.sample2.boilerplate import CONFIG_BOILERPLATE, TEMPLATE_BOILERPLATE
+from src.utils.tracing import TRACER, InMemoryExporter
 
 
 def _write_json(path: Path, payload: dict):
     path.write_text(json.dumps(payload), encoding="utf-8")
 
 
-def _build_test_processor(tmp_path: Path) -> OMRProcessor:
+def _build_test_processor(
+    tmp_path: Path, profile_sample_rate=0.0, defer_annotated_images=True
+) -> OMRProcessor:
     registry_root = tmp_path / "templates"
     template_dir = registry_root / "sample1-template"
     template_dir.mkdir(parents=True)
@@ -52,6 +55,8 @@ def _build_test_processor(tmp_path: Path) -> OMRProcessor:
         max_uncompressed_bytes=20 * 1024 * 1024,
         max_images_per_job=10,
         allowed_extensions=(".png", ".jpg", ".jpeg"),
+        profile_sample_rate=profile_sample_rate,
+        defer_annotated_images=defer_annotated_images,
     )
     return OMRProcessor(
         registry=TemplateRegistry(registry_root),
@@ -94,6 +99,16 @@ def test_v1_job_flow(monkeypatch, tmp_path):
     assert payload["sheets"][0]["review_artifacts"]["annotated_image_url"]
     assert "attention_flags" in payload["sheets"][0]
     assert isinstance(payload["sheets"][0]["attention_flags"], list)
+    stage_timings = payload["stage_timings"]
+    assert stage_timings["preprocess.CropOnMarkers"]["count"] == 1
+    for stage in ["normalize", "align", "sample", "threshold", "render", "save"]:
+        assert stage_timings[f"read.{stage}"]["count"] == 1
+    assert payload["hot_functions"] == []
+    assert payload["memory"]["peak_rss_mb"] > 0
+    assert payload["memory"]["limit_hit"] is False
+    server_timing = response.headers["Server-Timing"]
+    assert server_timing.startswith("job;dur=")
+    assert "preprocess.CropOnMarkers;dur=" in server_timing
 
     job_response = client.get(
         f"/v1/omr-jobs/{payload['job_id']}",
@@ -121,6 +136,170 @@ def test_v1_job_flow(monkeypatch, tmp_path):
     app.dependency_overrides.clear()
 
 
+def test_v1_sampled_job_is_profiled(monkeypatch, tmp_path):
+    monkeypatch.setenv("OMR_API_TOKEN", "test-token")
+    processor = _build_test_processor(tmp_path, profile_sample_rate=1.0)
+    app.dependency_overrides[get_processor] = lambda: processor
+    client = TestClient(app)
+
+    zip_path = tmp_path / "upload.zip"
+    _build_zip(zip_path, Path("src/tests/test_samples/sample2/sample.jpg"))
+    with open(zip_path, "rb") as file:
+        response = client.post(
+            "/v1/omr-jobs",
+            headers={"Authorization": "Bearer test-token"},
+            data={"template_id": "sample2-template", "source_type": "generic"},
+            files={"file": ("upload.zip", file, "application/zip")},
+        )
+
+    assert response.status_code == 200, response.text
+    hot_functions = response.json()["hot_functions"]
+    assert 0 < len(hot_functions) <= 20
+    assert {"function", "calls", "own_s", "cumulative_s"} == set(hot_functions[0])
+    job_dir = tmp_path / "jobs" / response.json()["job_id"]
+    assert list(job_dir.glob("workspace/outputs/Results/Profile_*.prof"))
+
+    app.dependency_overrides.clear()
+
+
+def test_v1_job_is_traced(monkeypatch, tmp_path):
+    monkeypatch.setenv("OMR_API_TOKEN", "test-token")
+    processor = _build_test_processor(tmp_path)
+    app.dependency_overrides[get_processor] = lambda: processor
+    client = TestClient(app)
+
+    zip_path = tmp_path / "upload.zip"
+    _build_zip(zip_path, Path("src/tests/test_samples/sample2/sample.jpg"))
+    exporter = InMemoryExporter()
+    TRACER.exporter = exporter
+    try:
+        with open(zip_path, "rb") as file:
+            response = client.post(
+                "/v1/omr-jobs",
+                headers={"Authorization": "Bearer test-token"},
+                data={"template_id": "sample2-template", "source_type": "generic"},
+                files={"file": ("upload.zip", file, "application/zip")},
+            )
+    finally:
+        TRACER.exporter = None
+
+    assert response.status_code == 200, response.text
+    spans = {span["name"]: span for span in exporter.spans}
+    job_span = spans["omr.job"]
+    assert job_span["parentSpanId"] == ""
+    assert job_span["traceId"] == response.json()["trace_id"]
+    assert {"key": "omr.status", "value": {"stringValue": "completed"}} in job_span[
+        "attributes"
+    ]
+    assert spans["omr.directory"]["parentSpanId"] == job_span["spanId"]
+    assert spans["omr.sheet"]["parentSpanId"] == spans["omr.directory"]["spanId"]
+    assert spans["decode"]["parentSpanId"] == spans["omr.sheet"]["spanId"]
+
+    app.dependency_overrides.clear()
+
+
+def test_v1_annotated_image_is_rendered_on_first_request(monkeypatch, tmp_path):
+    monkeypatch.setenv("OMR_API_TOKEN", "test-token")
+    headers = {"Authorization": "Bearer test-token"}
+    zip_path = tmp_path / "upload.zip"
+    _build_zip(zip_path, Path("src/tests/test_samples/sample2/sample.jpg"))
+
+    def run_job(processor):
+        app.dependency_overrides[get_processor] = lambda: processor
+        client = TestClient(app)
+        with open(zip_path, "rb") as file:
+            response = client.post(
+                "/v1/omr-jobs",
+                headers=headers,
+                data={"template_id": "sample2-template", "source_type": "generic"},
+                files={"file": ("upload.zip", file, "application/zip")},
+            )
+        assert response.status_code == 200, response.text
+        return client, response.json()
+
+    eager_processor = _build_test_processor(
+        tmp_path / "eager", defer_annotated_images=False
+    )
+    client, payload = run_job(eager_processor)
+    assert payload["annotated_images_deferred"] is False
+    eager_image = client.get(
+        payload["sheets"][0]["review_artifacts"]["annotated_image_url"],
+        headers=headers,
+    ).content
+
+    processor = _build_test_processor(tmp_path / "deferred")
+    client, payload = run_job(processor)
+    assert payload["annotated_images_deferred"] is True
+    workspace = processor.job_store.get_workspace_path(payload["job_id"])
+    assert not list(workspace.glob("outputs/CheckedOMRs/*.jpg"))
+
+    artifact_url = payload["sheets"][0]["review_artifacts"]["annotated_image_url"]
+    for _ in range(2):
+        artifact_response = client.get(artifact_url, headers=headers)
+        assert artifact_response.status_code == 200
+        assert artifact_response.content == eager_image
+    (sheet,) = processor.get_job(payload["job_id"])["sheets"]
+    assert sheet["annotated_image_path"] == str(
+        workspace / "outputs" / "CheckedOMRs" / "sample.jpg"
+    )
+
+    app.dependency_overrides.clear()
+
+
+def _read_metric(metrics_text: str, sample: str) -> float:
+    for line in metrics_text.splitlines():
+        if line.startswith(f"{sample} "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_v1_metrics(monkeypatch, tmp_path):
+    monkeypatch.setenv("OMR_API_TOKEN", "test-token")
+    processor = _build_test_processor(tmp_path)
+    app.dependency_overrides[get_processor] = lambda: processor
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer test-token"}
+
+    assert client.get("/metrics").status_code == 401
+    before = client.get("/metrics", headers=headers).text
+
+    zip_path = tmp_path / "upload.zip"
+    _build_zip(zip_path, Path("src/tests/test_samples/sample2/sample.jpg"))
+    with open(zip_path, "rb") as file:
+        response = client.post(
+            "/v1/omr-jobs",
+            headers=headers,
+            data={"template_id": "sample2-template", "source_type": "generic"},
+            files={"file": ("upload.zip", file, "application/zip")},
+        )
+    assert response.status_code == 200, response.text
+
+    metrics_response = client.get("/metrics", headers=headers)
+    assert metrics_response.status_code == 200
+    assert metrics_response.headers["content-type"].startswith("text/plain")
+    after = metrics_response.text
+    template_labels = 'template_id="sample2-template"'
+    for sample in [
+        'omr_jobs_total{status="completed"}',
+        "omr_upload_bytes_count",
+        f"omr_sheet_seconds_count{{{template_labels}}}",
+        f'omr_stage_seconds_count{{{template_labels},stage="decode"}}',
+    ]:
+        assert _read_metric(after, sample) == _read_metric(before, sample) + 1, sample
+    outcomes = [
+        _read_metric(after, f'omr_sheets_total{{{template_labels},outcome="{outcome}"}}')
+        - _read_metric(before, f'omr_sheets_total{{{template_labels},outcome="{outcome}"}}')
+        for outcome in ["processed", "needs_review", "failed"]
+    ]
+    assert sum(outcomes) == 1
+    assert _read_metric(after, "omr_pipeline_sheets_in_flight") == 0
+    assert _read_metric(after, "omr_jobs_in_progress") == 0
+    assert _read_metric(after, "omr_job_store_jobs") == 1
+    assert _read_metric(after, "omr_job_store_bytes") > 0
+
+    app.dependency_overrides.clear()
+
+
 def test_v1_requires_auth(monkeypatch, tmp_path):
     monkeypatch.setenv("OMR_API_TOKEN", "test-token")
     processor = _build_test_processor(tmp_path)
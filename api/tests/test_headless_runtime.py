@@ -22,3 +22,25 @@ def test_headless_import_runtime():
 
     assert result.returncode == 0, result.stderr
     assert "ok" in result.stdout
+
+
+def test_api_import_defers_heavy_modules():
+    env = dict(os.environ)
+    env["OMR_HEADLESS"] = "1"
+    env.setdefault("PYTEST_DISABLE_PLUGIN_AUTOLOAD", "1")
+
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, api.main; "
+            "print('heavy:', *(m for m in ['matplotlib', 'pandas', 'screeninfo'] if m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert "heavy:\n" in result.stdout
@@ -0,0 +1,33 @@
+from api.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_registry_renders_text_exposition_format():
+    registry = MetricsRegistry()
+    jobs = registry.register(Counter("jobs_total", "Jobs.", ["status"]))
+    in_progress = registry.register(Gauge("jobs_in_progress", "Jobs running."))
+    latency = registry.register(
+        Histogram("sheet_seconds", "Sheets.", ["template_id"], buckets=[0.1, 1])
+    )
+    jobs.inc(status="completed")
+    jobs.inc(2, status='fa"iled')
+    for value in [0.05, 0.5, 5]:
+        latency.observe(value, template_id="t1")
+
+    assert registry.render().splitlines() == [
+        "# HELP jobs_total Jobs.",
+        "# TYPE jobs_total counter",
+        'jobs_total{status="completed"} 1',
+        'jobs_total{status="fa\\"iled"} 2',
+        "# HELP jobs_in_progress Jobs running.",
+        "# TYPE jobs_in_progress gauge",
+        "jobs_in_progress 0",
+        "# HELP sheet_seconds Sheets.",
+        "# TYPE sheet_seconds histogram",
+        'sheet_seconds_bucket{template_id="t1",le="0.1"} 1',
+        'sheet_seconds_bucket{template_id="t1",le="1.0"} 2',
+        'sheet_seconds_bucket{template_id="t1",le="+Inf"} 3',
+        'sheet_seconds_sum{template_id="t1"} 5.55',
+        'sheet_seconds_count{template_id="t1"} 3',
+    ]
+    in_progress.inc()
+    assert "jobs_in_progress 1" in registry.render()
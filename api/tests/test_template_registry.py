@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pytest
 
+from api.metrics import TEMPLATE_CACHE
 from api.template_registry import TemplateRegistry, TemplateRegistryError
 
 
@@ -123,3 +124,48 @@ def test_registry_reflects_new_manifest_without_restarting(tmp_path):
     templates = registry.list_templates()
     assert len(templates) == 1
     assert templates[0].manifest.id == "dynamic-template"
+
+
+def test_registry_caches_templates_until_their_files_change(tmp_path):
+    template_dir = tmp_path / "cached-template"
+    template_dir.mkdir()
+    template_json = {
+        "pageDimensions": [300, 400],
+        "bubbleDimensions": [10, 10],
+        "preProcessors": [],
+        "fieldBlocks": {
+            "answers": {
+                "fieldType": "QTYPE_MCQ5",
+                "origin": [10, 10],
+                "bubblesGap": 5,
+                "labelsGap": 10,
+                "fieldLabels": ["q1..2"],
+            }
+        },
+    }
+    _write_json(template_dir / "template.json", template_json)
+    _write_json(template_dir / "config.json", {})
+    manifest = {
+        "id": "cached-template",
+        "name": "Cached Template",
+        "school": "Test",
+        "card_brand_or_model": "Paper",
+        "application_label": "cached",
+        "question_count": 2,
+        "areas": ["TEST"],
+        "student_identifier_schema": "none",
+        "language_schema": "none",
+        "version": "1.0.0",
+        "is_active": True,
+    }
+    _write_json(template_dir / "manifest.json", manifest)
+
+    hits = dict(TEMPLATE_CACHE.values).get(("hit",), 0)
+    first = TemplateRegistry(tmp_path).get_template("cached-template")
+    # a new registry per request still finds the template in the cache
+    assert TemplateRegistry(tmp_path).get_template("cached-template") is first
+    assert TEMPLATE_CACHE.values[("hit",)] == hits + 1
+
+    _write_json(template_dir / "manifest.json", {**manifest, "version": "1.0.1"})
+    changed = TemplateRegistry(tmp_path).get_template("cached-template")
+    assert changed.manifest.version == "1.0.1"
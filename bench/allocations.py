@@ -0,0 +1,176 @@
+"""
+Allocation benchmark of read_omr_response, per template.
+
+For every template in samples/ (or the ones given with --templates) a batch of
+synthetic sheets is generated (see bench/synthetic.py), decoded and
+preprocessed, then read with read_omr_response while the numpy buffers it
+allocates are counted: tracemalloc follows the arrays of numpy and OpenCV, and
+the traced memory is checked before every bytecode of the pipeline, a rise of
+at least --minKB between two of them is one allocation. The first sheet warms
+the caches up and is left out of the report.
+
+Reported per sheet: the allocations and their MB, with and without auto_align
+(or only the mode given with --autoAlign/--noAutoAlign), for the outputs of a
+plain run (no debug images, no annotated image).
+
+Usage: python bench/allocations.py [--sheets 5] [--templates somos-1] [--minKB 64]
+"""
+import argparse
+import contextlib
+import io
+import logging
+import statistics
+import sys
+import tempfile
+import tracemalloc
+from copy import deepcopy
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+from bench.stages import DISTORTIONS, find_templates  # noqa: E402
+from bench.synthetic import generate_sheets  # noqa: E402
+from src.core import ImageInstanceOps  # noqa: E402
+from src.defaults import CONFIG_DEFAULTS  # noqa: E402
+from src.entry import load_directory_setup  # noqa: E402
+from src.utils.decode import decode_image  # noqa: E402
+from src.utils.scanner import scan_directory  # noqa: E402
+
+
+class AllocationCounter:
+    """Counts the rises of the traced memory of at least min_size bytes between
+    two bytecodes of the Python frames run under it"""
+
+    def __init__(self, min_size):
+        self.min_size = min_size
+        self.count, self.size = 0, 0
+        self.last_size = 0
+
+    def check(self, frame, event, arg):
+        size = tracemalloc.get_traced_memory()[0]
+        if size - self.last_size >= self.min_size:
+            self.count += 1
+            self.size += size - self.last_size
+        self.last_size = size
+        return self.check
+
+    def trace_frame(self, frame, event, arg):
+        frame.f_trace_opcodes = True
+        return self.check(frame, event, arg)
+
+    def run(self, function, *args, **kwargs):
+        tracemalloc.start()
+        self.last_size = tracemalloc.get_traced_memory()[0]
+        sys.settrace(self.trace_frame)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            sys.settrace(None)
+            tracemalloc.stop()
+
+
+def load_setup(input_dir, auto_align):
+    template, tuning_config, _, _ = load_directory_setup(
+        input_dir,
+        scan_directory(input_dir),
+        {"setLayout": False},
+        None,
+        CONFIG_DEFAULTS,
+        None,
+    )
+    tuning_config = deepcopy(tuning_config)
+    tuning_config.alignment_params.auto_align = auto_align
+    # a plain run: no debug images, no windows, no annotated image
+    tuning_config.outputs.show_image_level = 0
+    tuning_config.outputs.save_image_level = 0
+    template.image_instance_ops = ImageInstanceOps(tuning_config)
+    return template, tuning_config
+
+
+def benchmark_template(template_path, sheets, auto_align, min_size, seed):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_dir = Path(temp_dir)
+        generate_sheets(
+            template_path, input_dir, sheets + 1, seed=seed, distortions=DISTORTIONS
+        )
+        template, tuning_config = load_setup(input_dir, auto_align)
+        image_instance_ops = template.image_instance_ops
+        counts, sizes = [], []
+        for index in range(sheets + 1):
+            file_path = input_dir.joinpath(f"sheet_{index:05d}.jpg")
+            image = decode_image(file_path, tuning_config)
+            image = image_instance_ops.apply_preprocessors(file_path, image, template)
+            if image is None:
+                continue
+            counter = AllocationCounter(min_size)
+            with contextlib.redirect_stdout(io.StringIO()):
+                counter.run(
+                    image_instance_ops.read_omr_response,
+                    template,
+                    image,
+                    file_path.name,
+                )
+            if index > 0:
+                counts.append(counter.count)
+                sizes.append(counter.size)
+    if not counts:
+        return None
+    return {
+        "sheets": len(counts),
+        "allocations": statistics.mean(counts),
+        "mb": statistics.mean(sizes) / 2**20,
+    }
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--sheets", type=int, default=5, help="Per template")
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument(
+        "--templates",
+        nargs="*",
+        default=None,
+        help="Sample names (globs allowed) or paths to other template.json files",
+    )
+    argparser.add_argument(
+        "--minKB",
+        dest="min_kb",
+        type=float,
+        default=64,
+        help="Smaller allocations are not counted",
+    )
+    align_group = argparser.add_mutually_exclusive_group()
+    align_group.add_argument(
+        "--autoAlign", dest="auto_align", action="store_const", const=[True]
+    )
+    align_group.add_argument(
+        "--noAutoAlign", dest="auto_align", action="store_const", const=[False]
+    )
+    args = argparser.parse_args()
+    # per-sheet logs would flood the report
+    logging.disable(logging.INFO)
+
+    for template_path in find_templates(args.templates):
+        template_name = template_path.parent.name
+        for auto_align in args.auto_align or [False, True]:
+            result = benchmark_template(
+                template_path,
+                args.sheets,
+                auto_align,
+                int(args.min_kb * 1024),
+                args.seed,
+            )
+            mode = "auto_align" if auto_align else "plain"
+            if result is None:
+                print(f"{template_name} ({mode}): no sheet was preprocessed")
+                continue
+            print(
+                f"{template_name: <24} {mode: <10} "
+                f"{result['allocations']:6.1f} allocations/sheet "
+                f"{result['mb']:8.2f} MB/sheet"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Load test of the API: concurrent ZIP uploads to /v1/omr-jobs.
+
+A ZIP of synthetic sheets (see bench/synthetic.py) is built once per
+registered template, then --requests uploads are sent, at most --concurrency
+at a time. With --rate the uploads arrive as a Poisson process of that many
+requests per second, otherwise each finished upload starts the next one.
+Reports throughput, latency percentiles, errors and the RSS of the server.
+
+The target is the app in this process (default, through httpx's ASGI
+transport), a local uvicorn started here with --uvicorn N workers, or a
+running server given with --url. Jobs are written to a temporary
+OMR_JOB_STORAGE_DIR unless one is set, the OMR_API_TOKEN of the environment
+is sent as bearer token.
+
+Usage: python bench/api_load.py [--requests 20] [--concurrency 4] [--images 50]
+       python bench/api_load.py --uvicorn 4 --concurrency 20 --rate 2 [--json o.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+from api.template_registry import TemplateRegistry  # noqa: E402
+from bench.synthetic import generate_sheets  # noqa: E402
+from src.utils.instrumentation import percentile  # noqa: E402
+
+JOBS_PATH = "/v1/omr-jobs"
+RSS_SAMPLE_INTERVAL = 0.5
+SERVER_START_TIMEOUT = 60
+
+
+def build_zips(template_ids, images, seed):
+    """template id -> bytes of a ZIP with `images` synthetic sheets"""
+    registry = TemplateRegistry(ROOT_DIR.joinpath("samples"))
+    registered = {
+        template.manifest.id: template
+        for template in registry.list_templates()
+        if template.manifest.is_active
+    }
+    zips = {}
+    for template_id in template_ids or sorted(registered):
+        if template_id not in registered:
+            raise Exception(f"Template '{template_id}' is not registered or inactive")
+        template = registered[template_id]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            generate_sheets(
+                template.template_dir.joinpath("template.json"),
+                temp_dir,
+                images,
+                seed=seed,
+            )
+            buffer = io.BytesIO()
+            # JPEGs do not compress any further
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zip_file:
+                for image_path in sorted(Path(temp_dir).glob("sheet_*.jpg")):
+                    zip_file.write(image_path, image_path.name)
+        zips[template_id] = buffer.getvalue()
+    return zips
+
+
+def read_rss(pid):
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return 0
+
+
+def get_child_pids(pid):
+    child_pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # the command name in parentheses may contain spaces
+                parent_pid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (FileNotFoundError, ProcessLookupError, IndexError, ValueError):
+            continue
+        if parent_pid == pid:
+            child_pids.append(int(entry))
+    return child_pids
+
+
+def read_tree_rss(pid):
+    """RSS of a process and its descendants (uvicorn workers), Linux only"""
+    if not os.path.isdir("/proc"):
+        return None
+    pids, total = [pid], 0
+    while pids:
+        current_pid = pids.pop()
+        total += read_rss(current_pid)
+        pids.extend(get_child_pids(current_pid))
+    return total
+
+
+async def sample_rss(pid, samples, stop_event):
+    while not stop_event.is_set():
+        rss = read_tree_rss(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop_event.wait(), RSS_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def send_job(client, template_id, zip_content, headers):
+    start = time.perf_counter()
+    try:
+        response = await client.post(
+            JOBS_PATH,
+            files={"file": (f"{template_id}.zip", zip_content, "application/zip")},
+            data={"template_id": template_id, "source_type": "load_test"},
+            headers=headers,
+        )
+    except httpx.HTTPError as error:
+        return {
+            "template_id": template_id,
+            "latency": time.perf_counter() - start,
+            "status_code": None,
+            "error": repr(error),
+        }
+    result = {
+        "template_id": template_id,
+        "latency": time.perf_counter() - start,
+        "status_code": response.status_code,
+    }
+    if response.status_code == 200:
+        job = response.json()
+        result["job_status"] = job.get("status")
+        result["sheets"] = job.get("summary", {}).get("total", 0)
+    else:
+        result["error"] = response.text[:200]
+    return result
+
+
+async def run_load(client, zips, requests, concurrency, rate, seed, server_pid):
+    headers = {}
+    api_token = os.environ.get("OMR_API_TOKEN", "").strip()
+    if api_token:
+        headers["Authorization"] = f"Bearer {api_token}"
+    rng = random.Random(seed)
+    template_ids = sorted(zips)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited_send(template_id):
+        async with semaphore:
+            return await send_job(client, template_id, zips[template_id], headers)
+
+    rss_samples, stop_event = [], asyncio.Event()
+    rss_task = None
+    if server_pid is not None:
+        rss_task = asyncio.create_task(sample_rss(server_pid, rss_samples, stop_event))
+    start = time.perf_counter()
+    tasks = []
+    for index in range(requests):
+        if rate and index > 0:
+            await asyncio.sleep(rng.expovariate(rate))
+        template_id = template_ids[index % len(template_ids)]
+        tasks.append(asyncio.create_task(limited_send(template_id)))
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop_event.set()
+    if rss_task is not None:
+        await rss_task
+    return results, elapsed, rss_samples
+
+
+def summarize(results, elapsed, rss_samples):
+    latencies = sorted(result["latency"] for result in results)
+    http_errors = [result for result in results if result["status_code"] != 200]
+    failed_jobs = [
+        result
+        for result in results
+        if result["status_code"] == 200 and result.get("job_status") != "completed"
+    ]
+    sheets = sum(result.get("sheets", 0) for result in results)
+    latency = {f"p{q}": round(percentile(latencies, q), 3) for q in [50, 95, 99]}
+    latency["max"] = round(latencies[-1], 3)
+    error_count = len(http_errors) + len(failed_jobs)
+    return {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(len(results) / elapsed, 3),
+        "sheets_per_second": round(sheets / elapsed, 3),
+        "latency_s": latency,
+        "http_errors": len(http_errors),
+        "failed_jobs": len(failed_jobs),
+        "error_rate": round(error_count / len(results), 4),
+        "error_samples": sorted({result["error"] for result in http_errors})[:5],
+        "server_rss_mb": {
+            "start": round(rss_samples[0] / 2**20, 1) if rss_samples else None,
+            "peak": round(max(rss_samples) / 2**20, 1) if rss_samples else None,
+            "end": round(rss_samples[-1] / 2**20, 1) if rss_samples else None,
+        },
+    }
+
+
+def start_uvicorn(workers, port):
+    command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "api.main:app",
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(port),
+        "--workers",
+        str(workers),
+        "--log-level",
+        "warning",
+    ]
+    server = subprocess.Popen(command, cwd=ROOT_DIR, env=dict(os.environ))
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise Exception(f"uvicorn exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{base_url}/healthz", timeout=1).status_code == 200:
+                return server, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise Exception(f"uvicorn did not answer on {base_url} in {SERVER_START_TIMEOUT}s")
+
+
+async def run_target(args, zips):
+    timeout = httpx.Timeout(args.timeout)
+    load_args = (zips, args.requests, args.concurrency, args.rate, args.seed)
+    if args.url:
+        # a server of its own, its memory is not ours to measure
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            return await run_load(client, *load_args, server_pid=None)
+    if args.uvicorn:
+        server, base_url = start_uvicorn(args.uvicorn, args.port)
+        try:
+            async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+                return await run_load(client, *load_args, server_pid=server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+    from api.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    # the per-job logs and timing tables of the app would mix with the report
+    logging.disable(logging.INFO)
+    with contextlib.redirect_stdout(io.StringIO()):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://in-process", timeout=timeout
+        ) as client:
+            return await run_load(client, *load_args, server_pid=os.getpid())
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--requests", type=int, default=20)
+    argparser.add_argument("--concurrency", type=int, default=4)
+    argparser.add_argument(
+        "--rate", type=float, default=None, help="Mean arrivals per second"
+    )
+    argparser.add_argument("--images", type=int, default=50, help="Sheets per ZIP")
+    argparser.add_argument(
+        "--templates",
+        nargs="*",
+        default=None,
+        help="Template ids, all active ones by default",
+    )
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument(
+        "--uvicorn", type=int, default=0, help="Start a local uvicorn with N workers"
+    )
+    argparser.add_argument("--port", type=int, default=8765)
+    argparser.add_argument("--url", default=None, help="Base url of a running server")
+    argparser.add_argument("--timeout", type=float, default=600, help="Per request")
+    argparser.add_argument("--json", dest="json_path", default=None)
+    args = argparser.parse_args()
+
+    os.environ.setdefault("OMR_HEADLESS", "1")
+    # the registry looks for samples/ in the working directory
+    os.chdir(ROOT_DIR)
+    with tempfile.TemporaryDirectory() as jobs_dir:
+        os.environ.setdefault("OMR_JOB_STORAGE_DIR", jobs_dir)
+        zips = build_zips(args.templates, args.images, args.seed)
+        print(
+            f"built {len(zips)} ZIP(s) of {args.images} sheets, "
+            f"{sum(map(len, zips.values())) / len(zips) / 2**20:.1f} MB each on average"
+        )
+        results, elapsed, rss_samples = asyncio.run(run_target(args, zips))
+
+    summary = summarize(results, elapsed, rss_samples)
+    summary["target"] = args.url or (
+        f"uvicorn --workers {args.uvicorn}" if args.uvicorn else "in-process"
+    )
+    summary["concurrency"], summary["rate"] = args.concurrency, args.rate
+    print(json.dumps(summary, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Stage benchmark of the processing pipeline, per template.
+
+For every template in samples/ (or the ones given with --templates) a batch of
+synthetic sheets is generated (see bench/synthetic.py) with an answer key, and
+processed --repeats times in this interpreter. The stages recorded by
+STAGE_TIMINGS are reported: decode, each pre-processor step, the sub-stages of
+read_omr_response, evaluation and csv writing, plus end-to-end sheets/second.
+Each stage keeps its fastest median over the repeats.
+
+--save writes the results as a json baseline, --compare checks them against
+one and exits with 1 when a stage got slower (or the throughput lower) than
+--tolerance allows. Stages timed fewer than --minSamples times (sheets x
+repeats for the throughput) on either side are noise and left out.
+
+Usage: python bench/stages.py [--sheets 20] [--repeats 3] [--save baseline.json]
+       python bench/stages.py --compare baseline.json [--tolerance 0.15]
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import cv2
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+from bench.synthetic import generate_sheets  # noqa: E402
+from src.entry import entry_point  # noqa: E402
+from src.utils.instrumentation import STAGE_TIMINGS  # noqa: E402
+
+# the mild defaults of bench/synthetic.py, fixed so that baselines stay comparable
+DISTORTIONS = {
+    "scale": 0.01,
+    "rotation": 1.5,
+    "perspective": 0.002,
+    "blur": 1.0,
+    "noise": 6.0,
+    "lighting": 0.2,
+}
+THROUGHPUT = "sheets_per_second"
+
+
+def write_answer_key(input_dir):
+    """An evaluation.json that marks the responses of the first sheet correct"""
+    with open(input_dir.joinpath("sheet_00000.json"), "r") as f:
+        expected = json.load(f)["concatenated"]
+    questions = [column for column, value in expected.items() if value != ""]
+    evaluation = {
+        "source_type": "custom",
+        "options": {
+            "questions_in_order": questions,
+            "answers_in_order": [expected[question] for question in questions],
+        },
+        "marking_schemes": {
+            "DEFAULT": {"correct": "1", "incorrect": "0", "unmarked": "0"}
+        },
+    }
+    with open(input_dir.joinpath("evaluation.json"), "w") as f:
+        json.dump(evaluation, f, indent=2)
+
+
+def run_once(input_dir, output_dir, workers):
+    durations = defaultdict(list)
+
+    def listener(stage, start, end, failed):
+        durations[stage].append(end - start)
+
+    args = {
+        "input_paths": [str(input_dir)],
+        "output_dir": str(output_dir),
+        "debug": False,
+        "autoAlign": False,
+        "setLayout": False,
+        "workers": workers,
+    }
+    STAGE_TIMINGS.add_listener(listener)
+    try:
+        # the per-sheet logs and tables would be timed along
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            entry_point(input_dir, args)
+            elapsed = time.perf_counter() - start
+    finally:
+        STAGE_TIMINGS.remove_listener(listener)
+    return durations, elapsed
+
+
+def benchmark_template(template_path, sheets, repeats, workers, seed):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_dir = Path(temp_dir, "input")
+        generate_sheets(
+            template_path, input_dir, sheets, seed=seed, distortions=DISTORTIONS
+        )
+        if not input_dir.joinpath("evaluation.json").exists():
+            write_answer_key(input_dir)
+        runs = [
+            run_once(input_dir, Path(temp_dir, f"outputs-{repeat}"), workers)
+            for repeat in range(repeats)
+        ]
+
+    stages = {}
+    for stage in sorted({stage for durations, _ in runs for stage in durations}):
+        medians = [
+            statistics.median(durations[stage])
+            for durations, _ in runs
+            if durations[stage]
+        ]
+        stages[stage] = {
+            "count": len(runs[-1][0][stage]),
+            "p50_ms": round(min(medians) * 1000, 3),
+        }
+    return {
+        THROUGHPUT: round(max(sheets / elapsed for _, elapsed in runs), 3),
+        "stages": stages,
+    }
+
+
+def count_samples(results, stats):
+    return stats["count"] * results.get("repeats", 1)
+
+
+def compare_results(results, baseline, tolerance, min_delta_ms, min_samples):
+    """Returns (template, metric, baseline value, value) of every regression and
+    the number of metrics left out for having fewer than min_samples samples,
+    on either side"""
+    regressions, skipped = [], 0
+    for template_name, result in results["templates"].items():
+        base_result = baseline["templates"].get(template_name)
+        if base_result is None:
+            continue
+        sheet_samples = min(
+            results["sheets"] * results["repeats"],
+            baseline["sheets"] * baseline.get("repeats", 1),
+        )
+        if sheet_samples < min_samples:
+            skipped += 1
+        elif result[THROUGHPUT] < base_result[THROUGHPUT] * (1 - tolerance):
+            regressions.append(
+                (template_name, THROUGHPUT, base_result[THROUGHPUT], result[THROUGHPUT])
+            )
+        for stage, stats in result["stages"].items():
+            base_stats = base_result["stages"].get(stage)
+            if base_stats is None:
+                continue
+            if (
+                min(
+                    count_samples(results, stats),
+                    count_samples(baseline, base_stats),
+                )
+                < min_samples
+            ):
+                skipped += 1
+                continue
+            value, base_value = stats["p50_ms"], base_stats["p50_ms"]
+            if (
+                value > base_value * (1 + tolerance)
+                and value - base_value > min_delta_ms
+            ):
+                regressions.append((template_name, stage, base_value, value))
+    return regressions, skipped
+
+
+def print_result(template_name, result, base_result=None):
+    base_stages = (base_result or {}).get("stages", {})
+    print(f"{template_name}: {result[THROUGHPUT]:.2f} sheets/s", end="")
+    if base_result:
+        print(f" (baseline {base_result[THROUGHPUT]:.2f})", end="")
+    print()
+    for stage, stats in result["stages"].items():
+        line = f"  {stage: <34} p50 {stats['p50_ms']:9.3f} ms"
+        if stage in base_stages and base_stages[stage]["p50_ms"] > 0:
+            base_value = base_stages[stage]["p50_ms"]
+            change = (stats["p50_ms"] - base_value) / base_value
+            line += f"  baseline {base_value:9.3f} ms  {change:+7.1%}"
+        print(line)
+
+
+def find_templates(patterns):
+    template_paths = sorted(ROOT_DIR.joinpath("samples").glob("*/template.json"))
+    if patterns:
+        template_paths = [
+            path
+            for path in template_paths
+            if any(path.parent.match(pattern) for pattern in patterns)
+        ] + [Path(pattern) for pattern in patterns if pattern.endswith(".json")]
+    return template_paths
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--sheets", type=int, default=20, help="Per template")
+    argparser.add_argument("--repeats", type=int, default=3)
+    argparser.add_argument("--workers", type=int, default=1)
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument(
+        "--templates",
+        nargs="*",
+        default=None,
+        help="Sample names (globs allowed) or paths to other template.json files",
+    )
+    argparser.add_argument("--save", dest="save_path", default=None)
+    argparser.add_argument("--compare", dest="baseline_path", default=None)
+    argparser.add_argument(
+        "--tolerance", type=float, default=0.15, help="Allowed slowdown, 0.15 = 15%%"
+    )
+    argparser.add_argument(
+        "--minDelta",
+        dest="min_delta_ms",
+        type=float,
+        default=0.5,
+        help="Stage slowdowns below this many ms are noise",
+    )
+    argparser.add_argument(
+        "--minSamples",
+        dest="min_samples",
+        type=int,
+        default=20,
+        help="Stages timed fewer times (count x repeats) are not compared",
+    )
+    args = argparser.parse_args()
+    # per-sheet logs would flood the report
+    logging.disable(logging.INFO)
+
+    baseline = None
+    if args.baseline_path:
+        with open(args.baseline_path, "r") as f:
+            baseline = json.load(f)
+
+    results = {
+        "sheets": args.sheets,
+        "repeats": args.repeats,
+        "workers": args.workers,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "templates": {},
+    }
+    for template_path in find_templates(args.templates):
+        template_name = template_path.parent.name
+        result = benchmark_template(
+            template_path, args.sheets, args.repeats, args.workers, args.seed
+        )
+        results["templates"][template_name] = result
+        base_result = baseline["templates"].get(template_name) if baseline else None
+        print_result(template_name, result, base_result)
+
+    if args.save_path:
+        with open(args.save_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        regressions, skipped = compare_results(
+            results, baseline, args.tolerance, args.min_delta_ms, args.min_samples
+        )
+        if skipped:
+            print(
+                f"{skipped} metrics with fewer than {args.min_samples} samples"
+                " were not compared, raise --sheets or --repeats"
+            )
+        for template_name, metric, base_value, value in regressions:
+            print(f"REGRESSION {template_name} {metric}: {base_value} -> {value}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup time benchmark for the CLI and the API worker.
+
+Each command is run in a fresh interpreter (like a cold start or a worker
+fork) and the median wall time is reported, along with the heavy modules that
+ended up imported.
+
+Usage: python bench/startup.py [--runs 10] [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+HEAVY_MODULES = ["cv2", "matplotlib", "pandas", "screeninfo"]
+
+COMMANDS = {
+    "import api.main": [
+        sys.executable,
+        "-c",
+        "import sys, api.main; "
+        f"print('heavy:', *(m for m in {HEAVY_MODULES!r} if m in sys.modules))",
+    ],
+    "main.py --help": [sys.executable, "main.py", "--help"],
+}
+
+
+def time_command(command, runs, root_dir):
+    env = dict(os.environ, OMR_HEADLESS="1")
+    durations, output = [], ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            command, cwd=root_dir, env=env, capture_output=True, text=True, check=True
+        )
+        durations.append(time.perf_counter() - start)
+        output = completed.stdout
+    return durations, output
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--runs", type=int, default=10)
+    argparser.add_argument("--json", dest="json_path", default=None)
+    argparser.add_argument(
+        "--root", default=ROOT_DIR, help="Checkout to measure, e.g. to compare revisions"
+    )
+    args = argparser.parse_args()
+
+    results = {}
+    for name, command in COMMANDS.items():
+        durations, output = time_command(command, args.runs, args.root)
+        results[name] = {
+            "runs": args.runs,
+            "median_s": round(statistics.median(durations), 4),
+            "min_s": round(min(durations), 4),
+            "max_s": round(max(durations), 4),
+        }
+        if name == "import api.main":
+            heavy_line = [line for line in output.splitlines() if line.startswith("heavy:")]
+            results[name]["heavy_modules"] = heavy_line[-1].split()[1:]
+        print(
+            f"{name: <18} median {results[name]['median_s']:.3f}s "
+            f"(min {results[name]['min_s']:.3f}s, max {results[name]['max_s']:.3f}s)"
+        )
+    print(f"heavy modules after 'import api.main': {results['import api.main']['heavy_modules']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Synthetic OMR sheets with known answers, for accuracy and load benchmarks.
+
+Reads a template.json (and the config.json next to it), marks random or given
+responses in its bubbles and writes sheet_NNNNN.jpg with a sheet_NNNNN.json
+holding the expected responses. The template's json files and reference
+images are copied along, so the output directory can be processed as is.
+
+Templates aligned with FeatureBasedAlignment are drawn on their reference
+image, other templates on a blank page with the bubble outlines. Every sheet
+gets its own random scale, rotation, perspective, lighting gradient, blur and
+noise, drawn from (seed, sheet index): the same seed gives the same sheets,
+whatever --count and --workers are.
+
+Usage: python bench/synthetic.py -t samples/somos-1/template.json -o out [--count 100]
+       python bench/synthetic.py --score out-results/Results/Results_01PM.csv
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.defaults import CONFIG_DEFAULTS  # noqa: E402
+from src.processors.FeatureBasedAlignment import FeatureBasedAlignment  # noqa: E402
+from src.template import Template  # noqa: E402
+from src.utils.parsing import get_concatenated_response  # noqa: E402
+from src.utils.parsing import open_config_with_defaults  # noqa: E402
+
+SETUP_FILE_NAMES = ["template.json", "config.json", "evaluation.json"]
+# background around pages that get cropped with CropPage, of the page size
+CROP_PAGE_MARGIN = 0.08
+
+
+class SheetGenerator:
+    def __init__(
+        self,
+        template_path,
+        seed=0,
+        empty_rate=0.05,
+        multi_rate=0.0,
+        responses=None,
+        distortions=None,
+    ):
+        template_path = Path(template_path)
+        config_path = template_path.parent.joinpath("config.json")
+        tuning_config = (
+            open_config_with_defaults(config_path)
+            if config_path.exists()
+            else CONFIG_DEFAULTS
+        )
+        self.template = Template(template_path, tuning_config)
+        self.seed = seed
+        self.empty_rate = empty_rate
+        self.multi_rate = multi_rate
+        self.responses = responses or {}
+        self.distortions = distortions or {}
+        self.canvas = self.get_blank_canvas()
+        page_width, page_height = self.template.page_dimensions
+        canvas_height, canvas_width = self.canvas.shape
+        self.scale_x = canvas_width / page_width
+        self.scale_y = canvas_height / page_height
+        pre_processor_names = [
+            pre_processor.__class__.__name__
+            for pre_processor in self.template.pre_processors
+        ]
+        # CropPage looks for the page edges, give it some dark background
+        self.margin = CROP_PAGE_MARGIN if "CropPage" in pre_processor_names else 0
+        self.border_value = 40 if self.margin else 255
+
+    def get_blank_canvas(self):
+        for pre_processor in self.template.pre_processors:
+            if isinstance(pre_processor, FeatureBasedAlignment):
+                return pre_processor.ref_img.copy()
+        page_width, page_height = self.template.page_dimensions
+        canvas = np.full((page_height, page_width), 255, dtype=np.uint8)
+        for field_block in self.template.field_blocks:
+            box_w, box_h = field_block.bubble_dimensions
+            for field_block_bubbles in field_block.traverse_bubbles:
+                for bubble in field_block_bubbles:
+                    center = (bubble.x + box_w // 2, bubble.y + box_h // 2)
+                    cv2.ellipse(
+                        canvas, center, (box_w // 2, box_h // 2), 0, 0, 360, 90, 1
+                    )
+        return canvas
+
+    def choose_values(self, rng, field_label, bubble_values):
+        if field_label in self.responses:
+            value = self.responses[field_label]
+            if isinstance(value, list):
+                return [v for v in bubble_values if v in value]
+            if value in bubble_values:
+                return [value]
+            return [v for v in bubble_values if v in value]
+        if rng.random() < self.empty_rate:
+            return []
+        marks = 2 if rng.random() < self.multi_rate else 1
+        chosen = set(rng.choice(len(bubble_values), size=marks, replace=False))
+        return [v for i, v in enumerate(bubble_values) if i in chosen]
+
+    def mark_responses(self, rng, image):
+        omr_response, multi_marked = {}, False
+        for field_block in self.template.field_blocks:
+            box_w, box_h = field_block.bubble_dimensions
+            for field_block_bubbles in field_block.traverse_bubbles:
+                field_label = field_block_bubbles[0].field_label
+                bubble_values = [bubble.field_value for bubble in field_block_bubbles]
+                marked_values = self.choose_values(rng, field_label, bubble_values)
+                for bubble in field_block_bubbles:
+                    if bubble.field_value not in marked_values:
+                        continue
+                    # a pen fill: off-center, not quite round, not quite black
+                    fill = rng.uniform(0.75, 0.95)
+                    center_x = bubble.x + box_w / 2 + rng.uniform(-1, 1)
+                    center_y = bubble.y + box_h / 2 + rng.uniform(-1, 1)
+                    center = (
+                        round(center_x * self.scale_x),
+                        round(center_y * self.scale_y),
+                    )
+                    axes = (
+                        round(box_w * fill * self.scale_x / 2),
+                        round(box_h * fill * self.scale_y / 2),
+                    )
+                    color = int(rng.integers(15, 70))
+                    angle = rng.uniform(0, 180)
+                    cv2.ellipse(image, center, axes, angle, 0, 360, color, -1)
+                multi_marked |= len(marked_values) > 1
+                omr_response[field_label] = (
+                    "".join(marked_values) if marked_values else field_block.empty_val
+                )
+        return omr_response, multi_marked
+
+    def distort(self, rng, image):
+        distortions = self.distortions
+        height, width = image.shape
+        applied = {
+            "scale": 1 + rng.uniform(-1, 1) * distortions.get("scale", 0),
+            "rotation": rng.uniform(-1, 1) * distortions.get("rotation", 0),
+            "blur": rng.uniform(0, distortions.get("blur", 0)),
+            "noise": rng.uniform(0, distortions.get("noise", 0)),
+            "lighting": rng.uniform(0, distortions.get("lighting", 0)),
+        }
+        # scale and rotation about the center, then independent corner shifts
+        out_width = round(width * (1 + 2 * self.margin))
+        out_height = round(height * (1 + 2 * self.margin))
+        corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        rotation = cv2.getRotationMatrix2D(
+            (width / 2, height / 2), applied["rotation"], applied["scale"]
+        )
+        moved = cv2.transform(corners[None], rotation)[0]
+        moved += np.float32([(out_width - width) / 2, (out_height - height) / 2])
+        jitter = distortions.get("perspective", 0) * max(width, height)
+        moved += rng.uniform(-jitter, jitter, size=(4, 2)).astype(np.float32)
+        transform = cv2.getPerspectiveTransform(corners, moved)
+        image = cv2.warpPerspective(
+            image,
+            transform,
+            (out_width, out_height),
+            flags=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=self.border_value,
+        )
+
+        image = image.astype(np.float32)
+        if applied["lighting"] > 0:
+            # a linear shade across the sheet in a random direction
+            angle = rng.uniform(0, 2 * np.pi)
+            xs = np.linspace(-0.5, 0.5, out_width, dtype=np.float32)
+            ys = np.linspace(-0.5, 0.5, out_height, dtype=np.float32)
+            gradient = np.cos(angle) * xs[None, :] + np.sin(angle) * ys[:, None]
+            image *= 1 - applied["lighting"] * (gradient + 0.5)
+        if applied["blur"] > 0.3:
+            image = cv2.GaussianBlur(image, (0, 0), applied["blur"])
+        if applied["noise"] > 0:
+            image += rng.normal(0, applied["noise"], size=image.shape).astype(
+                np.float32
+            )
+        image = np.clip(image, 0, 255).astype(np.uint8)
+        return image, {key: round(float(value), 4) for key, value in applied.items()}
+
+    def generate(self, index):
+        rng = np.random.default_rng([self.seed, index])
+        image = self.canvas.copy()
+        omr_response, multi_marked = self.mark_responses(rng, image)
+        image, applied = self.distort(rng, image)
+        concatenated = get_concatenated_response(omr_response, self.template)
+        ground_truth = {
+            "seed": self.seed,
+            "index": index,
+            "response": omr_response,
+            # in the column order of the Results csv
+            "concatenated": {
+                column: concatenated[column] for column in self.template.output_columns
+            },
+            "multi_marked": multi_marked,
+            "distortions": applied,
+        }
+        return image, ground_truth
+
+
+def get_setup_files(template_path, template):
+    setup_files = [
+        template_path.parent.joinpath(file_name) for file_name in SETUP_FILE_NAMES
+    ]
+    for pre_processor in template.pre_processors:
+        setup_files.extend(Path(path) for path in pre_processor.exclude_files())
+    return [path for path in setup_files if path.exists()]
+
+
+def write_sheets(generator, output_dir, indices, quality=90):
+    for index in indices:
+        image, ground_truth = generator.generate(index)
+        name = f"sheet_{index:05d}"
+        cv2.imwrite(
+            str(output_dir.joinpath(f"{name}.jpg")),
+            image,
+            [cv2.IMWRITE_JPEG_QUALITY, quality],
+        )
+        with open(output_dir.joinpath(f"{name}.json"), "w") as f:
+            json.dump(ground_truth, f, indent=2)
+    return len(indices)
+
+
+def write_sheets_in_worker(generator_kwargs, output_dir, indices, quality):
+    generator = SheetGenerator(**generator_kwargs)
+    return write_sheets(generator, output_dir, indices, quality)
+
+
+def generate_sheets(
+    template_path, output_dir, count, start=0, workers=1, quality=90, **generator_kwargs
+):
+    template_path, output_dir = Path(template_path), Path(output_dir)
+    generator_kwargs["template_path"] = template_path
+    generator = SheetGenerator(**generator_kwargs)
+    os.makedirs(output_dir, exist_ok=True)
+    for setup_file in get_setup_files(template_path, generator.template):
+        shutil.copy2(setup_file, output_dir.joinpath(setup_file.name))
+
+    indices = list(range(start, start + count))
+    if workers <= 1:
+        return write_sheets(generator, output_dir, indices, quality)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                write_sheets_in_worker,
+                generator_kwargs,
+                output_dir,
+                indices[worker::workers],
+                quality,
+            )
+            for worker in range(workers)
+        ]
+        return sum(future.result() for future in futures)
+
+
+def score_results(results_csv):
+    """Compares a Results csv of generated sheets with their ground truth"""
+    fields = correct_fields = sheets = correct_sheets = 0
+    with open(results_csv, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        columns = header[4:]
+        for row in reader:
+            truth_path = Path(row[1]).with_suffix(".json")
+            if not truth_path.exists():
+                continue
+            with open(truth_path, "r") as truth_file:
+                expected = json.load(truth_file)["concatenated"]
+            matches = [
+                read == expected[column]
+                for column, read in zip(columns, row[4:])
+                if column in expected
+            ]
+            fields += len(matches)
+            correct_fields += sum(matches)
+            sheets += 1
+            correct_sheets += all(matches)
+    return {
+        "sheets": sheets,
+        "sheet_accuracy": round(correct_sheets / sheets, 4) if sheets else None,
+        "fields": fields,
+        "field_accuracy": round(correct_fields / fields, 4) if fields else None,
+    }
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("-t", "--template", dest="template_path")
+    argparser.add_argument("-o", "--out", dest="output_dir", default="synthetic")
+    argparser.add_argument("--count", type=int, default=100)
+    argparser.add_argument("--start", type=int, default=0, help="First sheet index")
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--workers", type=int, default=1)
+    argparser.add_argument("--quality", type=int, default=90, help="JPEG quality")
+    argparser.add_argument("--emptyRate", dest="empty_rate", type=float, default=0.05)
+    argparser.add_argument("--multiRate", dest="multi_rate", type=float, default=0.0)
+    argparser.add_argument(
+        "--responses",
+        dest="responses_path",
+        default=None,
+        help="Json of field label -> value(s) to mark on all sheets, others are random",
+    )
+    argparser.add_argument("--scale", type=float, default=0.01)
+    argparser.add_argument("--rotation", type=float, default=1.5, help="Degrees")
+    argparser.add_argument(
+        "--perspective", type=float, default=0.002, help="Corner shift, of page size"
+    )
+    argparser.add_argument("--blur", type=float, default=1.0, help="Max sigma")
+    argparser.add_argument("--noise", type=float, default=6.0, help="Max std-dev")
+    argparser.add_argument(
+        "--lighting", type=float, default=0.2, help="Max darkening across the sheet"
+    )
+    argparser.add_argument(
+        "--score",
+        dest="results_csv",
+        default=None,
+        help="Results csv of processed sheets to score against their ground truth",
+    )
+    args = argparser.parse_args()
+
+    if args.results_csv:
+        print(json.dumps(score_results(args.results_csv), indent=2))
+        return
+    if not args.template_path:
+        argparser.error("one of --template or --score is required")
+
+    responses = None
+    if args.responses_path:
+        with open(args.responses_path, "r") as f:
+            responses = json.load(f)
+    written = generate_sheets(
+        args.template_path,
+        args.output_dir,
+        args.count,
+        start=args.start,
+        workers=args.workers,
+        quality=args.quality,
+        seed=args.seed,
+        empty_rate=args.empty_rate,
+        multi_rate=args.multi_rate,
+        responses=responses,
+        distortions={
+            "scale": args.scale,
+            "rotation": args.rotation,
+            "perspective": args.perspective,
+            "blur": args.blur,
+            "noise": args.noise,
+            "lighting": args.lighting,
+        },
+    )
+    print(f"wrote {written} sheet(s) to '{args.output_dir}'")
+
+
+if __name__ == "__main__":
+    main()
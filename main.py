@@ -11,11 +11,11 @@ import argparse
 import sys
 from pathlib import Path
 
-from src.entry import entry_point
 from src.logger import logger
+from src.utils.shards import parse_shard
 
 
-def parse_args():
+def parse_args(argv=None):
     # construct the argument parse and parse the arguments
     argparser = argparse.ArgumentParser()
 
@@ -69,13 +69,146 @@ def parse_args():
         run again until the template is set.",
     )
 
+    argparser.add_argument(
+        "-w",
+        "--workers",
+        required=False,
+        dest="workers",
+        type=int,
+        help="Number of threads that preprocess and read sheets in parallel \
+        (0 reads on the main thread). Reduced to 1 when debug images are saved or auto alignment is on.",
+    )
+
+    argparser.add_argument(
+        "-q",
+        "--queueSize",
+        required=False,
+        dest="queue_size",
+        type=int,
+        help="How many decoded and processed sheets may wait between the pipeline \
+        stages, bounds the memory used.",
+    )
+
+    argparser.add_argument(
+        "--dirWorkers",
+        required=False,
+        dest="dir_workers",
+        type=int,
+        default=1,
+        help="Number of processes that handle different input sub-directories \
+        at the same time, largest directories first (default 1: one after the other).",
+    )
+
+    argparser.add_argument(
+        "-t",
+        "--timings",
+        required=False,
+        dest="timings",
+        action="store_true",
+        help="Records per-stage timings (pre-processors and bubble reading), \
+        prints them with the stats and saves them as JSON next to the Results CSV.",
+    )
+
+    argparser.add_argument(
+        "-r",
+        "--resume",
+        required=False,
+        dest="resume",
+        action="store_true",
+        help="Skips the images that are unchanged since they were last processed \
+        into the output directory, and replaces their old csv rows when they changed.",
+    )
+
+    argparser.add_argument(
+        "--watch",
+        required=False,
+        dest="watch",
+        action="store_true",
+        help="Keeps running after the input directory is processed, and processes \
+        new images as soon as they are completely written. Implies --resume.",
+    )
+
+    argparser.add_argument(
+        "--shard",
+        required=False,
+        dest="shard",
+        type=parse_shard,
+        help="K/N: processes only the K-th of N disjoint parts of the images (K from 1), \
+        into <outputDir>/shard-K-of-N. Combine the parts with 'main.py merge'.",
+    )
+
+    argparser.add_argument(
+        "--profile",
+        required=False,
+        dest="profile",
+        action="store_true",
+        help="Profiles the processing of each directory with cProfile and a stack \
+        sampler, saves Profile_*.prof and a flamegraph-ready Profile_*.collapsed.txt \
+        next to the Results CSV and prints the hot functions.",
+    )
+
+    argparser.add_argument(
+        "--profileFilter",
+        required=False,
+        dest="profile_filter",
+        help="Regular expression that keeps only the matching functions or stages \
+        in the profile, e.g. 'CropOnMarkers.getBestMatch' or 'preprocess.CropOnMarkers'.",
+    )
+
+    argparser.add_argument(
+        "--profileTop",
+        required=False,
+        dest="profile_top",
+        type=int,
+        help="Number of hot functions to print and save with --profile (default 20).",
+    )
+
+    argparser.add_argument(
+        "--trace",
+        required=False,
+        dest="trace_path",
+        help="Appends spans of each directory, sheet and stage (decode, \
+        pre-processors, reading, evaluation, writes) to this JSON Lines file, \
+        in the span shape of OpenTelemetry's OTLP/JSON.",
+    )
+
+    argparser.add_argument(
+        "--memory",
+        required=False,
+        dest="memory",
+        action="store_true",
+        help="Saves the start, peak and end RSS of each directory as Memory_*.json \
+        next to the Results CSV, with the traced memory per stage when \
+        memory.tracemalloc is on in config.json.",
+    )
+
+    argparser.add_argument(
+        "--maxRssMb",
+        required=False,
+        dest="max_rss_mb",
+        type=int,
+        help="RSS in MB above which the debug image stacks stop being kept \
+        (overrides memory.max_rss_mb of config.json, 0 for no limit).",
+    )
+
+    # `main.py merge` and `main.py rescore` work on the outputs of earlier runs
+    subparsers = argparser.add_subparsers(dest="command", metavar="{merge,rescore}")
+    command_parsers = {
+        "merge": add_merge_parser(subparsers),
+        "rescore": add_rescore_parser(subparsers),
+    }
+
     (
         args,
         unknown,
-    ) = argparser.parse_known_args()
+    ) = argparser.parse_known_args(argv)
 
     args = vars(args)
 
+    if len(unknown) > 0 and args["command"] is not None:
+        command_parsers[args["command"]].error(
+            f"unrecognized arguments: {' '.join(unknown)}"
+        )
     if len(unknown) > 0:
         logger.warning(f"\nError: Unknown arguments: {unknown}", unknown)
         argparser.print_help()
@@ -83,7 +216,77 @@ def parse_args():
     return args
 
 
+def add_merge_parser(subparsers):
+    argparser = subparsers.add_parser(
+        "merge",
+        description="Combines the outputs of --shard runs into the output directory.",
+        help="Combines the outputs of --shard runs.",
+    )
+    argparser.add_argument(
+        "-o",
+        "--outputDir",
+        default="outputs",
+        required=False,
+        dest="output_dir",
+        help="The output directory given to the --shard runs.",
+    )
+    return argparser
+
+
+def add_rescore_parser(subparsers):
+    argparser = subparsers.add_parser(
+        "rescore",
+        help="Grades the sheets again from their saved raw reads.",
+        description="Grades the sheets again from the raw reads saved with \
+        outputs.save_raw_reads, using the current json files of the input directory.",
+    )
+    argparser.add_argument(
+        "-i",
+        "--inputDir",
+        default="inputs",
+        required=False,
+        dest="input_dir",
+        help="The input directory of the run that saved the raw reads.",
+    )
+    argparser.add_argument(
+        "-o",
+        "--outputDir",
+        default="outputs",
+        required=False,
+        dest="output_dir",
+        help="The output directory of that run.",
+    )
+    return argparser
+
+
 def entry_point_for_args(args):
+    # Imported here so that --help does not load OpenCV and the processing code
+    from src.entry import entry_point
+
+    if args.get("watch", False) and args.get("shard") is not None:
+        logger.critical(f"Given shard: {args['shard']}")
+        raise Exception("--watch can not be combined with --shard.")
+
+    if args.get("watch", False) and args.get("profile", False):
+        logger.critical("Given both --watch and --profile")
+        raise Exception("--watch can not be combined with --profile.")
+
+    if args.get("watch", False) and len(args["input_paths"]) > 1:
+        logger.critical(f"Given input directories: {args['input_paths']}")
+        raise Exception("--watch supports a single input directory.")
+
+    if args.get("watch", False):
+        input_dir = Path(args["input_paths"][0]).resolve()
+        output_dir = Path(args["output_dir"]).resolve()
+        if output_dir == input_dir or input_dir in output_dir.parents:
+            # the saved images would be picked up as new sheets
+            logger.critical(
+                f"Given output directory '{output_dir}' is inside the watched '{input_dir}'"
+            )
+            raise Exception(
+                "--watch needs an --outputDir outside of the watched input directory."
+            )
+
     if args["debug"] is True:
         # Disable tracebacks
         sys.tracebacklimit = 0
@@ -96,4 +299,14 @@ def entry_point_for_args(args):
 
 if __name__ == "__main__":
     args = parse_args()
-    entry_point_for_args(args)
+    command = args.pop("command")
+    if command == "merge":
+        from src.utils.shards import merge_shards
+
+        merge_shards(args["output_dir"])
+    elif command == "rescore":
+        from src.rescore import rescore
+
+        rescore(args["input_dir"], args["output_dir"])
+    else:
+        entry_point_for_args(args)
@@ -0,0 +1,112 @@
+"""
+Annotated images on demand: renders the annotated image of one sheet after its
+run, for runs that kept outputs.save_detections off and outputs.save_raw_reads
+on. The page is preprocessed again but its bubbles are not read again, the marks
+and the shifts of the field blocks come from the raw reads saved by the run, so
+the image is the one save_detections would have written.
+"""
+import os
+import uuid
+from pathlib import Path
+
+from src.entry import load_directory_setup, load_parent_setup
+from src.logger import logger
+from src.utils.artifacts import get_imwrite_params, get_output_file_name
+from src.utils.decode import decode_image
+from src.utils.file import Paths
+from src.utils.image import ImageUtils
+from src.utils.raw_reads import get_sheet_raw_read, load_results_raw_reads
+from src.utils.rendering import get_bubbles
+from src.utils.scanner import scan_directory
+
+
+def get_bubble_marks(template, raw_read):
+    """The bubble_marks of classify_bubbles, from the saved values and thresholds"""
+    strip_lengths = [
+        len(field_block_bubbles)
+        for field_block in template.field_blocks
+        for field_block_bubbles in field_block.traverse_bubbles
+    ]
+    if strip_lengths != raw_read["strip_lengths"]:
+        logger.critical(f"The bubbles of '{template}' do not match the raw read")
+        raise Exception("Template layout changed since the raw reads were saved")
+    strip_thresholds = [
+        threshold
+        for threshold, strip_length in zip(
+            raw_read["strip_thresholds"], strip_lengths
+        )
+        for _ in range(strip_length)
+    ]
+    return [
+        (field_block, bubble, threshold > value)
+        for (field_block, bubble), threshold, value in zip(
+            get_bubbles(template), strip_thresholds, raw_read["bubble_values"]
+        )
+    ]
+
+
+def annotate_sheet(input_dir, input_path, output_dir):
+    """Writes the annotated image of input_path (an image under input_dir that
+    was processed into output_dir), returns its path"""
+    input_dir, input_path = Path(input_dir), Path(input_path)
+    curr_dir = input_path.parent
+    paths = Paths(Path(output_dir, curr_dir.relative_to(input_dir)))
+    raw_reads = (
+        load_results_raw_reads(paths.results_dir)
+        if paths.results_dir.is_dir()
+        else None
+    )
+    raw_read = None if raw_reads is None else get_sheet_raw_read(raw_reads, input_path)
+    if raw_read is None:
+        logger.critical(f"No raw read of '{input_path}' in '{paths.results_dir}'")
+        raise Exception(
+            f"Cannot annotate {input_path.name}, it has no raw read: enable outputs.save_raw_reads"
+        )
+
+    # setLayout leaves evaluation.json out, it has no part in the image
+    args = {"setLayout": True}
+    template, tuning_config, evaluation_config = load_parent_setup(
+        input_dir, curr_dir, args
+    )
+    template, tuning_config, _, _ = load_directory_setup(
+        curr_dir,
+        scan_directory(curr_dir),
+        args,
+        template,
+        tuning_config,
+        evaluation_config,
+    )
+    if template is None:
+        logger.critical(f"No template found in the directory tree of '{curr_dir}'")
+        raise Exception(f"No template file found in the directory tree of {curr_dir}")
+
+    image_instance_ops = template.image_instance_ops
+    in_omr = decode_image(input_path, tuning_config)
+    if in_omr is not None:
+        in_omr = image_instance_ops.apply_preprocessors(input_path, in_omr, template)
+    if in_omr is None:
+        logger.critical(f"Could not preprocess '{input_path}' again")
+        raise Exception(f"Cannot annotate {input_path.name}, preprocessing failed")
+
+    for field_block, shift in zip(template.field_blocks, raw_read["shifts"]):
+        field_block.shift = shift
+    final_marked = image_instance_ops.draw_marked_page(
+        template,
+        image_instance_ops.normalize_page(template, in_omr),
+        get_bubble_marks(template, raw_read),
+    )
+
+    image_path = paths.save_marked_dir.joinpath(
+        get_output_file_name(input_path.name, tuning_config.outputs)
+    )
+    os.makedirs(image_path.parent, exist_ok=True)
+    # renamed into place, a concurrent request never serves half an image
+    temp_path = image_path.with_name(f".{uuid.uuid4().hex}.{image_path.name}")
+    ImageUtils.save_img(
+        str(temp_path),
+        final_marked,
+        get_imwrite_params(image_path, tuning_config.outputs),
+    )
+    os.replace(temp_path, image_path)
+    logger.info(f"Annotated '{input_path}' into '{image_path}'")
+    return image_path
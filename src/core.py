@@ -3,13 +3,26 @@ from collections import defaultdict
 from typing import Any
 
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
 
 import src.constants as constants
 from src.logger import logger
-from src.utils.image import CLAHE_HELPER, ImageUtils
+from src.processors.pipeline import ThreadBuffers
+from src.utils.artifacts import (
+    SynchronousWriter,
+    get_imwrite_params,
+    get_output_file_name,
+    get_stack_extension,
+)
+from src.utils.image import CLAHE_HELPER, ImageUtils, get_pyplot
+from src.utils.instrumentation import STAGE_TIMINGS
 from src.utils.interaction import InteractionUtils
+from src.utils.rendering import draw_layout, draw_marks
+
+# Open : erode then dilate, for the vertical lines of the field blocks
+ALIGN_OPEN_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 10))
+# kernel best tuned to 5x5 now
+ALIGN_ERODE_KERNEL = np.ones((5, 5), np.uint8)
 
 
 class ImageInstanceOps:
@@ -21,59 +34,50 @@ class ImageInstanceOps:
         super().__init__()
         self.tuning_config = tuning_config
         self.save_image_level = tuning_config.outputs.save_image_level
+        # images kept per debug stack, 0 for no limit
+        self.max_debug_images = tuning_config.memory.max_debug_images
+        # turned off when the RSS limit of the run is hit, see src/utils/memory.py
+        self.keep_debug_images = True
+        # the pages of read_omr_response, only the annotated image is a new array
+        self.page_buffers = ThreadBuffers()
 
     def apply_preprocessors(self, file_path, in_omr, template):
-        tuning_config = self.tuning_config
-        # resize to conform to template
-        in_omr = ImageUtils.resize_util(
-            in_omr,
-            tuning_config.dimensions.processing_width,
-            tuning_config.dimensions.processing_height,
-        )
-
-        # run pre_processors in sequence
-        for pre_processor in template.pre_processors:
-            in_omr = pre_processor.apply_filter(in_omr, file_path)
-        return in_omr
+        # resize to conform to template, then run the compiled pre_processors
+        # (see src/processors/pipeline.py), returns None if any of them fails
+        return template.preprocessing_pipeline.run(in_omr, file_path)
 
-    def read_omr_response(self, template, image, name, save_dir=None):
+    def read_omr_response(
+        self, template, image, name, save_dir=None, artifact_writer=None, raw_read=None
+    ):
         config = self.tuning_config
         auto_align = config.alignment_params.auto_align
+        clock = STAGE_TIMINGS.clock("read")
         try:
-            img = image.copy()
-            # origDim = img.shape[:2]
-            img = ImageUtils.resize_util(
-                img, template.page_dimensions[0], template.page_dimensions[1]
-            )
-            if img.max() > img.min():
-                img = ImageUtils.normalize_util(img)
-            # Processing copies
-            transp_layer = img.copy()
-            final_marked = img.copy()
-
-            morph = img.copy()
-            self.append_save_img(3, morph)
+            clock.start("normalize")
+            img = self.normalize_page(template, image, self.page_buffers)
+            # append_save_img keeps copies, the buffers are written over below
+            self.append_save_img(3, img)
 
+            clock.start("align")
             if auto_align:
                 # Note: clahe is good for morphology, bad for thresholding
-                morph = CLAHE_HELPER.apply(morph)
+                morph = CLAHE_HELPER.apply(
+                    img, self.page_buffers.get("morph", img.shape, img.dtype)
+                )
                 self.append_save_img(3, morph)
                 # Remove shadows further, make columns/boxes darker (less gamma)
-                morph = ImageUtils.adjust_gamma(
-                    morph, config.threshold_params.GAMMA_LOW
+                ImageUtils.adjust_gamma(
+                    morph, config.threshold_params.GAMMA_LOW, dst=morph
                 )
                 # TODO: all numbers should come from either constants or config
-                _, morph = cv2.threshold(morph, 220, 220, cv2.THRESH_TRUNC)
-                morph = ImageUtils.normalize_util(morph)
+                cv2.threshold(morph, 220, 220, cv2.THRESH_TRUNC, morph)
+                ImageUtils.normalize_util(morph, dst=morph)
                 self.append_save_img(3, morph)
                 if config.outputs.show_image_level >= 4:
                     InteractionUtils.show("morph1", morph, 0, 1, config)
 
             # Move them to data class if needed
-            # Overlay Transparencies
-            alpha = 0.65
-            omr_response = {}
-            multi_marked, multi_roll = 0, 0
+            multi_roll = 0
 
             # TODO Make this part useful for visualizing status checks
             # blackVals=[0]
@@ -87,13 +91,16 @@ class ImageInstanceOps:
             # Find Shifts for the field_blocks --> Before calculating threshold!
             if auto_align:
                 # print("Begin Alignment")
-                # Open : erode then dilate
-                v_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 10))
                 morph_v = cv2.morphologyEx(
-                    morph, cv2.MORPH_OPEN, v_kernel, iterations=3
+                    morph,
+                    cv2.MORPH_OPEN,
+                    ALIGN_OPEN_KERNEL,
+                    self.page_buffers.get("morph_v", img.shape, img.dtype),
+                    iterations=3,
                 )
-                _, morph_v = cv2.threshold(morph_v, 200, 200, cv2.THRESH_TRUNC)
-                morph_v = 255 - ImageUtils.normalize_util(morph_v)
+                cv2.threshold(morph_v, 200, 200, cv2.THRESH_TRUNC, morph_v)
+                ImageUtils.normalize_util(morph_v, dst=morph_v)
+                np.subtract(255, morph_v, out=morph_v)
 
                 if config.outputs.show_image_level >= 3:
                     InteractionUtils.show(
@@ -106,9 +113,8 @@ class ImageInstanceOps:
                 self.append_save_img(3, morph_v)
 
                 morph_thr = 60  # for Mobile images, 40 for scanned Images
-                _, morph_v = cv2.threshold(morph_v, morph_thr, 255, cv2.THRESH_BINARY)
-                # kernel best tuned to 5x5 now
-                morph_v = cv2.erode(morph_v, np.ones((5, 5), np.uint8), iterations=2)
+                cv2.threshold(morph_v, morph_thr, 255, cv2.THRESH_BINARY, morph_v)
+                cv2.erode(morph_v, ALIGN_ERODE_KERNEL, morph_v, iterations=2)
 
                 self.append_save_img(3, morph_v)
                 # h_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (10, 2))
@@ -189,20 +195,9 @@ class ImageInstanceOps:
                     #   "origin:", field_block.origin,'\n')
                 # print("End Alignment")
 
-            final_align = None
-            if config.outputs.show_image_level >= 2:
-                initial_align = self.draw_template_layout(img, template, shifted=False)
-                final_align = self.draw_template_layout(
-                    img, template, shifted=True, draw_qvals=True
-                )
-                # appendSaveImg(4,mean_vals)
-                self.append_save_img(2, initial_align)
-                self.append_save_img(2, final_align)
-
-                if auto_align:
-                    final_align = np.hstack((initial_align, final_align))
             self.append_save_img(5, img)
 
+            clock.start("sample")
             # Get mean bubbleValues n other stats
             all_q_vals, all_q_strip_arrs, all_q_std_vals = [], [], []
             total_q_strip_no = 0
@@ -230,152 +225,75 @@ class ImageInstanceOps:
                     total_q_strip_no += 1
                 all_q_std_vals.extend(q_std_vals)
 
-            global_std_thresh, _, _ = self.get_global_threshold(
-                all_q_std_vals
-            )  # , "Q-wise Std-dev Plot", plot_show=True, sort_in_plot=True)
-            # plt.show()
-            # hist = getPlotImg()
-            # InteractionUtils.show("StdHist", hist, 0, 1,config=config)
-
-            # Note: Plotting takes Significant times here --> Change Plotting args
-            # to support show_image_level
-            # , "Mean Intensity Histogram",plot_show=True, sort_in_plot=True)
-            global_thr, _, _ = self.get_global_threshold(all_q_vals, looseness=4)
+            clock.start("threshold")
+            (
+                omr_response,
+                multi_marked,
+                bubble_marks,
+                strip_thresholds,
+                global_thr,
+                global_std_thresh,
+            ) = self.classify_bubbles(
+                template,
+                all_q_strip_arrs,
+                all_q_std_vals,
+                config.outputs.show_image_level >= 6,
+            )
 
             logger.info(
                 f"Thresholding: \tglobal_thr: {round(global_thr, 2)} \tglobal_std_THR: {round(global_std_thresh, 2)}\t{'(Looks like a Xeroxed OMR)' if (global_thr == 255) else ''}"
             )
-            # plt.show()
-            # hist = getPlotImg()
-            # InteractionUtils.show("StdHist", hist, 0, 1,config=config)
-
-            # if(config.outputs.show_image_level>=1):
-            #     hist = getPlotImg()
-            #     InteractionUtils.show("Hist", hist, 0, 1,config=config)
-            #     appendSaveImg(4,hist)
-            #     appendSaveImg(5,hist)
-            #     appendSaveImg(2,hist)
-
-            per_omr_threshold_avg, total_q_strip_no, total_q_box_no = 0, 0, 0
-            for field_block in template.field_blocks:
-                block_q_strip_no = 1
-                box_w, box_h = field_block.bubble_dimensions
-                shift = field_block.shift
-                s, d = field_block.origin, field_block.dimensions
-                key = field_block.name[:3]
-                # cv2.rectangle(final_marked,(s[0]+shift,s[1]),(s[0]+shift+d[0],
-                #   s[1]+d[1]),CLR_BLACK,3)
-                for field_block_bubbles in field_block.traverse_bubbles:
-                    # All Black or All White case
-                    no_outliers = all_q_std_vals[total_q_strip_no] < global_std_thresh
-                    # print(total_q_strip_no, field_block_bubbles[0].field_label,
-                    #   all_q_std_vals[total_q_strip_no], "no_outliers:", no_outliers)
-                    per_q_strip_threshold = self.get_local_threshold(
-                        all_q_strip_arrs[total_q_strip_no],
-                        global_thr,
-                        no_outliers,
-                        f"Mean Intensity Histogram for {key}.{field_block_bubbles[0].field_label}.{block_q_strip_no}",
-                        config.outputs.show_image_level >= 6,
-                    )
-                    # print(field_block_bubbles[0].field_label,key,block_q_strip_no, "THR: ",
-                    #   round(per_q_strip_threshold,2))
-                    per_omr_threshold_avg += per_q_strip_threshold
-
-                    # Note: Little debugging visualization - view the particular Qstrip
-                    # if(
-                    #     0
-                    #     # or "q17" in (field_block_bubbles[0].field_label)
-                    #     # or (field_block_bubbles[0].field_label+str(block_q_strip_no))=="q15"
-                    #  ):
-                    #     st, end = qStrip
-                    #     InteractionUtils.show("QStrip: "+key+"-"+str(block_q_strip_no),
-                    #     img[st[1] : end[1], st[0]+shift : end[0]+shift],0,config=config)
-
-                    # TODO: get rid of total_q_box_no
-                    detected_bubbles = []
-                    for bubble in field_block_bubbles:
-                        bubble_is_marked = (
-                            per_q_strip_threshold > all_q_vals[total_q_box_no]
-                        )
-                        total_q_box_no += 1
-                        if bubble_is_marked:
-                            detected_bubbles.append(bubble)
-                            x, y, field_value = (
-                                bubble.x + field_block.shift,
-                                bubble.y,
-                                bubble.field_value,
-                            )
-                            cv2.rectangle(
-                                final_marked,
-                                (int(x + box_w / 12), int(y + box_h / 12)),
-                                (
-                                    int(x + box_w - box_w / 12),
-                                    int(y + box_h - box_h / 12),
-                                ),
-                                constants.CLR_DARK_GRAY,
-                                3,
-                            )
 
-                            cv2.putText(
-                                final_marked,
-                                str(field_value),
-                                (x, y),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                constants.TEXT_SIZE,
-                                (20, 20, 10),
-                                int(1 + 3.5 * constants.TEXT_SIZE),
-                            )
-                        else:
-                            cv2.rectangle(
-                                final_marked,
-                                (int(x + box_w / 10), int(y + box_h / 10)),
-                                (
-                                    int(x + box_w - box_w / 10),
-                                    int(y + box_h - box_h / 10),
-                                ),
-                                constants.CLR_GRAY,
-                                -1,
-                            )
-
-                    for bubble in detected_bubbles:
-                        field_label, field_value = (
-                            bubble.field_label,
-                            bubble.field_value,
-                        )
-                        # Only send rolls multi-marked in the directory
-                        multi_marked_local = field_label in omr_response
-                        omr_response[field_label] = (
-                            (omr_response[field_label] + field_value)
-                            if multi_marked_local
-                            else field_value
-                        )
-                        # TODO: generalize this into identifier
-                        # multi_roll = multi_marked_local and "Roll" in str(q)
-                        multi_marked = multi_marked or multi_marked_local
-
-                    if len(detected_bubbles) == 0:
-                        field_label = field_block_bubbles[0].field_label
-                        omr_response[field_label] = field_block.empty_val
-
-                    if config.outputs.show_image_level >= 5:
+            if config.outputs.show_image_level >= 5:
+                total_q_strip_no = 0
+                for field_block in template.field_blocks:
+                    key = field_block.name[:3]
+                    for block_q_strip_no, _ in enumerate(
+                        field_block.traverse_bubbles, start=1
+                    ):
                         if key in all_c_box_vals:
                             q_nums[key].append(f"{key[:2]}_c{str(block_q_strip_no)}")
                             all_c_box_vals[key].append(
                                 all_q_strip_arrs[total_q_strip_no]
                             )
+                        total_q_strip_no += 1
+
+            if raw_read is not None:
+                raw_read.update(
+                    bubble_values=all_q_vals,
+                    strip_lengths=[len(q_strip) for q_strip in all_q_strip_arrs],
+                    strip_thresholds=strip_thresholds,
+                    global_threshold=global_thr,
+                    global_std_threshold=global_std_thresh,
+                    shifts=[field_block.shift for field_block in template.field_blocks],
+                )
 
-                    block_q_strip_no += 1
-                    total_q_strip_no += 1
-                # /for field_block
+            clock.start("render")
+            final_align = None
+            if config.outputs.show_image_level >= 2:
+                initial_align = self.draw_template_layout(img, template, shifted=False)
+                final_align = self.draw_template_layout(
+                    img, template, shifted=True, draw_qvals=True, q_vals=all_q_vals
+                )
+                # appendSaveImg(4,mean_vals)
+                self.append_save_img(2, initial_align)
+                self.append_save_img(2, final_align)
 
-            per_omr_threshold_avg /= total_q_strip_no
-            per_omr_threshold_avg = round(per_omr_threshold_avg, 2)
-            # Translucent
-            cv2.addWeighted(
-                final_marked, alpha, transp_layer, 1 - alpha, 0, final_marked
-            )
+                if auto_align:
+                    final_align = np.hstack((initial_align, final_align))
+
+            # without a consumer it is rendered on demand from the raw reads,
+            # see src/annotate.py
+            final_marked = None
+            if (
+                (config.outputs.save_detections and save_dir is not None)
+                or config.outputs.show_image_level >= 2
+                or self.save_image_level >= 2
+            ):
+                final_marked = self.draw_marked_page(template, img, bubble_marks)
             # Box types
             if config.outputs.show_image_level >= 6:
+                plt = get_pyplot()
                 # plt.draw()
                 f, axes = plt.subplots(len(all_c_box_vals), sharey=True)
                 f.canvas.manager.set_window_title(name)
@@ -408,84 +326,160 @@ class ImageInstanceOps:
                     "Template Alignment Adjustment", final_align, 0, 0, config=config
                 )
 
+            clock.start("save")
+            # encoding and writing happens on the writer's threads when given
+            if artifact_writer is None:
+                artifact_writer = SynchronousWriter(config.outputs)
             if config.outputs.save_detections and save_dir is not None:
                 if multi_roll:
                     save_dir = save_dir.joinpath("_MULTI_")
-                image_path = str(save_dir.joinpath(name))
-                ImageUtils.save_img(image_path, final_marked)
+                image_path = save_dir.joinpath(
+                    get_output_file_name(name, config.outputs)
+                )
+                artifact_writer.save_img(image_path, final_marked)
 
             self.append_save_img(2, final_marked)
 
             if save_dir is not None:
                 for i in range(config.outputs.save_image_level):
-                    self.save_image_stacks(i + 1, name, save_dir)
+                    self.save_image_stacks(i + 1, name, save_dir, artifact_writer)
 
+            clock.stop()
             return omr_response, final_marked, multi_marked, multi_roll
 
         except Exception as e:
+            clock.stop(failed=True)
             raise e
 
+    def classify_bubbles(
+        self, template, all_q_strip_arrs, all_q_std_vals, plot_show=False
+    ):
+        """Thresholds the mean intensities of every strip of bubbles, in the
+        traversal order of the template. Returns (omr_response, multi_marked,
+        bubble_marks, strip_thresholds, global_thr, global_std_thresh) where
+        bubble_marks lists (field_block, bubble, is_marked)."""
+        all_q_vals = [
+            q_val for q_strip_vals in all_q_strip_arrs for q_val in q_strip_vals
+        ]
+        global_std_thresh, _, _ = self.get_global_threshold(
+            all_q_std_vals
+        )  # , "Q-wise Std-dev Plot", plot_show=True, sort_in_plot=True)
+
+        # Note: Plotting takes Significant times here --> Change Plotting args
+        # to support show_image_level
+        # , "Mean Intensity Histogram",plot_show=True, sort_in_plot=True)
+        global_thr, _, _ = self.get_global_threshold(all_q_vals, looseness=4)
+
+        omr_response = {}
+        multi_marked = 0
+        strip_thresholds, bubble_marks = [], []
+        total_q_strip_no, total_q_box_no = 0, 0
+        for field_block in template.field_blocks:
+            block_q_strip_no = 1
+            key = field_block.name[:3]
+            for field_block_bubbles in field_block.traverse_bubbles:
+                # All Black or All White case
+                no_outliers = all_q_std_vals[total_q_strip_no] < global_std_thresh
+                # print(total_q_strip_no, field_block_bubbles[0].field_label,
+                #   all_q_std_vals[total_q_strip_no], "no_outliers:", no_outliers)
+                per_q_strip_threshold = self.get_local_threshold(
+                    all_q_strip_arrs[total_q_strip_no],
+                    global_thr,
+                    no_outliers,
+                    f"Mean Intensity Histogram for {key}.{field_block_bubbles[0].field_label}.{block_q_strip_no}",
+                    plot_show,
+                )
+                # print(field_block_bubbles[0].field_label,key,block_q_strip_no, "THR: ",
+                #   round(per_q_strip_threshold,2))
+                strip_thresholds.append(per_q_strip_threshold)
+
+                # Note: Little debugging visualization - view the particular Qstrip
+                # if(
+                #     0
+                #     # or "q17" in (field_block_bubbles[0].field_label)
+                #     # or (field_block_bubbles[0].field_label+str(block_q_strip_no))=="q15"
+                #  ):
+                #     st, end = qStrip
+                #     InteractionUtils.show("QStrip: "+key+"-"+str(block_q_strip_no),
+                #     img[st[1] : end[1], st[0]+shift : end[0]+shift],0,config=config)
+
+                # TODO: get rid of total_q_box_no
+                detected_bubbles = []
+                for bubble in field_block_bubbles:
+                    bubble_is_marked = (
+                        per_q_strip_threshold > all_q_vals[total_q_box_no]
+                    )
+                    total_q_box_no += 1
+                    bubble_marks.append((field_block, bubble, bubble_is_marked))
+                    if bubble_is_marked:
+                        detected_bubbles.append(bubble)
+
+                for bubble in detected_bubbles:
+                    field_label, field_value = (
+                        bubble.field_label,
+                        bubble.field_value,
+                    )
+                    # Only send rolls multi-marked in the directory
+                    multi_marked_local = field_label in omr_response
+                    omr_response[field_label] = (
+                        (omr_response[field_label] + field_value)
+                        if multi_marked_local
+                        else field_value
+                    )
+                    # TODO: generalize this into identifier
+                    # multi_roll = multi_marked_local and "Roll" in str(q)
+                    multi_marked = multi_marked or multi_marked_local
+
+                if len(detected_bubbles) == 0:
+                    field_label = field_block_bubbles[0].field_label
+                    omr_response[field_label] = field_block.empty_val
+
+                block_q_strip_no += 1
+                total_q_strip_no += 1
+            # /for field_block
+
+        return (
+            omr_response,
+            multi_marked,
+            bubble_marks,
+            strip_thresholds,
+            global_thr,
+            global_std_thresh,
+        )
+
+    @staticmethod
+    def normalize_page(template, image, page_buffers=None):
+        """The page as read_omr_response samples and annotates it, written into
+        the "page" buffer of page_buffers when given"""
+        page_width, page_height = map(int, template.page_dimensions)
+        page = None
+        if page_buffers is not None:
+            page = page_buffers.get(
+                "page", (page_height, page_width, *image.shape[2:]), image.dtype
+            )
+        img = ImageUtils.resize_util(image, page_width, page_height, dst=page)
+        if img.max() > img.min():
+            ImageUtils.normalize_util(img, dst=img)
+        return img
+
+    @staticmethod
+    def draw_marked_page(template, img, bubble_marks, alpha=0.65):
+        """The annotated image: the bubble_marks of classify_bubbles drawn over
+        the normalized page, with an overlay transparency of alpha"""
+        final_marked = img.copy()
+        draw_marks(final_marked, template, bubble_marks)
+        # Translucent
+        cv2.addWeighted(final_marked, alpha, img, 1 - alpha, 0, final_marked)
+        return final_marked
+
     @staticmethod
-    def draw_template_layout(img, template, shifted=True, draw_qvals=False, border=-1):
+    def draw_template_layout(
+        img, template, shifted=True, draw_qvals=False, border=-1, q_vals=None
+    ):
         img = ImageUtils.resize_util(
             img, template.page_dimensions[0], template.page_dimensions[1]
         )
-        final_align = img.copy()
-        for field_block in template.field_blocks:
-            s, d = field_block.origin, field_block.dimensions
-            box_w, box_h = field_block.bubble_dimensions
-            shift = field_block.shift
-            if shifted:
-                cv2.rectangle(
-                    final_align,
-                    (s[0] + shift, s[1]),
-                    (s[0] + shift + d[0], s[1] + d[1]),
-                    constants.CLR_BLACK,
-                    3,
-                )
-            else:
-                cv2.rectangle(
-                    final_align,
-                    (s[0], s[1]),
-                    (s[0] + d[0], s[1] + d[1]),
-                    constants.CLR_BLACK,
-                    3,
-                )
-            for field_block_bubbles in field_block.traverse_bubbles:
-                for pt in field_block_bubbles:
-                    x, y = (pt.x + field_block.shift, pt.y) if shifted else (pt.x, pt.y)
-                    cv2.rectangle(
-                        final_align,
-                        (int(x + box_w / 10), int(y + box_h / 10)),
-                        (int(x + box_w - box_w / 10), int(y + box_h - box_h / 10)),
-                        constants.CLR_GRAY,
-                        border,
-                    )
-                    if draw_qvals:
-                        rect = [y, y + box_h, x, x + box_w]
-                        cv2.putText(
-                            final_align,
-                            f"{int(cv2.mean(img[rect[0] : rect[1], rect[2] : rect[3]])[0])}",
-                            (rect[2] + 2, rect[0] + (box_h * 2) // 3),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.6,
-                            constants.CLR_BLACK,
-                            2,
-                        )
-            if shifted:
-                text_in_px = cv2.getTextSize(
-                    field_block.name, cv2.FONT_HERSHEY_SIMPLEX, constants.TEXT_SIZE, 4
-                )
-                cv2.putText(
-                    final_align,
-                    field_block.name,
-                    (int(s[0] + d[0] - text_in_px[0][0]), int(s[1] - text_in_px[0][1])),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    constants.TEXT_SIZE,
-                    constants.CLR_BLACK,
-                    4,
-                )
-        return final_align
+        return draw_layout(img, template, shifted, draw_qvals, border, q_vals)
 
     def get_global_threshold(
         self,
@@ -570,6 +564,7 @@ class ImageInstanceOps:
         #     global_thr, j_low, j_high = thr2, thr2 - max2//2, thr2 + max2//2
 
         if plot_title:
+            plt = get_pyplot()
             _, ax = plt.subplots()
             ax.bar(range(len(q_vals_orig)), q_vals if sort_in_plot else q_vals_orig)
             ax.set_title(plot_title)
@@ -675,6 +670,7 @@ class ImageInstanceOps:
 
         # Make a common plot function to show local and global thresholds
         if plot_show and plot_title is not None:
+            plt = get_pyplot()
             _, ax = plt.subplots()
             ax.bar(range(len(q_vals)), q_vals)
             thrline = ax.axhline(thr1, color="green", ls=("-."), linewidth=3)
@@ -692,29 +688,52 @@ class ImageInstanceOps:
         return thr1
 
     def append_save_img(self, key, img):
-        if self.save_image_level >= int(key):
-            self.save_img_list[key].append(img.copy())
-
-    def save_image_stacks(self, key, filename, save_dir):
+        if self.save_image_level < int(key) or not self.keep_debug_images:
+            return
+        save_imgs = self.save_img_list[key]
+        # the first images of a stack are kept
+        if not self.max_debug_images or len(save_imgs) < self.max_debug_images:
+            save_imgs.append(img.copy())
+
+    def stop_keeping_debug_images(self):
+        self.keep_debug_images = False
+        self.reset_all_save_img()
+
+    def save_image_stacks(self, key, filename, save_dir, artifact_writer=None):
         config = self.tuning_config
         if self.save_image_level >= int(key) and self.save_img_list[key] != []:
             name = os.path.splitext(filename)[0]
-            result = np.hstack(
-                tuple(
-                    [
-                        ImageUtils.resize_util_h(img, config.dimensions.display_height)
-                        for img in self.save_img_list[key]
-                    ]
-                )
+            stack_path = save_dir.joinpath(
+                "stack", f"{name}_{str(key)}_stack.{get_stack_extension(config.outputs)}"
+            )
+            if artifact_writer is None:
+                artifact_writer = SynchronousWriter(config.outputs)
+            # reset_all_save_img() replaces the lists instead of clearing them,
+            # so this snapshot stays intact while the writer composes the stack
+            artifact_writer.submit(
+                self.write_image_stack, list(self.save_img_list[key]), stack_path
             )
-            result = ImageUtils.resize_util(
-                result,
-                min(
-                    len(self.save_img_list[key]) * config.dimensions.display_width // 3,
-                    int(config.dimensions.display_width * 2.5),
-                ),
+
+    def write_image_stack(self, images, stack_path):
+        config = self.tuning_config
+        result = np.hstack(
+            tuple(
+                [
+                    ImageUtils.resize_util_h(img, config.dimensions.display_height)
+                    for img in images
+                ]
             )
-            ImageUtils.save_img(f"{save_dir}stack/{name}_{str(key)}_stack.jpg", result)
+        )
+        result = ImageUtils.resize_util(
+            result,
+            min(
+                len(images) * config.dimensions.display_width // 3,
+                int(config.dimensions.display_width * 2.5),
+            ),
+        )
+        ImageUtils.save_img(
+            str(stack_path), result, get_imwrite_params(stack_path, config.outputs)
+        )
 
     def reset_all_save_img(self):
         for i in range(self.save_image_level):
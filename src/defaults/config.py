@@ -7,6 +7,9 @@ CONFIG_DEFAULTS = DotMap(
             "display_width": 1640,
             "processing_height": 820,
             "processing_width": 666,
+            # Decode large JPEG scans at 1/2, 1/4 or 1/8 size when that still covers
+            # the processing size (faster, but pixels differ slightly from a full decode)
+            "reduced_decode": False,
         },
         "threshold_params": {
             "GAMMA_LOW": 0.7,
@@ -29,6 +32,24 @@ CONFIG_DEFAULTS = DotMap(
             "save_image_level": 0,
             "save_detections": True,
             "filter_out_multimarked_files": False,
+            # Annotated images and debug stacks, "same_as_input" keeps the input's extension
+            "image_format": "same_as_input",
+            "jpeg_quality": 95,
+            # None keeps OpenCV's default (fastest, run-length strategy)
+            "png_compression": None,
+            "webp_quality": 90,
+            # Keeps the bubble intensities of each sheet for `main.py rescore`
+            "save_raw_reads": False,
+        },
+        "memory": {
+            # RSS in MB above which a run stops keeping debug image stacks, 0 for no limit
+            "max_rss_mb": 0,
+            # Decoded sheets alive in the pipeline at once, 0 for no limit
+            "max_decoded_images": 0,
+            # Images kept in each debug stack of a sheet, 0 for no limit
+            "max_debug_images": 0,
+            # Traced allocations per stage and their top sites in Memory_*.json (slow)
+            "tracemalloc": False,
         },
     },
     _dynamic=False,
@@ -7,12 +7,13 @@
 
 """
 import os
-from csv import QUOTE_NONNUMERIC
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from multiprocessing import get_context
 from pathlib import Path
-from time import time
+from time import perf_counter, sleep, time
 
 import cv2
-import pandas as pd
 from rich.table import Table
 
 from src import constants
@@ -20,20 +21,151 @@ from src.defaults import CONFIG_DEFAULTS
 from src.evaluation import EvaluationConfig, evaluate_concatenated_response
 from src.logger import console, logger
 from src.template import Template
-from src.utils.file import Paths, setup_dirs_for_paths, setup_outputs_for_template
+from src.utils.artifacts import ArtifactWriter, get_output_file_name
+from src.utils.decode import decode_image
+from src.utils.file import (
+    Paths,
+    append_csv_rows,
+    drop_csv_rows,
+    setup_dirs_for_paths,
+    setup_outputs_for_template,
+)
 from src.utils.image import ImageUtils
+from src.utils.instrumentation import STAGE_TIMINGS, SheetContext
 from src.utils.interaction import InteractionUtils, Stats
+from src.utils.manifest import (
+    OUTCOME_ERROR,
+    OUTCOME_MULTI_MARKED,
+    OUTCOME_RESULTS,
+    ProcessedFilesManifest,
+    hash_template_setup,
+)
+from src.utils.memory import MemoryMonitor, MemoryOptions
 from src.utils.parsing import get_concatenated_response, open_config_with_defaults
+from src.utils.profiling import PipelineProfiler, ProfileOptions
+from src.utils.raw_reads import RawReadStore
+from src.utils.scanner import WorkPlan, normalize_path, scan_directory
+from src.utils.shards import get_shard_output_dir, select_shard
+from src.utils.streaming import PipelineOptions, ordered_map, prefetch
+from src.utils.tracing import TRACER
+from src.utils.watcher import DirectoryWatcher
 
 # Load processors
 STATS = Stats()
 
+# --watch: seconds between polls, and how long a new image must stay unchanged
+WATCH_POLL_INTERVAL = 0.5
+WATCH_SETTLE_TIME = 0.5
+
 
 def entry_point(input_dir, args):
     if not os.path.exists(input_dir):
         raise Exception(f"Given input directory does not exist: '{input_dir}'")
+    setup_instrumentation(args)
+    shard = args.get("shard")
+    if shard is not None:
+        # merged back into output_dir by `main.py merge`
+        args = {**args, "output_dir": get_shard_output_dir(args["output_dir"], shard)}
+        # also when this shard gets no images, merge checks that every shard ran
+        os.makedirs(args["output_dir"], exist_ok=True)
     curr_dir = input_dir
-    return process_dir(input_dir, curr_dir, args)
+    work_plan = WorkPlan.scan(input_dir)
+    if shard is not None:
+        # the images are shared out in one order across the whole tree
+        args = {**args, "shard_offsets": work_plan.image_offsets()}
+    # watch mode keeps the templates warm in this process
+    if args.get("watch", False) and not args["setLayout"]:
+        return watch_input_dir(input_dir, args, work_plan)
+    if (args.get("dir_workers") or 1) > 1 and not args["setLayout"]:
+        return process_dirs_in_parallel(input_dir, args, work_plan)
+    return process_dir(input_dir, curr_dir, args, work_plan=work_plan)
+
+
+def setup_instrumentation(args):
+    STAGE_TIMINGS.enabled = bool(args.get("timings", False))
+    if args.get("trace_path"):
+        TRACER.export_to(args["trace_path"])
+
+
+def watch_input_dir(input_dir, args, work_plan):
+    # A restarted watch continues with the images that arrived in the meantime
+    args = {**args, "resume": True}
+    watch_contexts = {}
+    process_dir(
+        input_dir, input_dir, args, work_plan=work_plan, watch_contexts=watch_contexts
+    )
+    watch_dir(input_dir, args, work_plan, watch_contexts)
+
+
+def process_dirs_in_parallel(input_dir, args, work_plan):
+    """Processes the directories that have images on a pool of dir_workers
+    processes, the largest first. Each directory gets its own outputs as in a
+    sequential run, the directories only share the json files of their parents."""
+    planned_dirs = []
+    for directory_scan in work_plan:
+        if directory_scan.images:
+            planned_dirs.append((len(directory_scan.images), directory_scan.path))
+        elif not directory_scan.subdirs:
+            logger.info(
+                f"No valid images or sub-folders found in {directory_scan.path}.\
+                Empty directories not allowed."
+            )
+    # sorted is stable: equally large directories keep their tree order
+    planned_dirs = sorted(planned_dirs, key=lambda item: -item[0])
+    logger.info(
+        f"Processing {len(planned_dirs)} directories on {args['dir_workers']} processes"
+    )
+    # spawned, forking a process that may run OpenCV threads is not safe
+    with ProcessPoolExecutor(
+        max_workers=args["dir_workers"], mp_context=get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(process_planned_dir, input_dir, curr_dir, args)
+            for _, curr_dir in planned_dirs
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def process_planned_dir(root_dir, curr_dir, args):
+    """Runs in a worker process: rebuilds the setup inherited by curr_dir, then
+    processes the images of curr_dir only"""
+    setup_instrumentation(args)
+    template, tuning_config, evaluation_config = load_parent_setup(
+        root_dir, curr_dir, args
+    )
+    process_dir(
+        root_dir,
+        curr_dir,
+        args,
+        template,
+        tuning_config,
+        evaluation_config,
+        recursive=False,
+    )
+
+
+def load_parent_setup(root_dir, curr_dir, args):
+    """The (template, tuning_config, evaluation_config) that process_dir passes
+    down to curr_dir, from the json files of its parents up to root_dir"""
+    template, tuning_config, evaluation_config = None, CONFIG_DEFAULTS, None
+    parent_dirs = [curr_dir, *curr_dir.parents]
+    parent_dirs = parent_dirs[1 : parent_dirs.index(root_dir) + 1]
+    for parent_dir in reversed(parent_dirs):
+        template, tuning_config, evaluation_config, _ = load_directory_setup(
+            parent_dir,
+            scan_directory(parent_dir),
+            args,
+            template,
+            tuning_config,
+            evaluation_config,
+        )
+    return template, tuning_config, evaluation_config
 
 
 def print_config_summary(
@@ -71,45 +203,34 @@ def print_config_summary(
     console.print(table, justify="center")
 
 
-def process_dir(
-    root_dir,
-    curr_dir,
-    args,
-    template=None,
-    tuning_config=CONFIG_DEFAULTS,
-    evaluation_config=None,
+def load_directory_setup(
+    curr_dir, directory_scan, args, template, tuning_config, evaluation_config
 ):
+    """Applies the json files of curr_dir over the ones inherited from its parent
+    directories, returns the resulting (template, tuning_config,
+    evaluation_config, excluded_files)"""
     # Update local tuning_config (in current recursion stack)
     local_config_path = curr_dir.joinpath(constants.CONFIG_FILENAME)
-    if os.path.exists(local_config_path):
+    if directory_scan.has_config:
         tuning_config = open_config_with_defaults(local_config_path)
 
     # Update local template (in current recursion stack)
     local_template_path = curr_dir.joinpath(constants.TEMPLATE_FILENAME)
-    local_template_exists = os.path.exists(local_template_path)
+    local_template_exists = directory_scan.has_template
     if local_template_exists:
         template = Template(
             local_template_path,
             tuning_config,
         )
-    # Look for subdirectories for processing
-    subdirs = [d for d in curr_dir.iterdir() if d.is_dir()]
-
-    output_dir = Path(args["output_dir"], curr_dir.relative_to(root_dir))
-    paths = Paths(output_dir)
-
-    # look for images in current dir to process
-    exts = ("*.[pP][nN][gG]", "*.[jJ][pP][gG]", "*.[jJ][pP][eE][gG]")
-    omr_files = sorted([f for ext in exts for f in curr_dir.glob(ext)])
 
     # Exclude images (take union over all pre_processors)
-    excluded_files = []
+    excluded_files = set()
     if template:
         for pp in template.pre_processors:
-            excluded_files.extend(Path(p) for p in pp.exclude_files())
+            excluded_files.update(normalize_path(p) for p in pp.exclude_files())
 
     local_evaluation_path = curr_dir.joinpath(constants.EVALUATION_FILENAME)
-    if not args["setLayout"] and os.path.exists(local_evaluation_path):
+    if not args["setLayout"] and directory_scan.has_evaluation:
         if not local_template_exists:
             logger.warning(
                 f"Found an evaluation file without a parent template file: {local_evaluation_path}"
@@ -121,11 +242,58 @@ def process_dir(
             tuning_config,
         )
 
-        excluded_files.extend(
-            Path(exclude_file) for exclude_file in evaluation_config.get_exclude_files()
+        excluded_files.update(
+            normalize_path(exclude_file)
+            for exclude_file in evaluation_config.get_exclude_files()
         )
 
-    omr_files = [f for f in omr_files if f not in excluded_files]
+    return template, tuning_config, evaluation_config, excluded_files
+
+
+def process_dir(
+    root_dir,
+    curr_dir,
+    args,
+    template=None,
+    tuning_config=CONFIG_DEFAULTS,
+    evaluation_config=None,
+    work_plan=None,
+    watch_contexts=None,
+    recursive=True,
+):
+    # A single scandir pass per directory, shared by the whole tree when planned
+    if work_plan is not None and curr_dir in work_plan:
+        directory_scan = work_plan[curr_dir]
+    else:
+        directory_scan = scan_directory(curr_dir)
+
+    local_config_path = curr_dir.joinpath(constants.CONFIG_FILENAME)
+    template, tuning_config, evaluation_config, excluded_files = load_directory_setup(
+        curr_dir, directory_scan, args, template, tuning_config, evaluation_config
+    )
+    # Look for subdirectories for processing
+    subdirs = directory_scan.subdirs
+
+    output_dir = Path(args["output_dir"], curr_dir.relative_to(root_dir))
+    paths = Paths(output_dir)
+
+    # look for images in current dir to process
+    omr_files = directory_scan.images
+
+    if args.get("shard") is not None:
+        omr_files = select_shard(
+            omr_files, args["shard"], args["shard_offsets"].get(curr_dir, 0)
+        )
+
+    if excluded_files:
+        omr_files = [f for f in omr_files if normalize_path(f) not in excluded_files]
+
+    watch_context = None
+    if watch_contexts is not None and template:
+        watch_context = WatchContext(
+            curr_dir, paths, template, tuning_config, evaluation_config, excluded_files
+        )
+        watch_contexts[curr_dir] = watch_context
 
     if omr_files:
         if not template:
@@ -139,7 +307,20 @@ def process_dir(
             )
 
         setup_dirs_for_paths(paths)
+        manifest = None
+        if not args["setLayout"]:
+            manifest = ProcessedFilesManifest(
+                paths.manifest_path,
+                curr_dir,
+                hash_template_setup(template, tuning_config, evaluation_config),
+            )
+            if args.get("resume", False):
+                # before the csv files get opened for appending
+                omr_files = filter_files_to_resume(omr_files, manifest, paths)
         outputs_namespace = setup_outputs_for_template(paths, template)
+        outputs_namespace.manifest = manifest
+        if watch_context is not None:
+            watch_context.outputs_namespace = outputs_namespace
 
         print_config_summary(
             curr_dir,
@@ -152,6 +333,8 @@ def process_dir(
         )
         if args["setLayout"]:
             show_template_layouts(omr_files, template, tuning_config)
+        elif not omr_files:
+            logger.info(f"All images in {curr_dir} are already processed.")
         else:
             process_files(
                 omr_files,
@@ -159,6 +342,9 @@ def process_dir(
                 tuning_config,
                 evaluation_config,
                 outputs_namespace,
+                PipelineOptions.from_args(args),
+                ProfileOptions.from_args(args),
+                MemoryOptions.from_args(args),
             )
 
     elif not subdirs:
@@ -169,7 +355,7 @@ def process_dir(
         )
 
     # recursively process sub-folders
-    for d in subdirs:
+    for d in subdirs if recursive else []:
         process_dir(
             root_dir,
             d,
@@ -177,7 +363,156 @@ def process_dir(
             template,
             tuning_config,
             evaluation_config,
+            work_plan,
+            watch_contexts,
+        )
+
+
+class WatchContext:
+    """Template, configs and outputs of a directory, kept warm for the images
+    that arrive in --watch mode"""
+
+    def __init__(
+        self, curr_dir, paths, template, tuning_config, evaluation_config, excluded_files
+    ):
+        self.curr_dir = curr_dir
+        self.paths = paths
+        self.template = template
+        self.tuning_config = tuning_config
+        self.evaluation_config = evaluation_config
+        self.excluded_files = excluded_files
+        # set up with the first image of the directory
+        self.outputs_namespace = None
+
+    def get_outputs_namespace(self):
+        if self.outputs_namespace is None:
+            setup_dirs_for_paths(self.paths)
+            self.outputs_namespace = setup_outputs_for_template(
+                self.paths, self.template
+            )
+            self.outputs_namespace.manifest = ProcessedFilesManifest(
+                self.paths.manifest_path,
+                self.curr_dir,
+                hash_template_setup(
+                    self.template, self.tuning_config, self.evaluation_config
+                ),
+            )
+        return self.outputs_namespace
+
+
+def watch_dir(input_dir, args, work_plan, watch_contexts):
+    known_files = {
+        file_path for directory_scan in work_plan for file_path in directory_scan.images
+    }
+    watcher = DirectoryWatcher(input_dir, known_files, settle_time=WATCH_SETTLE_TIME)
+    pipeline_options = PipelineOptions.from_args(args)
+    logger.info("")
+    logger.info(f"Watching '{input_dir}' for new images, press Ctrl+C to stop.")
+    try:
+        while True:
+            new_files = watcher.poll()
+            files_by_dir = {}
+            for file_path in new_files:
+                files_by_dir.setdefault(file_path.parent, []).append(file_path)
+            for curr_dir, omr_files in files_by_dir.items():
+                try:
+                    process_new_files(
+                        input_dir, curr_dir, omr_files, watch_contexts, pipeline_options
+                    )
+                except Exception:
+                    # one bad batch must not stop the daemon
+                    logger.exception(
+                        f"Failed to process {len(omr_files)} new image(s) in '{curr_dir}', still watching."
+                    )
+            if not new_files:
+                sleep(WATCH_POLL_INTERVAL)
+    except KeyboardInterrupt:
+        logger.info(f"Stopped watching '{input_dir}'.")
+
+
+def get_watch_context(input_dir, curr_dir, watch_contexts):
+    if curr_dir in watch_contexts:
+        return watch_contexts[curr_dir]
+    if curr_dir == input_dir or input_dir not in curr_dir.parents:
+        return None
+    parent_context = get_watch_context(input_dir, curr_dir.parent, watch_contexts)
+    if parent_context is None:
+        return None
+    directory_scan = scan_directory(curr_dir)
+    if (
+        directory_scan.has_template
+        or directory_scan.has_config
+        or directory_scan.has_evaluation
+    ):
+        logger.warning(
+            f"New directory '{curr_dir}' has its own json files, restart --watch to use them."
         )
+        return None
+    # a sub-directory created while watching inherits its parent's setup
+    watch_context = WatchContext(
+        curr_dir,
+        Paths(Path(parent_context.paths.output_dir, curr_dir.name)),
+        parent_context.template,
+        parent_context.tuning_config,
+        parent_context.evaluation_config,
+        parent_context.excluded_files,
+    )
+    watch_contexts[curr_dir] = watch_context
+    return watch_context
+
+
+def process_new_files(input_dir, curr_dir, omr_files, watch_contexts, pipeline_options):
+    watch_context = get_watch_context(input_dir, curr_dir, watch_contexts)
+    if watch_context is None:
+        logger.warning(
+            f"Skipping {len(omr_files)} new image(s) in '{curr_dir}': no template in its directory tree."
+        )
+        return
+    omr_files = [
+        file_path
+        for file_path in omr_files
+        if normalize_path(file_path) not in watch_context.excluded_files
+    ]
+    outputs_namespace = watch_context.get_outputs_namespace()
+    omr_files = outputs_namespace.manifest.filter_changed(omr_files)
+    if not omr_files:
+        return
+    logger.info(f"Found {len(omr_files)} new image(s) in '{curr_dir}'")
+    process_files(
+        omr_files,
+        watch_context.template,
+        watch_context.tuning_config,
+        watch_context.evaluation_config,
+        outputs_namespace,
+        pipeline_options,
+    )
+
+
+def filter_files_to_resume(omr_files, manifest, paths):
+    """Keeps the new or changed images and drops their rows left in the output
+    csv files by an earlier run, so that no sheet is listed twice"""
+    pending_files = manifest.filter_changed(omr_files)
+    logger.info(
+        f"Resuming: {len(omr_files) - len(pending_files)} of {len(omr_files)} image(s) are unchanged since the last run."
+    )
+    if not pending_files:
+        return pending_files
+
+    pending_paths = {normalize_path(file_path) for file_path in pending_files}
+    csv_paths = sorted(paths.results_dir.glob("Results_*.csv")) + [
+        paths.manual_dir.joinpath("MultiMarkedFiles.csv"),
+        paths.manual_dir.joinpath("ErrorFiles.csv"),
+    ]
+    for csv_path in csv_paths:
+        if os.path.exists(csv_path):
+            # the second column is the input_path
+            dropped = drop_csv_rows(
+                csv_path,
+                lambda row: len(row) > 1 and normalize_path(row[1]) in pending_paths,
+            )
+            if dropped > 0:
+                logger.info(f"Removed {dropped} outdated row(s) from '{csv_path}'")
+    return pending_files
 
 
 def show_template_layouts(omr_files, template, tuning_config):
@@ -196,143 +531,281 @@ def show_template_layouts(omr_files, template, tuning_config):
         )
 
 
+class OMRSheet:
+    """One input image as it moves through the decode -> read -> write stages"""
+
+    def __init__(self, files_counter, file_path, in_omr, started=None, context=None):
+        self.files_counter = files_counter
+        self.file_path = file_path
+        self.in_omr = in_omr
+        # perf_counter() when its decoding started
+        self.started = started
+        # entered by every stage of the sheet, see src/utils/instrumentation.py
+        self.context = context or SheetContext(file_path.name)
+        # set by read_omr_sheet, omr_response stays None if preprocessing failed
+        self.omr_response = None
+        self.final_marked = None
+        self.multi_marked = 0
+        # bubble intensities and thresholds, when outputs.save_raw_reads is on
+        self.raw_read = None
+
+
 def process_files(
     omr_files,
     template,
     tuning_config,
     evaluation_config,
     outputs_namespace,
+    pipeline_options=PipelineOptions(),
+    profile_options=ProfileOptions(),
+    memory_options=MemoryOptions(),
 ):
     start_time = int(time())
     files_counter = 0
     STATS.files_not_moved = 0
+    STAGE_TIMINGS.reset()
+    pipeline_options = pipeline_options.for_tuning_config(tuning_config)
+    save_dir = outputs_namespace.paths.save_marked_dir
+    raw_read_store = None
+    if tuning_config.outputs.save_raw_reads:
+        raw_read_store = RawReadStore(outputs_namespace.raw_reads_path)
+
+    profiler = None
+    if profile_options.enabled:
+        profiler = PipelineProfiler(
+            outputs_namespace.profile_path_prefix, profile_options
+        )
 
-    for file_path in omr_files:
-        files_counter += 1
-        file_name = file_path.name
+    memory_options = memory_options.for_tuning_config(tuning_config)
+    memory_monitor = MemoryMonitor(
+        memory_options,
+        [
+            (
+                "stopped keeping debug image stacks",
+                template.image_instance_ops.stop_keeping_debug_images,
+            )
+        ],
+    )
+
+    trace_attributes = {
+        "omr.output_dir": str(outputs_namespace.paths.output_dir),
+        "omr.template": str(template.path),
+        "omr.files": len(omr_files),
+    }
+
+    with profiler or nullcontext(), memory_monitor, TRACER.trace_pipeline(
+        "omr.directory", trace_attributes
+    ):
+        # The annotated images are flushed before this directory's stats get printed,
+        # the raw reads saved on the way out, also of the sheets written before a
+        # crash (--resume skips them)
+        with raw_read_store or nullcontext(), ArtifactWriter(
+            tuning_config.outputs, max_pending=2 * pipeline_options.queue_size
+        ) as artifact_writer:
+            # I/O thread -> compute workers -> this thread, in the order of omr_files
+            decoded_sheets = prefetch(
+                decode_omr_files(omr_files, tuning_config), pipeline_options.queue_size
+            )
 
-        in_omr = cv2.imread(str(file_path), cv2.IMREAD_GRAYSCALE)
+            def read_sheet(sheet):
+                with STAGE_TIMINGS.sheet(sheet.context):
+                    return read_omr_sheet(sheet, template, save_dir, artifact_writer)
 
-        logger.info("")
+            read_sheets = ordered_map(
+                read_sheet,
+                decoded_sheets,
+                pipeline_options.workers,
+                pipeline_options.queue_size,
+            )
+            for sheet in read_sheets:
+                files_counter += 1
+                with STAGE_TIMINGS.sheet(sheet.context):
+                    failed = True
+                    try:
+                        write_sheet_outputs(
+                            sheet,
+                            template,
+                            tuning_config,
+                            evaluation_config,
+                            outputs_namespace,
+                        )
+                        if raw_read_store is not None and sheet.raw_read:
+                            raw_read_store.add(sheet.file_path, sheet.raw_read)
+                        failed = False
+                    finally:
+                        if STAGE_TIMINGS.active:
+                            # from decoding to the csv row, the queue waits included
+                            STAGE_TIMINGS.record(
+                                "sheet", sheet.started, perf_counter(), failed
+                            )
+
+    print_stats(start_time, files_counter, tuning_config, memory_monitor.summary)
+    if memory_options.report or memory_options.tracemalloc:
+        memory_monitor.write_json(outputs_namespace.memory_path)
+
+    if profiler is not None:
+        print_hot_functions(profiler.summary)
         logger.info(
-            f"({files_counter}) Opening image: \t'{file_path}'\tResolution: {in_omr.shape}"
+            f"Saved the profile as '{outputs_namespace.profile_path_prefix}.prof' and '.collapsed.txt'"
         )
 
-        template.image_instance_ops.reset_all_save_img()
+    if STAGE_TIMINGS.enabled:
+        print_stage_timings()
+        STAGE_TIMINGS.write_json(outputs_namespace.stage_timings_path)
 
-        template.image_instance_ops.append_save_img(1, in_omr)
 
-        in_omr = template.image_instance_ops.apply_preprocessors(
-            file_path, in_omr, template
-        )
+def decode_omr_files(omr_files, tuning_config):
+    for files_counter, file_path in enumerate(omr_files, start=1):
+        started = perf_counter()
+        context = SheetContext(file_path.name)
+        with STAGE_TIMINGS.sheet(context):
+            with STAGE_TIMINGS.measure("decode"):
+                in_omr = decode_image(file_path, tuning_config)
+            if in_omr is not None:
+                STAGE_TIMINGS.annotate("omr.image.height", in_omr.shape[0])
+                STAGE_TIMINGS.annotate("omr.image.width", in_omr.shape[1])
+        yield OMRSheet(files_counter, file_path, in_omr, started, context)
 
-        if in_omr is None:
-            # Error OMR case
-            new_file_path = outputs_namespace.paths.errors_dir.joinpath(file_name)
-            outputs_namespace.OUTPUT_SET.append(
-                [file_name] + outputs_namespace.empty_resp
-            )
-            if check_and_move(
-                constants.ERROR_CODES.NO_MARKER_ERR, file_path, new_file_path
-            ):
-                err_line = [
-                    file_name,
-                    file_path,
-                    new_file_path,
-                    "NA",
-                ] + outputs_namespace.empty_resp
-                pd.DataFrame(err_line, dtype=str).T.to_csv(
-                    outputs_namespace.files_obj["Errors"],
-                    mode="a",
-                    quoting=QUOTE_NONNUMERIC,
-                    header=False,
-                    index=False,
-                )
-            continue
-
-        # uniquify
-        file_id = str(file_name)
-        save_dir = outputs_namespace.paths.save_marked_dir
-        (
-            response_dict,
-            final_marked,
-            multi_marked,
-            _,
-        ) = template.image_instance_ops.read_omr_response(
-            template, image=in_omr, name=file_id, save_dir=save_dir
-        )
 
-        # TODO: move inner try catch here
-        # concatenate roll nos, set unmarked responses, etc
-        omr_response = get_concatenated_response(response_dict, template)
+def read_omr_sheet(sheet, template, save_dir, artifact_writer=None):
+    file_path, in_omr = sheet.file_path, sheet.in_omr
+    # the decoded image is not needed past this stage
+    sheet.in_omr = None
 
-        if (
-            evaluation_config is None
-            or not evaluation_config.get_should_explain_scoring()
-        ):
-            logger.info(f"Read Response: \n{omr_response}")
+    logger.info("")
+    if in_omr is None:
+        # e.g. a truncated or corrupt image, it goes to the Errors csv
+        logger.error(f"({sheet.files_counter}) Could not decode image: '{file_path}'")
+        return sheet
+    logger.info(
+        f"({sheet.files_counter}) Opening image: \t'{file_path}'\tResolution: {in_omr.shape}"
+    )
+
+    template.image_instance_ops.reset_all_save_img()
+
+    template.image_instance_ops.append_save_img(1, in_omr)
+
+    in_omr = template.image_instance_ops.apply_preprocessors(
+        file_path, in_omr, template
+    )
+
+    if in_omr is None:
+        return sheet
+
+    # uniquify
+    file_id = str(file_path.name)
+    if template.image_instance_ops.tuning_config.outputs.save_raw_reads:
+        sheet.raw_read = {}
+    (
+        response_dict,
+        sheet.final_marked,
+        sheet.multi_marked,
+        _,
+    ) = template.image_instance_ops.read_omr_response(
+        template,
+        image=in_omr,
+        name=file_id,
+        save_dir=save_dir,
+        artifact_writer=artifact_writer,
+        raw_read=sheet.raw_read,
+    )
+
+    # TODO: move inner try catch here
+    # concatenate roll nos, set unmarked responses, etc
+    sheet.omr_response = get_concatenated_response(response_dict, template)
+    return sheet
 
-        score = 0
-        if evaluation_config is not None:
+
+def write_sheet_outputs(
+    sheet, template, tuning_config, evaluation_config, outputs_namespace
+):
+    files_counter, file_path = sheet.files_counter, sheet.file_path
+    file_name = file_path.name
+    omr_response = sheet.omr_response
+
+    if omr_response is None:
+        # Error OMR case
+        new_file_path = outputs_namespace.paths.errors_dir.joinpath(file_name)
+        if check_and_move(constants.ERROR_CODES.NO_MARKER_ERR, file_path, new_file_path):
+            err_line = [
+                file_name,
+                file_path,
+                new_file_path,
+                "NA",
+            ] + outputs_namespace.empty_resp
+            append_csv_rows(outputs_namespace.files_obj["Errors"], [err_line])
+        record_processed_file(outputs_namespace, file_path, OUTCOME_ERROR)
+        return
+
+    file_id = str(file_name)
+    save_dir = outputs_namespace.paths.save_marked_dir
+
+    if evaluation_config is None or not evaluation_config.get_should_explain_scoring():
+        logger.info(f"Read Response: \n{omr_response}")
+
+    score = 0
+    if evaluation_config is not None:
+        with STAGE_TIMINGS.measure("evaluate"):
             score = evaluate_concatenated_response(
-                omr_response, evaluation_config, file_path, outputs_namespace.paths.evaluation_dir
-            )
-            logger.info(
-                f"(/{files_counter}) Graded with score: {round(score, 2)}\t for file: '{file_id}'"
+                omr_response,
+                evaluation_config,
+                file_path,
+                outputs_namespace.paths.evaluation_dir,
             )
-        else:
-            logger.info(f"(/{files_counter}) Processed file: '{file_id}'")
+        logger.info(
+            f"(/{files_counter}) Graded with score: {round(score, 2)}\t for file: '{file_id}'"
+        )
+    else:
+        logger.info(f"(/{files_counter}) Processed file: '{file_id}'")
 
-        if tuning_config.outputs.show_image_level >= 2:
-            InteractionUtils.show(
-                f"Final Marked Bubbles : '{file_id}'",
-                ImageUtils.resize_util_h(
-                    final_marked, int(tuning_config.dimensions.display_height * 1.3)
-                ),
-                1,
-                1,
-                config=tuning_config,
-            )
+    if tuning_config.outputs.show_image_level >= 2:
+        InteractionUtils.show(
+            f"Final Marked Bubbles : '{file_id}'",
+            ImageUtils.resize_util_h(
+                sheet.final_marked, int(tuning_config.dimensions.display_height * 1.3)
+            ),
+            1,
+            1,
+            config=tuning_config,
+        )
 
-        resp_array = []
-        for k in template.output_columns:
-            resp_array.append(omr_response[k])
-
-        outputs_namespace.OUTPUT_SET.append([file_name] + resp_array)
-
-        if multi_marked == 0 or not tuning_config.outputs.filter_out_multimarked_files:
-            STATS.files_not_moved += 1
-            new_file_path = save_dir.joinpath(file_id)
-            # Enter into Results sheet-
-            results_line = [file_name, file_path, new_file_path, score] + resp_array
-            # Write/Append to results_line file(opened in append mode)
-            pd.DataFrame(results_line, dtype=str).T.to_csv(
-                outputs_namespace.files_obj["Results"],
-                mode="a",
-                quoting=QUOTE_NONNUMERIC,
-                header=False,
-                index=False,
-            )
-        else:
-            # multi_marked file
-            logger.info(f"[{files_counter}] Found multi-marked file: '{file_id}'")
-            new_file_path = outputs_namespace.paths.multi_marked_dir.joinpath(file_name)
-            if check_and_move(
-                constants.ERROR_CODES.MULTI_BUBBLE_WARN, file_path, new_file_path
-            ):
-                mm_line = [file_name, file_path, new_file_path, "NA"] + resp_array
-                pd.DataFrame(mm_line, dtype=str).T.to_csv(
-                    outputs_namespace.files_obj["MultiMarked"],
-                    mode="a",
-                    quoting=QUOTE_NONNUMERIC,
-                    header=False,
-                    index=False,
-                )
-            # else:
-            #     TODO:  Add appropriate record handling here
-            #     pass
-
-    print_stats(start_time, files_counter, tuning_config)
+    resp_array = []
+    for k in template.output_columns:
+        resp_array.append(omr_response[k])
+
+    if (
+        sheet.multi_marked == 0
+        or not tuning_config.outputs.filter_out_multimarked_files
+    ):
+        STATS.files_not_moved += 1
+        new_file_path = save_dir.joinpath(
+            get_output_file_name(file_id, tuning_config.outputs)
+        )
+        # Enter into Results sheet-
+        results_line = [file_name, file_path, new_file_path, score] + resp_array
+        # Write/Append to results_line file(opened in append mode)
+        append_csv_rows(outputs_namespace.files_obj["Results"], [results_line])
+        record_processed_file(outputs_namespace, file_path, OUTCOME_RESULTS)
+    else:
+        # multi_marked file
+        logger.info(f"[{files_counter}] Found multi-marked file: '{file_id}'")
+        new_file_path = outputs_namespace.paths.multi_marked_dir.joinpath(file_name)
+        if check_and_move(
+            constants.ERROR_CODES.MULTI_BUBBLE_WARN, file_path, new_file_path
+        ):
+            mm_line = [file_name, file_path, new_file_path, "NA"] + resp_array
+            append_csv_rows(outputs_namespace.files_obj["MultiMarked"], [mm_line])
+        # else:
+        #     TODO:  Add appropriate record handling here
+        #     pass
+        record_processed_file(outputs_namespace, file_path, OUTCOME_MULTI_MARKED)
+
+
+def record_processed_file(outputs_namespace, file_path, outcome):
+    STAGE_TIMINGS.annotate("omr.outcome", outcome)
+    # after the csv rows, so a crash in between only makes --resume redo the sheet
+    if outputs_namespace.manifest is not None:
+        outputs_namespace.manifest.record(file_path, outcome)
 
 
 def check_and_move(error_code, file_path, filepath2):
@@ -341,7 +814,7 @@ def check_and_move(error_code, file_path, filepath2):
     return True
 
 
-def print_stats(start_time, files_counter, tuning_config):
+def print_stats(start_time, files_counter, tuning_config, memory_summary=None):
     time_checking = max(1, round(time() - start_time, 2))
     log = logger.info
     log("")
@@ -365,7 +838,48 @@ def print_stats(start_time, files_counter, tuning_config):
     else:
         log(f"\n{'Total script time': <27}: {time_checking} seconds")
 
+    if memory_summary is not None and memory_summary["peak_rss_mb"] is not None:
+        log(
+            f"{'Peak RSS': <27}: \t ~ {memory_summary['peak_rss_mb']} MB"
+            + (
+                f" (above {memory_summary['max_rss_mb']} MB, "
+                f"{', '.join(memory_summary['degraded'])})"
+                if memory_summary["limit_hit"]
+                else ""
+            )
+        )
+
     if tuning_config.outputs.show_image_level <= 1:
         log(
             "\nTip: To see some awesome visuals, open config.json and increase 'show_image_level'"
         )
+
+
+def print_hot_functions(profile_summary):
+    table = Table(title="Hot Functions (own time)", show_lines=False)
+    table.add_column("Function", style="cyan", no_wrap=True)
+    for column in ["calls", "own (ms)", "cumulative (ms)"]:
+        table.add_column(column, justify="right", style="magenta")
+    for hot_function in profile_summary["hot_functions"]:
+        table.add_row(
+            hot_function["function"],
+            str(hot_function["calls"]),
+            f"{hot_function['own_s'] * 1000:.1f}",
+            f"{hot_function['cumulative_s'] * 1000:.1f}",
+        )
+    console.print(table, justify="center")
+
+
+def print_stage_timings():
+    table = Table(title="Stage Timings (ms)", show_lines=False)
+    table.add_column("Stage", style="cyan", no_wrap=True)
+    for column in ["count", "fails", "mean", "p50", "p95", "max"]:
+        table.add_column(column, justify="right", style="magenta")
+    for stage, stats in STAGE_TIMINGS.summary().items():
+        table.add_row(
+            stage,
+            str(stats["count"]),
+            str(stats["failures"]),
+            *[f"{stats[key] * 1000:.1f}" for key in ["mean", "p50", "p95", "max"]],
+        )
+    console.print(table, justify="center")
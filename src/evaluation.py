@@ -1,11 +1,11 @@
 import ast
+import csv
 import os
 import re
 from copy import deepcopy
-from csv import QUOTE_NONNUMERIC
 
 import cv2
-import pandas as pd
+import numpy as np
 from rich.table import Table
 
 from src.logger import console, logger
@@ -14,6 +14,7 @@ from src.schemas.constants import (
     DEFAULT_SECTION_KEY,
     MARKING_VERDICT_TYPES,
 )
+from src.utils.file import append_csv_rows
 from src.utils.parsing import (
     get_concatenated_response,
     open_evaluation_with_validation,
@@ -186,6 +187,68 @@ class SectionMarkingScheme:
         return verdict_marking, question_verdict
 
 
+class CompiledAnswerKey:
+    """The answer key as arrays, for scoring many responses at once.
+
+    Every answer string that can earn a verdict other than "incorrect" gets a
+    code (1 is the empty value, 0 is any other answer), and marks[q, code] holds
+    the delta of question q for that code. Scoring a batch is then one fancy
+    index into marks with the N x Q matrix of response codes.
+    """
+
+    def __init__(self, questions_in_order, question_to_answer_matcher, empty_val):
+        self.questions_in_order = questions_in_order
+        self.answer_codes = {empty_val: 1}
+        for question in questions_in_order:
+            for allowed_answer in self.get_allowed_answers(
+                question_to_answer_matcher[question]
+            ):
+                self.answer_codes.setdefault(allowed_answer, len(self.answer_codes) + 1)
+
+        self.marks = np.empty(
+            (len(questions_in_order), len(self.answer_codes) + 1), dtype=np.float64
+        )
+        for question_index, question in enumerate(questions_in_order):
+            answer_matcher = question_to_answer_matcher[question]
+            self.marks[question_index, 0] = answer_matcher.marking["incorrect"]
+            for answer, code in self.answer_codes.items():
+                _verdict, delta = answer_matcher.get_verdict_marking(answer)
+                self.marks[question_index, code] = delta
+        self.question_indices = np.arange(len(questions_in_order))
+
+    @staticmethod
+    def get_allowed_answers(answer_matcher):
+        answer_type, answer_item = answer_matcher.answer_type, answer_matcher.answer_item
+        if answer_type == "standard":
+            return [answer_item]
+        if answer_type == "multiple-correct":
+            return answer_item
+        return [allowed_answer for allowed_answer, _answer_score in answer_item]
+
+    def encode_responses(self, omr_responses):
+        answer_codes = self.answer_codes
+        codes = np.fromiter(
+            (
+                answer_codes.get(omr_response[question], 0)
+                for omr_response in omr_responses
+                for question in self.questions_in_order
+            ),
+            dtype=np.intp,
+            count=len(omr_responses) * len(self.questions_in_order),
+        )
+        return codes.reshape(len(omr_responses), len(self.questions_in_order))
+
+    def score_codes(self, codes):
+        deltas = self.marks[self.question_indices, codes]
+        if deltas.shape[1] == 0:
+            return np.zeros(deltas.shape[0])
+        # cumsum adds in question order, like the per-question loop does
+        return np.cumsum(deltas, axis=1)[:, -1]
+
+    def score_responses(self, omr_responses):
+        return self.score_codes(self.encode_responses(omr_responses))
+
+
 class EvaluationConfig:
     """Note: this instance will be reused for multiple omr sheets"""
 
@@ -210,15 +273,13 @@ class EvaluationConfig:
             answer_key_image_path = options.get("answer_key_image_path", None)
             if os.path.exists(csv_path):
                 # TODO: CSV parsing/validation for each row with a (qNo, <ans string/>) pair
-                answer_key = pd.read_csv(
-                    csv_path,
-                    header=None,
-                    names=["question", "answer"],
-                    converters={"question": str, "answer": self.parse_answer_column},
-                )
+                with open(csv_path, newline="") as f:
+                    answer_key = [row for row in csv.reader(f) if row]
 
-                self.questions_in_order = answer_key["question"].to_list()
-                answers_in_order = answer_key["answer"].to_list()
+                self.questions_in_order = [row[0] for row in answer_key]
+                answers_in_order = [
+                    self.parse_answer_column(row[1]) for row in answer_key
+                ]
             elif not answer_key_image_path:
                 raise Exception(f"Answer key csv not found at '{csv_path}'")
             else:
@@ -315,6 +376,11 @@ class EvaluationConfig:
             answers_in_order
         )
         self.validate_answers(answers_in_order, tuning_config)
+        self.compiled_answer_key = CompiledAnswerKey(
+            self.questions_in_order,
+            self.question_to_answer_matcher,
+            template.global_empty_val,
+        )
 
     def __str__(self):
         return str(self.path)
@@ -363,19 +429,16 @@ class EvaluationConfig:
     # Explanation Table to CSV
     def conditionally_save_explanation_csv(self, file_path, evaluation_output_dir):
         if self.enable_evaluation_table_to_csv:
-            data = {col.header: col._cells for col in self.explanation_table.columns}
+            columns = self.explanation_table.columns
+            header = [col.header for col in columns]
+            rows = list(zip(*(col._cells for col in columns)))
 
             output_path = os.path.join(
                 evaluation_output_dir,
                 f"{file_path.stem}_evaluation.csv",
             )
 
-            pd.DataFrame(data, dtype=str).to_csv(
-                output_path,
-                mode="a",
-                quoting=QUOTE_NONNUMERIC,
-                index=False,
-            )
+            append_csv_rows(output_path, [header] + rows)
 
     def get_should_explain_scoring(self):
         return self.should_explain_scoring
@@ -532,6 +595,17 @@ def evaluate_concatenated_response(
     concatenated_response, evaluation_config, file_path, evaluation_output_dir
 ):
     evaluation_config.prepare_and_validate_omr_response(concatenated_response)
+    if not (
+        evaluation_config.should_explain_scoring
+        or evaluation_config.enable_evaluation_table_to_csv
+    ):
+        # no explanation rows needed
+        return float(
+            evaluation_config.compiled_answer_key.score_responses(
+                [concatenated_response]
+            )[0]
+        )
+
     current_score = 0.0
     for question in evaluation_config.questions_in_order:
         marked_answer = concatenated_response[question]
@@ -544,3 +618,17 @@ def evaluate_concatenated_response(
     evaluation_config.conditionally_save_explanation_csv(file_path, evaluation_output_dir)
 
     return current_score
+
+
+def evaluate_concatenated_responses(concatenated_responses, evaluation_config):
+    """Scores a batch of responses without explanations, returns an array of
+    the scores"""
+    try:
+        return evaluation_config.compiled_answer_key.score_responses(
+            concatenated_responses
+        )
+    except KeyError:
+        for concatenated_response in concatenated_responses:
+            # raises for the first response with missing questions
+            evaluation_config.prepare_and_validate_omr_response(concatenated_response)
+        raise
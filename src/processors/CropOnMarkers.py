@@ -6,6 +6,7 @@ import numpy as np
 from src.logger import logger
 from src.processors.interfaces.ImagePreprocessor import ImagePreprocessor
 from src.utils.image import ImageUtils
+from src.utils.instrumentation import STAGE_TIMINGS
 from src.utils.interaction import InteractionUtils
 
 
@@ -128,6 +129,7 @@ class CropOnMarkers(ImagePreprocessor):
 
         logger.info(quarter_match_log)
         logger.info(f"Optimal Scale: {best_scale}")
+        STAGE_TIMINGS.annotate("omr.marker_scale", best_scale)
         # analysis data
         self.threshold_circles.append(sum_t / 4)
 
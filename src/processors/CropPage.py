@@ -52,12 +52,33 @@ class CropPage(ImagePreprocessor):
         self.morph_kernel = tuple(
             int(x) for x in cropping_ops.get("morphKernel", [10, 10])
         )
+        # Detect the page on a downscaled copy, 1 keeps full resolution detection
+        self.downscale_factor = int(cropping_ops.get("downscaleFactor", 1))
+        self.refine_corners = cropping_ops.get("refineCorners", True)
+        # half window of the corner refinement, it has to cover the rounding of
+        # the rescaled corners: at least 3 pixels of the downscaled image
+        min_refine_window = 3 * self.downscale_factor
+        self.refine_window = int(
+            cropping_ops.get("refineWindow", max(5, min_refine_window))
+        )
+        if (
+            self.refine_corners
+            and self.downscale_factor > 1
+            and self.refine_window < min_refine_window
+        ):
+            logger.warning(
+                f"CropPage: refineWindow {self.refine_window} is below 3 x downscaleFactor, using {min_refine_window}"
+            )
+            self.refine_window = min_refine_window
 
     def apply_filter(self, image, file_path):
         image = normalize(cv2.GaussianBlur(image, (3, 3), 0))
 
         # Resize should be done with another preprocessor is needed
-        sheet = self.find_page(image, file_path)
+        if self.downscale_factor > 1:
+            sheet = self.find_page_downscaled(image, file_path)
+        else:
+            sheet = self.find_page(image, file_path)
         if len(sheet) == 0:
             logger.error(
                 f"\tError: Paper boundary not found for: '{file_path}'\nHave you accidentally included CropPage preprocessor?"
@@ -73,14 +94,50 @@ class CropPage(ImagePreprocessor):
         return image
 
     def find_page(self, image, file_path):
+        # Note: image is already normalized in apply_filter
+        sheet = self.find_page_quadrilateral(
+            image, self.morph_kernel, MIN_PAGE_AREA, cv2.RETR_LIST, "edge"
+        )
+        return [] if sheet is None else sheet
+
+    def find_page_downscaled(self, image, file_path):
+        factor = self.downscale_factor
+        h, w = image.shape[:2]
+        small = cv2.resize(
+            image,
+            (max(1, w // factor), max(1, h // factor)),
+            interpolation=cv2.INTER_AREA,
+        )
+        # Only the outer boundaries matter for the page, skip the inner contours
+        approx = self.find_page_quadrilateral(
+            normalize(small),
+            tuple(max(1, k // factor) for k in self.morph_kernel),
+            MIN_PAGE_AREA / (factor * factor),
+            cv2.RETR_EXTERNAL,
+            "edge (downscaled)",
+        )
+        if approx is None:
+            return []
+        # map pixel centres of the small image back to full resolution
+        corners = (approx.astype(np.float32) + 0.5) * factor
+        corners -= 0.5
+        corners[:, 0] = np.clip(corners[:, 0], 0, w - 1)
+        corners[:, 1] = np.clip(corners[:, 1], 0, h - 1)
+        if self.refine_corners:
+            corners = self.refine_page_corners(image, corners)
+        return corners
+
+    def find_page_quadrilateral(
+        self, image, morph_kernel, min_area, contour_mode, window_name
+    ):
+        """The 4 corners of the largest rectangular contour of a normalized
+        image, None when there is none"""
         config = self.tuning_config
 
-        image = normalize(image)
-
         _ret, image = cv2.threshold(image, 200, 255, cv2.THRESH_TRUNC)
         image = normalize(image)
 
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, self.morph_kernel)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, morph_kernel)
 
         # Close the small holes, i.e. Complete the edges on canny image
         closed = cv2.morphologyEx(image, cv2.MORPH_CLOSE, kernel)
@@ -88,25 +145,35 @@ class CropPage(ImagePreprocessor):
         edge = cv2.Canny(closed, 185, 55)
 
         if config.outputs.show_image_level >= 5:
-            InteractionUtils.show("edge", edge, config=config)
+            InteractionUtils.show(window_name, edge, config=config)
 
         # findContours returns outer boundaries in CW and inner ones, ACW.
         cnts = ImageUtils.grab_contours(
-            cv2.findContours(edge, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            cv2.findContours(edge, contour_mode, cv2.CHAIN_APPROX_SIMPLE)
         )
         # convexHull to resolve disordered curves due to noise
         cnts = [cv2.convexHull(c) for c in cnts]
         cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:5]
-        sheet = []
         for c in cnts:
-            if cv2.contourArea(c) < MIN_PAGE_AREA:
+            if cv2.contourArea(c) < min_area:
                 continue
             peri = cv2.arcLength(c, True)
             approx = cv2.approxPolyDP(c, epsilon=0.025 * peri, closed=True)
             if validate_rect(approx):
-                sheet = np.reshape(approx, (4, -1))
-                cv2.drawContours(image, [approx], -1, (0, 255, 0), 2)
-                cv2.drawContours(edge, [approx], -1, (255, 255, 255), 10)
-                break
-
-        return sheet
+                return np.reshape(approx, (4, -1))
+
+        return None
+
+    def refine_page_corners(self, image, corners):
+        # Search a small full resolution window around each rescaled corner,
+        # rounding in the downscaled image can misplace it by a couple of pixels
+        half_window = self.refine_window
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.1)
+        refined = cv2.cornerSubPix(
+            image,
+            corners.reshape(-1, 1, 2).copy(),
+            (half_window, half_window),
+            (-1, -1),
+            criteria,
+        )
+        return refined.reshape(4, 2)
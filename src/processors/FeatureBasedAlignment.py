@@ -2,6 +2,8 @@
 Image based feature alignment
 Credits: https://www.learnopencv.com/image-alignment-feature-based-using-opencv-c-python/
 """
+import threading
+
 import cv2
 import numpy as np
 
@@ -11,6 +13,8 @@ from src.utils.interaction import InteractionUtils
 
 
 class FeatureBasedAlignment(ImagePreprocessor):
+    normalizes_input = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         options = self.options
@@ -33,6 +37,15 @@ class FeatureBasedAlignment(ImagePreprocessor):
         self.to_keypoints, self.to_descriptors = self.orb.detectAndCompute(
             self.ref_img, None
         )
+        self.thread_local = threading.local()
+
+    def get_orb(self):
+        # OpenCV detectors are not documented as thread safe, sheets can be
+        # aligned on several worker threads (see src/utils/streaming.py)
+        orb = getattr(self.thread_local, "orb", None)
+        if orb is None:
+            orb = self.thread_local.orb = cv2.ORB_create(self.max_features)
+        return orb
 
     def __str__(self):
         return self.ref_path.name
@@ -46,10 +59,11 @@ class FeatureBasedAlignment(ImagePreprocessor):
         # im1Gray = cv2.cvtColor(im1, cv2.COLOR_BGR2GRAY)
         # im2Gray = cv2.cvtColor(im2, cv2.COLOR_BGR2GRAY)
 
-        image = cv2.normalize(image, 0, 255, norm_type=cv2.NORM_MINMAX)
+        if not self.skip_input_normalization:
+            image = cv2.normalize(image, 0, 255, norm_type=cv2.NORM_MINMAX)
 
         # Detect ORB features and compute descriptors.
-        from_keypoints, from_descriptors = self.orb.detectAndCompute(image, None)
+        from_keypoints, from_descriptors = self.get_orb().detectAndCompute(image, None)
 
         # Match features.
         matcher = cv2.DescriptorMatcher_create(
@@ -32,6 +32,9 @@ class Levels(ImagePreprocessor):
     def apply_filter(self, image, _file_path):
         return cv2.LUT(image, self.gamma)
 
+    def get_lookup_table(self):
+        return self.gamma
+
 
 class MedianBlur(ImagePreprocessor):
     def __init__(self, *args, **kwargs):
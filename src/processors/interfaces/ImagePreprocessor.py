@@ -5,13 +5,22 @@ from src.processors.manager import Processor
 class ImagePreprocessor(Processor):
     """Base class for an extension that applies some preprocessing to the input image"""
 
+    # Set when apply_filter starts with a min-max normalization of its input
+    normalizes_input = False
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Set by the pipeline compiler when the input arrives already normalized
+        self.skip_input_normalization = False
 
     def apply_filter(self, image, filename):
         """Apply filter to the image and returns modified image"""
         raise NotImplementedError
 
+    def get_lookup_table(self):
+        """Returns a 256 entries uint8 table if the filter is a pure intensity mapping"""
+        return None
+
     @staticmethod
     def exclude_files():
         """Returns a list of file paths that should be excluded from processing"""
@@ -2,11 +2,38 @@
 Processor/Extension framework
 Adapated from https://github.com/gdiepen/python_processor_example
 """
+import importlib
 import inspect
-import pkgutil
+import threading
+from collections.abc import Mapping
 
 from src.logger import logger
 
+# Name used in template.json -> "module:Class", imported on first use
+BUILTIN_PROCESSORS = {
+    "CornerAlignment": "src.processors.CornerAlignment:CornerAlignment",
+    "CropOnMarkers": "src.processors.CropOnMarkers:CropOnMarkers",
+    "CropPage": "src.processors.CropPage:CropPage",
+    "FeatureBasedAlignment": "src.processors.FeatureBasedAlignment:FeatureBasedAlignment",
+    "GaussianBlur": "src.processors.builtins:GaussianBlur",
+    "Levels": "src.processors.builtins:Levels",
+    "MedianBlur": "src.processors.builtins:MedianBlur",
+}
+
+# Installed packages can provide more processors under this entry point group,
+# e.g. in pyproject.toml: [project.entry-points."omr_checker.processors"]
+PLUGIN_ENTRY_POINT_GROUP = "omr_checker.processors"
+
+
+def get_entry_points(group):
+    from importlib.metadata import entry_points
+
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, "select"):
+        return all_entry_points.select(group=group)
+    # a dict of the groups before Python 3.10, without the group= keyword
+    return all_entry_points.get(group, [])
+
 
 class Processor:
     """Base class that each processor must inherit from."""
@@ -24,56 +51,84 @@ class Processor:
         self.description = "UNKNOWN"
 
 
-class ProcessorManager:
-    """Upon creation, this class will read the processors package for modules
-    that contain a class definition that is inheriting from the Processor class
-    """
-
-    def __init__(self, processors_dir="src.processors"):
-        """Constructor that initiates the reading of all available processors
-        when an instance of the ProcessorCollection object is created
-        """
-        self.processors_dir = processors_dir
-        self.reload_processors()
-
-    @staticmethod
-    def get_name_filter(processor_name):
-        def filter_function(member):
-            return inspect.isclass(member) and member.__module__ == processor_name
+class ProcessorRegistry(Mapping):
+    """Read-only mapping of processor names to classes. A processor module is
+    imported the first time its name is looked up, plugin entry points are
+    only scanned for names missing from the static map."""
 
-        return filter_function
+    def __init__(self, processor_paths, entry_point_group=None):
+        self.processor_paths = dict(processor_paths)
+        self.entry_point_group = entry_point_group
+        self.plugins_discovered = entry_point_group is None
+        self.loaded = {}
+        self.lock = threading.Lock()
 
-    def reload_processors(self):
-        """Reset the list of all processors and initiate the walk over the main
-        provided processor package to load all available processors
-        """
-        self.processors = {}
-        self.seen_paths = []
-
-        logger.info(f'Loading processors from "{self.processors_dir}"...')
-        self.walk_package(self.processors_dir)
-
-    def walk_package(self, package):
-        """walk the supplied package to retrieve all processors"""
-        imported_package = __import__(package, fromlist=["blah"])
-        loaded_packages = []
-        for _, processor_name, ispkg in pkgutil.walk_packages(
-            imported_package.__path__, imported_package.__name__ + "."
-        ):
-            if not ispkg and processor_name != __name__:
-                processor_module = __import__(processor_name, fromlist=["blah"])
-                # https://stackoverflow.com/a/46206754/6242649
-                clsmembers = inspect.getmembers(
-                    processor_module,
-                    ProcessorManager.get_name_filter(processor_name),
+    def discover_plugins(self):
+        if self.plugins_discovered:
+            return
+        self.plugins_discovered = True
+        for entry_point in get_entry_points(self.entry_point_group):
+            if entry_point.name in self.processor_paths:
+                logger.warning(
+                    f'Ignoring plugin processor "{entry_point.name}" ({entry_point.value}): name already taken'
                 )
-                for _, c in clsmembers:
-                    # Only add classes that are a sub class of Processor, but NOT Processor itself
-                    if issubclass(c, Processor) & (c is not Processor):
-                        self.processors[c.__name__] = c
-                        loaded_packages.append(c.__name__)
+                continue
+            self.processor_paths[entry_point.name] = entry_point.value
+
+    def __getitem__(self, name):
+        processor = self.loaded.get(name)
+        if processor is not None:
+            return processor
+        with self.lock:
+            if name not in self.loaded:
+                self.loaded[name] = self.load(name)
+            return self.loaded[name]
+
+    def load(self, name):
+        if name not in self.processor_paths:
+            self.discover_plugins()
+        if name not in self.processor_paths:
+            raise KeyError(name)
+        module_name, class_name = self.processor_paths[name].split(":")
+        processor = getattr(importlib.import_module(module_name), class_name)
+        if not (inspect.isclass(processor) and issubclass(processor, Processor)):
+            raise TypeError(
+                f"'{self.processor_paths[name]}' is not a sub class of Processor"
+            )
+        return processor
+
+    def __contains__(self, name):
+        if name not in self.processor_paths:
+            self.discover_plugins()
+        return name in self.processor_paths
 
-        logger.info(f"Loaded processors: {loaded_packages}")
+    def __iter__(self):
+        self.discover_plugins()
+        return iter(self.processor_paths)
+
+    def __len__(self):
+        self.discover_plugins()
+        return len(self.processor_paths)
+
+
+class ProcessorManager:
+    """Holds the registry of available processors. Nothing is imported upfront,
+    see ProcessorRegistry"""
+
+    def __init__(
+        self,
+        processor_paths=BUILTIN_PROCESSORS,
+        entry_point_group=PLUGIN_ENTRY_POINT_GROUP,
+    ):
+        self.processor_paths = processor_paths
+        self.entry_point_group = entry_point_group
+        self.reload_processors()
+
+    def reload_processors(self):
+        """Reset the registry, processors get imported again on next use"""
+        self.processors = ProcessorRegistry(
+            self.processor_paths, self.entry_point_group
+        )
 
 
 # Singleton export
@@ -0,0 +1,169 @@
+"""
+Compiles the pre_processors chain of a template into fused steps.
+
+The compiled pipeline runs once per sheet instead of the plain sequential loop:
+- consecutive pure intensity mappings (Levels) are folded into one lookup table
+- a min-max normalization at the start of the next processor is merged into
+  that lookup table (the folded table is monotonic, so the stretch is known
+  from the input's min and max)
+- the processing resize writes into a per-thread preallocated buffer that is
+  reused across sheets, and fused lookups are applied in place on it
+"""
+import threading
+
+import cv2
+import numpy as np
+
+from src.utils.instrumentation import STAGE_TIMINGS
+
+IDENTITY_LUT = np.arange(256, dtype=np.uint8)
+
+
+def is_monotonic_lut(table):
+    return bool(np.all(np.diff(table.astype(np.int16)) >= 0))
+
+
+def stretch_lut(table, low, high):
+    # cv2.normalize(NORM_MINMAX) into [0, 255] is a convertTo with this scale and
+    # shift, convertScaleAbs rounds the same way (the abs never applies within
+    # [low, high]), a float64 rint differs by 1 at some rounding ties
+    scale = 255.0 / (high - low) if high > low else 0.0
+    return cv2.convertScaleAbs(
+        np.clip(table, low, high), alpha=scale, beta=-low * scale
+    ).reshape(table.shape)
+
+
+class ResizeStep:
+    def __init__(self, width, height, buffers):
+        self.dimensions = (int(width), int(height))
+        self.buffers = buffers
+
+    def __str__(self):
+        return f"Resize{self.dimensions}"
+
+    def apply(self, image, _file_path, owned):
+        width, height = self.dimensions
+        if image.shape[:2] == (height, width):
+            # Nothing to resample, avoid the extra full page copy
+            return image, owned
+        buffer = self.buffers.get("resize", (height, width) + image.shape[2:], image.dtype)
+        cv2.resize(image, (width, height), dst=buffer)
+        return buffer, True
+
+
+class FusedLookupStep:
+    def __init__(self, pre_processors, table):
+        self.pre_processors = pre_processors
+        self.table = table
+        self.normalize_output = False
+
+    def __str__(self):
+        names = "+".join(pp.__class__.__name__ for pp in self.pre_processors)
+        return f"FusedLUT({names}{', normalize' if self.normalize_output else ''})"
+
+    def apply(self, image, _file_path, owned):
+        table = self.table
+        if self.normalize_output:
+            min_val, max_val, _, _ = cv2.minMaxLoc(image)
+            table = stretch_lut(table, int(table[int(min_val)]), int(table[int(max_val)]))
+        if owned:
+            return cv2.LUT(image, table, dst=image), True
+        return cv2.LUT(image, table), True
+
+
+class ProcessorStep:
+    def __init__(self, pre_processor):
+        self.pre_processor = pre_processor
+
+    def __str__(self):
+        return self.pre_processor.__class__.__name__
+
+    def apply(self, image, file_path, _owned):
+        # Processors own their output, the input may be kept by them
+        return self.pre_processor.apply_filter(image, file_path), False
+
+
+class ThreadBuffers(threading.local):
+    """Named arrays reused from one sheet to the next, for the dst= of the
+    OpenCV calls. Each thread gets its own, the reading threads of a pipeline
+    never write into each other's arrays."""
+
+    def __init__(self):
+        self.arrays = {}
+
+    def get(self, key, shape, dtype=np.uint8):
+        array = self.arrays.get(key)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = np.empty(shape, dtype=dtype)
+            self.arrays[key] = array
+        return array
+
+    def owns(self, image):
+        return any(np.may_share_memory(image, array) for array in self.arrays.values())
+
+
+class PreprocessingPipeline:
+    """Pre-processors of one template compiled into fused steps. Safe to share
+    between threads: the reused buffers are thread local."""
+
+    def __init__(self, pre_processors, tuning_config):
+        self.pre_processors = pre_processors
+        self.buffers = ThreadBuffers()
+        dimensions = tuning_config.dimensions
+        self.steps = [
+            ResizeStep(
+                dimensions.processing_width,
+                dimensions.processing_height,
+                self.buffers,
+            )
+        ] + self.compile_steps(pre_processors)
+        self.stage_names = [str(step) for step in self.steps]
+
+    @staticmethod
+    def compile_steps(pre_processors):
+        steps = []
+        for pre_processor in pre_processors:
+            table = pre_processor.get_lookup_table()
+            previous = steps[-1] if steps else None
+            if table is not None:
+                if isinstance(previous, FusedLookupStep):
+                    # apply the earlier table first: composed[v] = table[previous[v]]
+                    previous.table = table[previous.table]
+                    previous.pre_processors.append(pre_processor)
+                else:
+                    steps.append(FusedLookupStep([pre_processor], table.copy()))
+                continue
+
+            pre_processor.skip_input_normalization = False
+            if (
+                pre_processor.normalizes_input
+                and isinstance(previous, FusedLookupStep)
+                and not previous.normalize_output
+                and is_monotonic_lut(previous.table)
+            ):
+                previous.normalize_output = True
+                pre_processor.skip_input_normalization = True
+            steps.append(ProcessorStep(pre_processor))
+        return steps
+
+    def __str__(self):
+        return " -> ".join(str(step) for step in self.steps)
+
+    def run(self, image, file_path):
+        owned = False
+        clock = STAGE_TIMINGS.clock("preprocess")
+        for step, stage_name in zip(self.steps, self.stage_names):
+            clock.start(stage_name)
+            try:
+                image, owned = step.apply(image, file_path, owned)
+            except Exception:
+                clock.stop(failed=True)
+                raise
+            if image is None:
+                clock.stop(failed=True)
+                return None
+        clock.stop()
+        if self.buffers.owns(image):
+            # Never hand out a buffer that the next sheet will overwrite
+            image = image.copy()
+        return image
@@ -0,0 +1,132 @@
+"""
+`main.py rescore`: grades the sheets again from their saved raw reads (see
+outputs.save_raw_reads), with the current json files of the input directory.
+Changed thresholds in config.json and a changed answer key in evaluation.json
+apply, the images are not read again and the annotated images are left as
+they are.
+"""
+import os
+from pathlib import Path
+from time import localtime, strftime, time
+
+import numpy as np
+
+from src.entry import load_directory_setup, load_parent_setup
+from src.evaluation import evaluate_concatenated_responses
+from src.logger import logger
+from src.utils.artifacts import get_output_file_name
+from src.utils.file import Paths, write_csv_rows
+from src.utils.parsing import get_concatenated_response
+from src.utils.raw_reads import load_results_raw_reads, split_strips
+from src.utils.scanner import scan_directory
+
+
+def rescore(input_dir, output_dir):
+    input_dir, output_dir = Path(input_dir), Path(output_dir)
+    rescored_dirs = 0
+    for results_dir, _dirs, _file_names in sorted(os.walk(output_dir)):
+        if Path(results_dir).name != "Results":
+            continue
+        # later runs win for the same sheet
+        raw_reads = load_results_raw_reads(results_dir)
+        if raw_reads is None:
+            continue
+        relative_dir = Path(results_dir).parent.relative_to(output_dir)
+        curr_dir = input_dir.joinpath(relative_dir)
+        if not curr_dir.is_dir():
+            logger.warning(
+                f"Skipping raw reads in '{results_dir}': input directory '{curr_dir}' does not exist"
+            )
+            continue
+        paths = Paths(output_dir.joinpath(relative_dir))
+        rescore_dir(input_dir, curr_dir, paths, raw_reads)
+        rescored_dirs += 1
+
+    if rescored_dirs == 0:
+        logger.critical(f"No RawReads_*.npz found under '{output_dir}'")
+        raise Exception(
+            "Nothing to rescore, enable outputs.save_raw_reads and process the images"
+        )
+
+
+def rescore_dir(root_dir, curr_dir, paths, raw_reads):
+    start_time = time()
+    args = {"setLayout": False}
+    template, tuning_config, evaluation_config = load_parent_setup(
+        root_dir, curr_dir, args
+    )
+    template, tuning_config, evaluation_config, _ = load_directory_setup(
+        curr_dir,
+        scan_directory(curr_dir),
+        args,
+        template,
+        tuning_config,
+        evaluation_config,
+    )
+    if template is None:
+        logger.critical(f"No template found in the directory tree of '{curr_dir}'")
+        raise Exception(f"No template file found in the directory tree of {curr_dir}")
+
+    strip_lengths = [
+        len(field_block_bubbles)
+        for field_block in template.field_blocks
+        for field_block_bubbles in field_block.traverse_bubbles
+    ]
+    if strip_lengths != raw_reads["strip_lengths"].tolist():
+        logger.critical(
+            f"The bubbles of '{template}' do not match the raw reads in '{paths.results_dir}'"
+        )
+        raise Exception("Template layout changed since the raw reads were saved")
+
+    image_instance_ops = template.image_instance_ops
+    omr_responses, multi_marked_sheets = [], []
+    for bubble_values in raw_reads["bubble_values"]:
+        all_q_strip_arrs = split_strips(bubble_values, strip_lengths)
+        all_q_std_vals = [
+            round(np.std(q_strip_vals), 2) for q_strip_vals in all_q_strip_arrs
+        ]
+        response_dict, multi_marked, *_ = image_instance_ops.classify_bubbles(
+            template, all_q_strip_arrs, all_q_std_vals
+        )
+        omr_responses.append(get_concatenated_response(response_dict, template))
+        multi_marked_sheets.append(multi_marked)
+
+    scores = [0] * len(omr_responses)
+    if evaluation_config is not None:
+        scores = evaluate_concatenated_responses(omr_responses, evaluation_config)
+        scores = [float(score) for score in scores]
+
+    header = ["file_id", "input_path", "output_path", "score"] + template.output_columns
+    results_rows, multi_marked_rows = [header], [header]
+    for input_path, omr_response, multi_marked, score in zip(
+        raw_reads["input_paths"].tolist(), omr_responses, multi_marked_sheets, scores
+    ):
+        file_name = Path(input_path).name
+        resp_array = [omr_response[k] for k in template.output_columns]
+        if multi_marked == 0 or not tuning_config.outputs.filter_out_multimarked_files:
+            output_path = paths.save_marked_dir.joinpath(
+                get_output_file_name(file_name, tuning_config.outputs)
+            )
+            results_rows.append(
+                [file_name, input_path, output_path, score] + resp_array
+            )
+        else:
+            output_path = paths.multi_marked_dir.joinpath(file_name)
+            multi_marked_rows.append(
+                [file_name, input_path, output_path, "NA"] + resp_array
+            )
+
+    time_now_hrs = strftime("%I%p", localtime())
+    csv_paths = [
+        (paths.results_dir.joinpath(f"Rescored_{time_now_hrs}.csv"), results_rows),
+        (paths.manual_dir.joinpath("RescoredMultiMarkedFiles.csv"), multi_marked_rows),
+    ]
+    for csv_path, rows in csv_paths:
+        if len(rows) > 1:
+            os.makedirs(csv_path.parent, exist_ok=True)
+            with open(csv_path, "w", newline="") as f:
+                write_csv_rows(f, [[str(value) for value in row] for row in rows])
+            logger.info(f"Wrote {len(rows) - 1} rescored sheet(s) to '{csv_path}'")
+    logger.info(
+        f"Rescored {len(omr_responses)} sheet(s) of '{curr_dir}' in {round(time() - start_time, 2)} seconds"
+    )
@@ -14,6 +14,7 @@ CONFIG_SCHEMA = {
                 "display_width": {"type": "integer"},
                 "processing_height": {"type": "integer"},
                 "processing_width": {"type": "integer"},
+                "reduced_decode": {"type": "boolean"},
             },
         },
         "threshold_params": {
@@ -51,6 +52,28 @@ CONFIG_SCHEMA = {
                 "save_detections": {"type": "boolean"},
                 # This option moves multimarked files into a separate folder for manual checking, skipping evaluation
                 "filter_out_multimarked_files": {"type": "boolean"},
+                "image_format": {
+                    "enum": ["same_as_input", "jpg", "png", "webp"],
+                    "type": "string",
+                },
+                "jpeg_quality": {"type": "integer", "minimum": 0, "maximum": 100},
+                "png_compression": {"type": ["integer", "null"], "minimum": 0, "maximum": 9},
+                "webp_quality": {"type": "integer", "minimum": 1, "maximum": 100},
+                "save_raw_reads": {"type": "boolean"},
+            },
+        },
+        "memory": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {
+                "max_rss_mb": {"type": "integer", "minimum": 0},
+                # 0 for no limit, the pipeline needs one sheet per stage
+                "max_decoded_images": {
+                    "type": "integer",
+                    "anyOf": [{"const": 0}, {"minimum": 3}],
+                },
+                "max_debug_images": {"type": "integer", "minimum": 0},
+                "tracemalloc": {"type": "boolean"},
             },
         },
     },
@@ -69,15 +69,9 @@ TEMPLATE_SCHEMA = {
                 "properties": {
                     "name": {
                         "type": "string",
-                        "enum": [
-                            "CornerAlignment",
-                            "CropOnMarkers",
-                            "CropPage",
-                            "FeatureBasedAlignment",
-                            "GaussianBlur",
-                            "Levels",
-                            "MedianBlur",
-                        ],
+                        # Checked against the processor registry when the template is loaded,
+                        # so that plugin processors (entry points) are accepted too
+                        "description": "One of CornerAlignment, CropOnMarkers, CropPage, FeatureBasedAlignment, GaussianBlur, Levels, MedianBlur or a plugin processor name",
                     },
                 },
                 "required": ["name", "options"],
@@ -192,7 +186,18 @@ TEMPLATE_SCHEMA = {
                                     "type": "object",
                                     "additionalProperties": False,
                                     "properties": {
-                                        "morphKernel": two_positive_integers
+                                        "morphKernel": two_positive_integers,
+                                        "downscaleFactor": {
+                                            "type": "integer",
+                                            "minimum": 1,
+                                            "maximum": 8,
+                                        },
+                                        "refineCorners": {"type": "boolean"},
+                                        "refineWindow": {
+                                            "type": "integer",
+                                            "minimum": 1,
+                                            "maximum": 50,
+                                        },
                                     },
                                 }
                             }
@@ -10,6 +10,7 @@ from src.constants import FIELD_TYPES
 from src.core import ImageInstanceOps
 from src.logger import logger
 from src.processors.manager import PROCESSOR_MANAGER
+from src.processors.pipeline import PreprocessingPipeline
 from src.utils.parsing import (
     custom_sort_output_columns,
     open_template_with_defaults,
@@ -68,13 +69,23 @@ class Template:
         # load image pre_processors
         self.pre_processors = []
         for pre_processor in pre_processors_object:
-            ProcessorClass = PROCESSOR_MANAGER.processors[pre_processor["name"]]
+            processor_name = pre_processor["name"]
+            if processor_name not in PROCESSOR_MANAGER.processors:
+                logger.critical(f"Unknown pre-processor: '{processor_name}'")
+                raise Exception(
+                    f"Unknown pre-processor '{processor_name}' in template. Available pre-processors: {sorted(PROCESSOR_MANAGER.processors)}"
+                )
+            ProcessorClass = PROCESSOR_MANAGER.processors[processor_name]
             pre_processor_instance = ProcessorClass(
                 options=pre_processor["options"],
                 relative_dir=relative_dir,
                 image_instance_ops=self.image_instance_ops,
             )
             self.pre_processors.append(pre_processor_instance)
+        # fuse the chain once per template instead of once per sheet
+        self.preprocessing_pipeline = PreprocessingPipeline(
+            self.pre_processors, self.image_instance_ops.tuning_config
+        )
 
     def setup_field_blocks(self, field_blocks_object):
         # Add field_blocks
@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+import pytest
+from dotmap import DotMap
+
+from src.defaults import CONFIG_DEFAULTS
+from src.utils.artifacts import (
+    ArtifactWriter,
+    get_imwrite_params,
+    get_output_file_name,
+)
+
+
+def outputs_config(**overrides):
+    return DotMap({**CONFIG_DEFAULTS.outputs.toDict(), **overrides}, _dynamic=False)
+
+
+def test_output_file_name_follows_image_format():
+    assert get_output_file_name("scan.png", outputs_config()) == "scan.png"
+    assert get_output_file_name("scan.png", outputs_config(image_format="jpg")) == "scan.jpg"
+    config = outputs_config(jpeg_quality=80, webp_quality=70)
+    assert get_imwrite_params("a.JPG", config) == [cv2.IMWRITE_JPEG_QUALITY, 80]
+    assert get_imwrite_params("a.webp", config) == [cv2.IMWRITE_WEBP_QUALITY, 70]
+    assert get_imwrite_params("a.png", config) == []
+
+
+def test_writer_flush_waits_for_pending_writes(tmp_path):
+    image = np.full((40, 60), 127, dtype=np.uint8)
+    with ArtifactWriter(outputs_config(), max_workers=2, max_pending=2) as writer:
+        for index in range(6):
+            writer.save_img(tmp_path.joinpath(f"{index}.png"), image)
+        writer.flush()
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            f"{index}.png" for index in range(6)
+        ]
+    assert np.array_equal(cv2.imread(str(tmp_path.joinpath("5.png")), -1), image)
+
+
+def test_writer_reraises_failures_on_flush():
+    def fail():
+        raise OSError("disk full")
+
+    writer = ArtifactWriter(outputs_config())
+    writer.submit(fail)
+    with pytest.raises(OSError, match="disk full"):
+        writer.flush()
+    # the error is reported once
+    writer.close()
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+
+from src.core import ImageInstanceOps
+from src.defaults import CONFIG_DEFAULTS
+from src.processors.CropPage import CropPage, normalize
+
+
+def build(options):
+    return CropPage(
+        options=options,
+        relative_dir=None,
+        image_instance_ops=ImageInstanceOps(CONFIG_DEFAULTS),
+    )
+
+
+def bordered_page():
+    # a light page, slightly rotated, with printed lines on a dark background
+    image = np.full((1000, 800), 40, np.uint8)
+    corners = np.array([[130, 110], [672, 138], [650, 880], [108, 852]], np.int32)
+    cv2.fillConvexPoly(image, corners, 230)
+    for y in range(250, 800, 60):
+        cv2.line(image, (200, y), (560, y + 10), 90, 3)
+    image = cv2.GaussianBlur(image, (5, 5), 0)
+    return normalize(cv2.GaussianBlur(image, (3, 3), 0))
+
+
+def assert_corners_close(corners, expected, tolerance):
+    corners = np.asarray(corners, np.float32).reshape(4, 2)
+    expected = np.asarray(expected, np.float32).reshape(4, 2)
+    distances = np.linalg.norm(corners[:, None] - expected[None], axis=2)
+    # corners may start at another vertex, match each to the closest one
+    assert distances.min(axis=1).max() <= tolerance
+    assert len(set(distances.argmin(axis=1).tolist())) == 4
+
+
+def test_downscaled_corners_match_full_resolution():
+    image = bordered_page()
+    expected = build({}).find_page(image, "sheet.png")
+    assert len(expected) == 4
+
+    refined = build({"downscaleFactor": 4}).find_page_downscaled(image, "sheet.png")
+    assert_corners_close(refined, expected, 2.5)
+
+    unrefined = build(
+        {"downscaleFactor": 4, "refineCorners": False}
+    ).find_page_downscaled(image, "sheet.png")
+    # without refinement the corners are only as precise as the small image
+    assert_corners_close(unrefined, expected, 2 * 4)
+
+
+def test_refine_window_covers_the_downscaling(caplog):
+    assert build({}).refine_window == 5
+    assert build({"downscaleFactor": 4}).refine_window == 12
+    assert build({"downscaleFactor": 4, "refineWindow": 20}).refine_window == 20
+
+    assert build({"downscaleFactor": 4, "refineWindow": 5}).refine_window == 12
+    assert "refineWindow 5 is below 3 x downscaleFactor" in caplog.text
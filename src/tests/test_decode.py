@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+
+from src.utils.decode import plan_decode_flag, read_image_header
+
+
+def write_image(path, width, height, params=None):
+    image = np.random.default_rng(0).integers(0, 255, (height, width), np.uint8)
+    cv2.imwrite(str(path), image, params or [])
+    return path
+
+
+def test_reads_size_from_headers(tmp_path):
+    jpeg = write_image(tmp_path.joinpath("scan.jpg"), 620, 877)
+    progressive = write_image(
+        tmp_path.joinpath("progressive.jpg"), 300, 200, [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+    )
+    png = write_image(tmp_path.joinpath("scan.png"), 31, 17)
+    broken = tmp_path.joinpath("broken.jpg")
+    broken.write_bytes(b"\xff\xd8\xff\xe0\x00")
+
+    assert read_image_header(jpeg) == ("jpeg", (620, 877))
+    assert read_image_header(progressive) == ("jpeg", (300, 200))
+    assert read_image_header(png) == ("png", (31, 17))
+    assert read_image_header(broken) == ("jpeg", None)
+    assert read_image_header(tmp_path.joinpath("missing.jpg")) == (None, None)
+
+
+def test_plans_largest_reduction_covering_processing_size(tmp_path):
+    jpeg = write_image(tmp_path.joinpath("scan.jpg"), 2480, 3508)
+    png = write_image(tmp_path.joinpath("scan.png"), 2480, 3508)
+
+    assert plan_decode_flag(jpeg, 1132, 1600) == cv2.IMREAD_REDUCED_GRAYSCALE_2
+    assert plan_decode_flag(jpeg, 600, 820) == cv2.IMREAD_REDUCED_GRAYSCALE_4
+    assert plan_decode_flag(jpeg, 310, 439) == cv2.IMREAD_REDUCED_GRAYSCALE_8
+    # a landscape processing size is compared side by side as well
+    assert plan_decode_flag(jpeg, 1600, 1132) == cv2.IMREAD_REDUCED_GRAYSCALE_2
+    assert plan_decode_flag(jpeg, 1300, 1800) == cv2.IMREAD_GRAYSCALE
+    assert plan_decode_flag(png, 666, 820) == cv2.IMREAD_GRAYSCALE
+
+    reduced = cv2.imread(str(jpeg), plan_decode_flag(jpeg, 600, 820))
+    assert reduced.shape == (877, 620)
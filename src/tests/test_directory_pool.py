@@ -0,0 +1,57 @@
+import json
+import shutil
+from pathlib import Path
+
+from src.entry import entry_point
+from src.tests.test_samples.sample1.boilerplate import TEMPLATE_BOILERPLATE
+
+SAMPLE_IMAGE = Path("src/tests/test_samples/sample1/sample.png")
+
+
+def make_input_tree(input_dir):
+    # one template at the root, inherited by every sub-directory
+    input_dir.mkdir()
+    input_dir.joinpath("template.json").write_text(json.dumps(TEMPLATE_BOILERPLATE))
+    for relative_path in ["a/1.png", "a/2.png", "b/3.png", "b/c/4.png"]:
+        image_path = input_dir.joinpath(relative_path)
+        image_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(SAMPLE_IMAGE, image_path)
+
+
+def read_results(output_dir):
+    results = {}
+    for results_path in sorted(output_dir.rglob("Results_*.csv")):
+        relative_path = results_path.relative_to(output_dir)
+        results[relative_path.parent] = results_path.read_text().replace(
+            str(output_dir), "OUT"
+        )
+    return results
+
+
+def run(input_dir, output_dir, dir_workers):
+    entry_point(
+        input_dir,
+        {
+            "autoAlign": False,
+            "debug": False,
+            "output_dir": output_dir,
+            "setLayout": False,
+            "dir_workers": dir_workers,
+        },
+    )
+
+
+def test_directory_pool_matches_sequential_run(tmp_path):
+    input_dir = tmp_path.joinpath("inputs")
+    make_input_tree(input_dir)
+
+    run(input_dir, tmp_path.joinpath("sequential"), 1)
+    run(input_dir, tmp_path.joinpath("parallel"), 2)
+
+    sequential = read_results(tmp_path.joinpath("sequential"))
+    assert sorted(map(str, sequential)) == [
+        "a/Results",
+        "b/Results",
+        "b/c/Results",
+    ]
+    assert read_results(tmp_path.joinpath("parallel")) == sequential
@@ -0,0 +1,86 @@
+import json
+import random
+
+from src.defaults import CONFIG_DEFAULTS
+from src.evaluation import (
+    EvaluationConfig,
+    evaluate_concatenated_response,
+    evaluate_concatenated_responses,
+)
+from src.template import Template
+from src.tests.test_samples.sample1.boilerplate import TEMPLATE_BOILERPLATE
+
+EVALUATION = {
+    "source_type": "custom",
+    "options": {
+        "questions_in_order": ["q1..5"],
+        "answers_in_order": [
+            "A",
+            ["B", "C"],
+            [["A", 2], ["AB", "1/3"]],
+            "D",
+            "E",
+        ],
+    },
+    "marking_schemes": {
+        "DEFAULT": {"correct": "3", "incorrect": "-1/3", "unmarked": "0"},
+        "BONUS_LAST": {
+            "questions": ["q5"],
+            "marking": {"correct": "1/3", "incorrect": "1/3", "unmarked": "1/3"},
+        },
+    },
+}
+
+
+def load_evaluation_config(tmp_path, options=None):
+    tmp_path.joinpath("template.json").write_text(json.dumps(TEMPLATE_BOILERPLATE))
+    evaluation = {**EVALUATION, "options": {**EVALUATION["options"], **(options or {})}}
+    tmp_path.joinpath("evaluation.json").write_text(json.dumps(evaluation))
+    template = Template(tmp_path.joinpath("template.json"), CONFIG_DEFAULTS)
+    return EvaluationConfig(
+        tmp_path, tmp_path.joinpath("evaluation.json"), template, CONFIG_DEFAULTS
+    )
+
+
+def random_responses(count):
+    rng = random.Random(0)
+    answers = ["", "A", "B", "C", "D", "E", "AB", "BC"]
+    return [
+        {f"q{index}": rng.choice(answers) for index in range(1, 6)}
+        for _ in range(count)
+    ]
+
+
+def test_batch_scores_match_per_question_scoring(tmp_path):
+    # explained scoring takes the per-question path
+    explained_config = load_evaluation_config(
+        tmp_path, {"should_explain_scoring": True}
+    )
+    evaluation_config = load_evaluation_config(tmp_path)
+    responses = random_responses(200)
+
+    expected = [
+        evaluate_concatenated_response(response, explained_config, None, tmp_path)
+        for response in responses
+    ]
+
+    assert list(evaluate_concatenated_responses(responses, evaluation_config)) == (
+        expected
+    )
+    assert [
+        evaluate_concatenated_response(response, evaluation_config, None, tmp_path)
+        for response in responses
+    ] == expected
+
+
+def test_known_scores(tmp_path):
+    evaluation_config = load_evaluation_config(tmp_path)
+    scores = evaluate_concatenated_responses(
+        [
+            {"q1": "A", "q2": "C", "q3": "AB", "q4": "", "q5": "B"},
+            {"q1": "B", "q2": "", "q3": "A", "q4": "D", "q5": ""},
+        ],
+        evaluation_config,
+    )
+
+    assert list(scores) == [3 + 3 + 1 / 3 + 0 + 1 / 3, -1 / 3 + 0 + 2 + 3 + 1 / 3]
@@ -0,0 +1,100 @@
+import json
+import os
+
+from src.utils import manifest as manifest_module
+from src.utils.file import append_csv_rows, drop_csv_rows
+from src.utils.manifest import OUTCOME_RESULTS, ProcessedFilesManifest, hash_file
+
+
+def test_skips_only_unchanged_files(tmp_path, monkeypatch):
+    manifest_path = tmp_path.joinpath("ProcessedFiles.jsonl")
+    unchanged, touched, edited, new = [
+        tmp_path.joinpath(f"{name}.jpg") for name in ["a", "b", "c", "d"]
+    ]
+    for file_path in [unchanged, touched, edited, new]:
+        file_path.write_bytes(b"scan")
+
+    manifest = ProcessedFilesManifest(manifest_path, tmp_path, "template-1")
+    # recording a sheet does not read it again
+    monkeypatch.setattr(manifest_module, "hash_file", None)
+    for file_path in [unchanged, touched, edited]:
+        manifest.record(file_path, OUTCOME_RESULTS)
+    monkeypatch.undo()
+
+    stat = os.stat(touched)
+    os.utime(touched, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    edited.write_bytes(b"other scan")
+
+    reloaded = ProcessedFilesManifest(manifest_path, tmp_path, "template-1")
+    assert reloaded.filter_changed([unchanged, touched, edited, new]) == [
+        touched,
+        edited,
+        new,
+    ]
+
+    changed_template = ProcessedFilesManifest(manifest_path, tmp_path, "template-2")
+    assert changed_template.filter_changed([unchanged]) == [unchanged]
+
+
+def test_touched_files_of_hashed_entries_are_compared_by_content(tmp_path):
+    manifest_path = tmp_path.joinpath("ProcessedFiles.jsonl")
+    touched, edited = [tmp_path.joinpath(f"{name}.jpg") for name in ["a", "b"]]
+    lines = []
+    for file_path in [touched, edited]:
+        file_path.write_bytes(b"scan")
+        stat = os.stat(file_path)
+        # as written by the versions that hashed every sheet
+        entry = {
+            "path": file_path.name,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": hash_file(file_path),
+            "template": "template",
+            "outcome": OUTCOME_RESULTS,
+        }
+        lines.append(json.dumps(entry) + "\n")
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    manifest_path.write_text("".join(lines))
+    edited.write_bytes(b"SCAN")
+
+    manifest = ProcessedFilesManifest(manifest_path, tmp_path, "template")
+    assert manifest.filter_changed([touched, edited]) == [edited]
+
+
+def test_ignores_partial_manifest_lines(tmp_path):
+    manifest_path = tmp_path.joinpath("ProcessedFiles.jsonl")
+    file_path = tmp_path.joinpath("a.jpg")
+    file_path.write_bytes(b"scan")
+    ProcessedFilesManifest(manifest_path, tmp_path, "template").record(
+        file_path, OUTCOME_RESULTS
+    )
+    with open(manifest_path, "a") as f:
+        f.write('{"path": "b.j')
+
+    reloaded = ProcessedFilesManifest(manifest_path, tmp_path, "template")
+    assert list(reloaded.entries) == ["a.jpg"]
+
+    # the next run starts its entries on a new line
+    other_path = tmp_path.joinpath("c.jpg")
+    other_path.write_bytes(b"other scan")
+    reloaded.record(other_path, OUTCOME_RESULTS)
+    reloaded.record(file_path, OUTCOME_RESULTS)
+    resumed = ProcessedFilesManifest(manifest_path, tmp_path, "template")
+    assert sorted(resumed.entries) == ["a.jpg", "c.jpg"]
+    assert resumed.filter_changed([file_path, other_path]) == []
+    assert len(manifest_path.read_text().splitlines()) == 4
+
+
+def test_drop_csv_rows_keeps_header(tmp_path):
+    csv_path = tmp_path.joinpath("Results.csv")
+    append_csv_rows(
+        csv_path,
+        [["file_id", "input_path"], ["a.jpg", "in/a.jpg"], ["b.jpg", "in/b.jpg"]],
+    )
+
+    assert drop_csv_rows(csv_path, lambda row: row[1] == "in/a.jpg") == 1
+    assert drop_csv_rows(csv_path, lambda row: row[1] == "in/c.jpg") == 0
+    assert csv_path.read_text().splitlines() == [
+        '"file_id","input_path"',
+        '"b.jpg","in/b.jpg"',
+    ]
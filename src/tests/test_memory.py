@@ -0,0 +1,112 @@
+import json
+import threading
+
+import cv2
+import numpy as np
+from dotmap import DotMap
+
+from src.core import ImageInstanceOps
+from src.defaults import CONFIG_DEFAULTS
+from src.template import Template
+from src.tests.test_samples.sample1.boilerplate import TEMPLATE_BOILERPLATE
+from src.utils.instrumentation import STAGE_TIMINGS
+from src.utils.memory import MemoryMonitor, MemoryOptions
+
+
+def get_tuning_config(**memory):
+    tuning_config = DotMap(CONFIG_DEFAULTS.toDict())
+    tuning_config.outputs.save_image_level = 2
+    tuning_config.memory.update(memory)
+    return tuning_config
+
+
+def test_rss_limit_degrades_once(tmp_path):
+    released = []
+    options = MemoryOptions(report=True, max_rss_mb=1, tracemalloc=True)
+    with MemoryMonitor(
+        options, [("released", lambda: released.append(True))]
+    ) as monitor:
+        with STAGE_TIMINGS.measure("decode"):
+            buffers = [np.ones((256, 256), np.uint8) for _ in range(4)]
+        monitor.sample()
+    del buffers
+
+    assert released == [True]
+    summary = monitor.summary
+    assert summary["limit_hit"] and summary["degraded"] == ["released"]
+    assert 0 < summary["start_rss_mb"] <= summary["peak_rss_mb"]
+    assert summary["stage_traced_mb"]["decode"] > 0
+    assert summary["top_allocations"]
+
+    memory_path = tmp_path.joinpath("Memory_10AM.json")
+    monitor.write_json(memory_path)
+    with open(memory_path) as f:
+        assert json.load(f) == summary
+
+
+def test_memory_options_take_the_config_limits():
+    tuning_config = get_tuning_config(max_rss_mb=512, tracemalloc=True)
+    options = MemoryOptions.from_args({"memory": True})
+    assert options.for_tuning_config(tuning_config) == MemoryOptions(
+        report=True, max_rss_mb=512, tracemalloc=True
+    )
+    options = MemoryOptions.from_args({"max_rss_mb": 0})
+    assert options.for_tuning_config(tuning_config).max_rss_mb == 0
+
+
+def test_debug_image_limits():
+    image_instance_ops = ImageInstanceOps(get_tuning_config(max_debug_images=2))
+    image_instance_ops.reset_all_save_img()
+    image = np.zeros((4, 4), np.uint8)
+    for _ in range(3):
+        image_instance_ops.append_save_img(1, image)
+    assert len(image_instance_ops.save_img_list[1]) == 2
+
+    image_instance_ops.stop_keeping_debug_images()
+    image_instance_ops.append_save_img(2, image)
+    assert image_instance_ops.save_img_list[1] == []
+    assert image_instance_ops.save_img_list[2] == []
+
+
+def test_pages_are_read_into_reused_buffers(tmp_path):
+    tmp_path.joinpath("template.json").write_text(json.dumps(TEMPLATE_BOILERPLATE))
+    template = Template(tmp_path.joinpath("template.json"), CONFIG_DEFAULTS)
+    tuning_config = DotMap(CONFIG_DEFAULTS.toDict())
+    tuning_config.alignment_params.auto_align = True
+    image_instance_ops = ImageInstanceOps(tuning_config)
+    rng = np.random.default_rng(0)
+    images = [
+        cv2.GaussianBlur(rng.integers(0, 256, (500, 380), dtype=np.uint8), (5, 5), 0)
+        for _ in range(2)
+    ]
+
+    def read(image):
+        raw_read = {}
+        omr_response = image_instance_ops.read_omr_response(
+            template, image, "sheet.jpg", raw_read=raw_read
+        )[0]
+        return omr_response, raw_read
+
+    first_read = read(images[0])
+    buffers = image_instance_ops.page_buffers.arrays
+    page, morph = buffers["page"], buffers["morph"]
+    read(images[1])
+    assert read(images[0]) == first_read
+    assert buffers["page"] is page and buffers["morph"] is morph
+    assert np.array_equal(
+        ImageInstanceOps.normalize_page(template, images[0]),
+        ImageInstanceOps.normalize_page(
+            template, images[0], image_instance_ops.page_buffers
+        ),
+    )
+
+    # the reading threads of a pipeline get their own pages
+    pages = []
+    thread = threading.Thread(
+        target=lambda: pages.append(
+            image_instance_ops.page_buffers.get("page", (400, 300))
+        )
+    )
+    thread.start()
+    thread.join()
+    assert pages[0] is not page
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+from src.core import ImageInstanceOps
+from src.defaults import CONFIG_DEFAULTS
+from src.processors.manager import PROCESSOR_MANAGER
+from src.processors.interfaces.ImagePreprocessor import ImagePreprocessor
+from src.processors.pipeline import (
+    IDENTITY_LUT,
+    FusedLookupStep,
+    PreprocessingPipeline,
+    stretch_lut,
+)
+
+Levels = PROCESSOR_MANAGER.processors["Levels"]
+
+
+class NormalizingProbe(ImagePreprocessor):
+    normalizes_input = True
+
+    def apply_filter(self, image, _file_path):
+        if not self.skip_input_normalization:
+            image = cv2.normalize(image, 0, 255, norm_type=cv2.NORM_MINMAX)
+        return image.copy()
+
+
+def build(processor_class, options):
+    return processor_class(
+        options=options,
+        relative_dir=None,
+        image_instance_ops=ImageInstanceOps(CONFIG_DEFAULTS),
+    )
+
+
+def run_sequentially(pre_processors, image):
+    dimensions = CONFIG_DEFAULTS.dimensions
+    image = cv2.resize(
+        image, (dimensions.processing_width, dimensions.processing_height)
+    )
+    for pre_processor in pre_processors:
+        image = pre_processor.apply_filter(image, "sheet.png")
+    return image
+
+
+def test_fused_levels_and_normalization_match_sequential_run():
+    rng = np.random.default_rng(7)
+    image = rng.integers(40, 200, size=(900, 700), dtype=np.uint8)
+    pre_processors = [
+        build(Levels, {"low": 0.1, "high": 0.9, "gamma": 0.8}),
+        build(Levels, {"low": 0.05, "high": 1, "gamma": 0.5}),
+        build(NormalizingProbe, {}),
+    ]
+    expected = run_sequentially(pre_processors, image)
+
+    pipeline = PreprocessingPipeline(pre_processors, CONFIG_DEFAULTS)
+    fused_steps = [step for step in pipeline.steps if isinstance(step, FusedLookupStep)]
+    assert len(fused_steps) == 1
+    assert fused_steps[0].normalize_output
+    assert pre_processors[2].skip_input_normalization
+
+    first = pipeline.run(image, "sheet.png")
+    second = pipeline.run(image, "sheet.png")
+    assert np.array_equal(first, expected)
+    # results must not alias the reused buffers
+    assert np.array_equal(first, second)
+    assert not np.shares_memory(first, second)
+
+
+def test_stretch_lut_rounds_like_normalize():
+    # e.g. (0, 28): 14 * 255 / 28 = 127.5
+    for low in range(0, 256, 5):
+        for high in range(low, 256):
+            values = np.arange(low, high + 1, dtype=np.uint8)
+            expected = cv2.normalize(values, None, 0, 255, cv2.NORM_MINMAX)
+            stretched = stretch_lut(IDENTITY_LUT, low, high)[low : high + 1]
+            assert np.array_equal(stretched, expected.ravel()), (low, high)
+
+
+def test_pipeline_stops_on_failed_processor():
+    class Failing(ImagePreprocessor):
+        def apply_filter(self, image, _file_path):
+            return None
+
+    pipeline = PreprocessingPipeline(
+        [build(Failing, {}), build(Levels, {})], CONFIG_DEFAULTS
+    )
+    assert pipeline.run(np.zeros((50, 40), dtype=np.uint8), "sheet.png") is None
@@ -0,0 +1,88 @@
+import importlib
+import importlib.metadata
+import inspect
+import pkgutil
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from src.processors.manager import (
+    BUILTIN_PROCESSORS,
+    PROCESSOR_MANAGER,
+    Processor,
+    ProcessorRegistry,
+)
+
+# Generous, the point is to catch processor modules (cv2 feature code,
+# matplotlib) getting imported eagerly again
+MANAGER_IMPORT_BUDGET_US = 300_000
+
+
+def get_import_times(statement):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative_times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            cumulative_times[module.strip()] = int(cumulative)
+    return cumulative_times
+
+
+def test_builtin_map_covers_processors_package():
+    package = importlib.import_module("src.processors")
+    found = {}
+    for _, module_name, ispkg in pkgutil.walk_packages(
+        package.__path__, package.__name__ + "."
+    ):
+        if ispkg:
+            continue
+        module = importlib.import_module(module_name)
+        for _, member in inspect.getmembers(module, inspect.isclass):
+            if (
+                member.__module__ == module_name
+                and issubclass(member, Processor)
+                and member.__name__ not in ["Processor", "ImagePreprocessor"]
+            ):
+                found[member.__name__] = f"{module_name}:{member.__name__}"
+    assert found == BUILTIN_PROCESSORS
+
+
+def test_plugins_are_found_with_python_3_9_entry_points(monkeypatch):
+    plugin = SimpleNamespace(name="Sharpen", value="src.processors.builtins:Levels")
+    # before Python 3.10, entry_points() takes no group and returns a dict
+    monkeypatch.setattr(
+        importlib.metadata, "entry_points", lambda: {"omr_checker.processors": [plugin]}
+    )
+    registry = ProcessorRegistry(BUILTIN_PROCESSORS, "omr_checker.processors")
+
+    assert "Sharpen" in registry
+    assert registry["Sharpen"] is registry["Levels"]
+
+
+def test_registry_imports_on_first_lookup():
+    registry = ProcessorRegistry(BUILTIN_PROCESSORS)
+    assert "Levels" in registry
+    assert registry.loaded == {}
+    assert registry["Levels"] is PROCESSOR_MANAGER.processors["Levels"]
+    assert list(registry.loaded) == ["Levels"]
+    assert "Unknown" not in registry
+    with pytest.raises(KeyError):
+        registry["Unknown"]
+
+
+def test_manager_import_is_lazy_and_within_budget():
+    import_times = get_import_times("import src.processors.manager")
+    processor_modules = [
+        module_path.split(":")[0] for module_path in BUILTIN_PROCESSORS.values()
+    ]
+    assert not set(processor_modules).intersection(import_times)
+    assert import_times["src.processors.manager"] < MANAGER_IMPORT_BUDGET_US
@@ -0,0 +1,88 @@
+import json
+import pstats
+import threading
+import time
+from types import SimpleNamespace
+
+from src.utils.profiling import PipelineProfiler, ProfileOptions, get_qualname
+
+
+def busy_work(duration):
+    end = time.perf_counter() + duration
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+def idle_work(duration):
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_profiler_covers_threads_and_filters(tmp_path):
+    path_prefix = str(tmp_path.joinpath("Profile_10AM"))
+    options = ProfileOptions(
+        enabled=True, function_filter="busy_work", sample_interval=0.001
+    )
+    with PipelineProfiler(path_prefix, options) as profiler:
+        # the work is done on another thread, like the pipeline's compute workers
+        worker = threading.Thread(target=busy_work, args=(0.2,))
+        worker.start()
+        worker.join()
+        idle_work(0.1)
+
+    stats = pstats.Stats(f"{path_prefix}.prof")
+    function_names = {function_name for _, _, function_name in stats.stats}
+    assert {"busy_work", "idle_work"} <= function_names
+
+    with open(f"{path_prefix}.collapsed.txt") as f:
+        lines = f.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert "test_profiling.busy_work" in stack and int(count) > 0
+
+    with open(f"{path_prefix}.json") as f:
+        summary = json.load(f)
+    assert summary == profiler.summary
+    assert summary["samples"] == sum(int(line.rsplit(" ", 1)[1]) for line in lines)
+    assert [hot["function"] for hot in summary["hot_functions"]] == [
+        "test_profiling.busy_work"
+    ]
+
+
+def test_profile_options_from_args():
+    assert ProfileOptions.from_args({}).enabled is False
+    options = ProfileOptions.from_args(
+        {"profile": True, "profile_top": 5, "profile_filter": "getBestMatch"}
+    )
+    assert (options.enabled, options.top_n, options.function_filter) == (
+        True,
+        5,
+        "getBestMatch",
+    )
+
+
+def test_qualname_without_co_qualname():
+    # the code objects of Python < 3.11
+    class ArtifactWriter:
+        pass
+
+    def frame(co_name, varnames, f_locals):
+        code = SimpleNamespace(
+            co_name=co_name, co_argcount=len(varnames), co_varnames=varnames
+        )
+        return SimpleNamespace(f_code=code, f_locals=f_locals)
+
+    writer = ArtifactWriter()
+    assert (
+        get_qualname(frame("run", ("self",), {"self": writer}))
+        == "ArtifactWriter.run"
+    )
+    assert (
+        get_qualname(frame("load", ("cls",), {"cls": ArtifactWriter}))
+        == "ArtifactWriter.load"
+    )
+    assert get_qualname(frame("decode_image", ("file_path",), {})) == "decode_image"
@@ -0,0 +1,178 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.annotate import annotate_sheet
+from src import entry
+from src.entry import entry_point
+from src.rescore import rescore
+from src.tests.test_samples.sample1.boilerplate import TEMPLATE_BOILERPLATE
+from src.tests.utils import make_raw_read
+from src.utils.raw_reads import (
+    RawReadStore,
+    get_sheet_raw_read,
+    load_raw_reads,
+    load_results_raw_reads,
+    merge_raw_reads,
+    split_strips,
+)
+
+
+def test_later_saves_replace_rows_of_the_same_sheet(tmp_path):
+    store_path = str(tmp_path.joinpath("RawReads_10AM.npz"))
+    first_run = RawReadStore(store_path)
+    first_run.add("in/a.jpg", make_raw_read(10.0))
+    first_run.add("in/b.jpg", make_raw_read(20.0))
+    first_run.save()
+    second_run = RawReadStore(store_path)
+    second_run.add("in/b.jpg", make_raw_read(30.0))
+    second_run.save()
+
+    raw_reads = load_raw_reads(store_path)
+    assert raw_reads["input_paths"].tolist() == ["in/a.jpg", "in/b.jpg"]
+    assert raw_reads["bubble_values"][:, 0].tolist() == [10.0, 30.0]
+    assert raw_reads["strip_lengths"].tolist() == [2, 3]
+    assert split_strips(np.arange(5.0), [2, 3]) == [[0.0, 1.0], [2.0, 3.0, 4.0]]
+
+
+def test_store_is_saved_every_flush_size_sheets(tmp_path):
+    store_path = str(tmp_path.joinpath("RawReads_10AM.npz"))
+    store = RawReadStore(store_path, flush_size=2)
+    for file_name in ["a.jpg", "b.jpg", "c.jpg"]:
+        store.add(f"in/{file_name}", make_raw_read(10.0))
+
+    saved_paths = load_raw_reads(store_path)["input_paths"].tolist()
+    assert saved_paths == ["in/a.jpg", "in/b.jpg"]
+    store.save()
+    saved_paths = load_raw_reads(store_path)["input_paths"].tolist()
+    assert saved_paths == ["in/a.jpg", "in/b.jpg", "in/c.jpg"]
+
+
+def test_raw_reads_of_written_sheets_survive_a_crash(tmp_path, monkeypatch):
+    input_dir = tmp_path.joinpath("inputs")
+    input_dir.mkdir()
+    input_dir.joinpath("template.json").write_text(json.dumps(TEMPLATE_BOILERPLATE))
+    input_dir.joinpath("config.json").write_text(
+        json.dumps({"outputs": {"save_raw_reads": True}})
+    )
+    for file_name in ["a.png", "b.png"]:
+        shutil.copy(
+            Path("src/tests/test_samples/sample1/sample.png"),
+            input_dir.joinpath(file_name),
+        )
+    read_omr_sheet = entry.read_omr_sheet
+
+    def crash_on_b(sheet, *args, **kwargs):
+        if sheet.file_path.name == "b.png":
+            raise MemoryError
+        return read_omr_sheet(sheet, *args, **kwargs)
+
+    monkeypatch.setattr(entry, "read_omr_sheet", crash_on_b)
+    output_dir = tmp_path.joinpath("outputs")
+    with pytest.raises(MemoryError):
+        entry_point(
+            input_dir,
+            {
+                "autoAlign": False,
+                "debug": False,
+                "output_dir": output_dir,
+                "setLayout": False,
+            },
+        )
+
+    # a.png is in the manifest, --resume would not read it again
+    raw_reads = load_results_raw_reads(output_dir.joinpath("Results"))
+    assert raw_reads["input_paths"].tolist() == [str(input_dir.joinpath("a.png"))]
+
+
+def test_latest_read_wins_whatever_the_store_names(tmp_path):
+    # RawReads_01PM sorts first, but the 10AM run of the next day is newer
+    afternoon_path = str(tmp_path.joinpath("RawReads_01PM.npz"))
+    morning_path = str(tmp_path.joinpath("RawReads_10AM.npz"))
+    afternoon_run = RawReadStore(afternoon_path)
+    afternoon_run.add("in/a.jpg", make_raw_read(10.0))
+    afternoon_run.add("in/b.jpg", make_raw_read(20.0))
+    afternoon_run.save()
+    morning_run = RawReadStore(morning_path)
+    morning_run.add("in/b.jpg", make_raw_read(30.0))
+    morning_run.save()
+
+    for first_path, second_path in [
+        (afternoon_path, morning_path),
+        (morning_path, afternoon_path),
+    ]:
+        raw_reads = merge_raw_reads(
+            load_raw_reads(first_path), load_raw_reads(second_path)
+        )
+        values = dict(
+            zip(raw_reads["input_paths"].tolist(), raw_reads["bubble_values"][:, 0])
+        )
+        assert values == {"in/a.jpg": 10.0, "in/b.jpg": 30.0}
+
+
+def test_results_raw_reads_take_the_latest_store(tmp_path):
+    # RawReads_01PM sorts first but is newer. Stores of an earlier version
+    # have no read times, their mtime decides.
+    for store_name, value, mtime in [
+        ("RawReads_01PM.npz", 30.0, 2000),
+        ("RawReads_10AM.npz", 20.0, 1000),
+    ]:
+        store = RawReadStore(str(tmp_path.joinpath(store_name)))
+        store.add("in/b.jpg", make_raw_read(value))
+        arrays = store.to_arrays()
+        del arrays["read_times"]
+        np.savez_compressed(store.store_path, **arrays)
+        os.utime(store.store_path, (mtime, mtime))
+
+    raw_reads = load_results_raw_reads(tmp_path)
+    assert get_sheet_raw_read(raw_reads, "in/b.jpg")["bubble_values"][0] == 30.0
+    assert get_sheet_raw_read(raw_reads, "in/c.jpg") is None
+
+
+def test_rescore_reproduces_results(tmp_path):
+    input_dir = tmp_path.joinpath("inputs")
+    input_dir.mkdir()
+    input_dir.joinpath("template.json").write_text(json.dumps(TEMPLATE_BOILERPLATE))
+    input_dir.joinpath("config.json").write_text(
+        json.dumps({"outputs": {"save_raw_reads": True}})
+    )
+    shutil.copy(Path("src/tests/test_samples/sample1/sample.png"), input_dir)
+    output_dir = tmp_path.joinpath("outputs")
+    entry_point(
+        input_dir,
+        {"autoAlign": False, "debug": False, "output_dir": output_dir, "setLayout": False},
+    )
+
+    rescore(input_dir, output_dir)
+
+    results_dir = output_dir.joinpath("Results")
+    (results_path,) = results_dir.glob("Results_*.csv")
+    (rescored_path,) = results_dir.glob("Rescored_*.csv")
+    assert rescored_path.read_text() == results_path.read_text()
+
+
+def test_annotate_sheet_matches_save_detections(tmp_path):
+    input_dir = tmp_path.joinpath("inputs")
+    input_dir.mkdir()
+    input_dir.joinpath("template.json").write_text(json.dumps(TEMPLATE_BOILERPLATE))
+    shutil.copy(Path("src/tests/test_samples/sample1/sample.png"), input_dir)
+    args = {"autoAlign": False, "debug": False, "setLayout": False}
+    entry_point(input_dir, {**args, "output_dir": tmp_path.joinpath("eager")})
+
+    input_dir.joinpath("config.json").write_text(
+        json.dumps({"outputs": {"save_detections": False, "save_raw_reads": True}})
+    )
+    deferred_dir = tmp_path.joinpath("deferred")
+    entry_point(input_dir, {**args, "output_dir": deferred_dir})
+    assert not list(deferred_dir.joinpath("CheckedOMRs").glob("*.png"))
+
+    image_path = annotate_sheet(
+        input_dir, input_dir.joinpath("sample.png"), deferred_dir
+    )
+    assert image_path == deferred_dir.joinpath("CheckedOMRs", "sample.png")
+    eager_path = tmp_path.joinpath("eager", "CheckedOMRs", "sample.png")
+    assert image_path.read_bytes() == eager_path.read_bytes()
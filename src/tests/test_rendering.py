@@ -0,0 +1,92 @@
+import json
+import random
+
+import cv2
+import numpy as np
+
+import src.constants as constants
+from src.core import ImageInstanceOps
+from src.defaults import CONFIG_DEFAULTS
+from src.template import Template
+from src.tests.test_samples.sample1.boilerplate import TEMPLATE_BOILERPLATE
+from src.utils.rendering import draw_marks, get_bubbles, get_plans
+
+
+def load_template(tmp_path):
+    tmp_path.joinpath("template.json").write_text(json.dumps(TEMPLATE_BOILERPLATE))
+    return Template(tmp_path.joinpath("template.json"), CONFIG_DEFAULTS)
+
+
+def draw_marks_per_bubble(image, template, bubble_marks):
+    # the drawing loop of read_omr_response, one cv2 call per bubble
+    field_block, bubble = list(get_bubbles(template))[-1]
+    x, y = bubble.x + field_block.shift, bubble.y
+    for field_block, bubble, bubble_is_marked in bubble_marks:
+        box_w, box_h = field_block.bubble_dimensions
+        if bubble_is_marked:
+            x, y = bubble.x + field_block.shift, bubble.y
+            cv2.rectangle(
+                image,
+                (int(x + box_w / 12), int(y + box_h / 12)),
+                (int(x + box_w - box_w / 12), int(y + box_h - box_h / 12)),
+                constants.CLR_DARK_GRAY,
+                3,
+            )
+            cv2.putText(
+                image,
+                str(bubble.field_value),
+                (x, y),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                constants.TEXT_SIZE,
+                (20, 20, 10),
+                int(1 + 3.5 * constants.TEXT_SIZE),
+            )
+        else:
+            cv2.rectangle(
+                image,
+                (int(x + box_w / 10), int(y + box_h / 10)),
+                (int(x + box_w - box_w / 10), int(y + box_h - box_h / 10)),
+                constants.CLR_GRAY,
+                -1,
+            )
+
+
+def test_marks_match_per_bubble_drawing(tmp_path):
+    template = load_template(tmp_path)
+    rng = random.Random(0)
+    image = np.random.default_rng(0).integers(0, 256, (400, 300), dtype=np.uint8)
+    for shift in [0, 7, -5]:
+        template.field_blocks[0].shift = shift
+        for marked_ratio in [0, 0.2, 0.5, 1]:
+            bubble_marks = [
+                (field_block, bubble, rng.random() < marked_ratio)
+                for field_block, bubble in get_bubbles(template)
+            ]
+            expected, drawn = image.copy(), image.copy()
+            draw_marks_per_bubble(expected, template, bubble_marks)
+            draw_marks(drawn, template, bubble_marks)
+            assert np.array_equal(drawn, expected)
+
+
+def test_layouts_are_cached_per_shifts(tmp_path):
+    template = load_template(tmp_path)
+    image = np.full((400, 300), 200, np.uint8)
+    first = ImageInstanceOps.draw_template_layout(image, template, draw_qvals=True)
+    plans = get_plans(template)
+    assert len(plans.layouts) == 1
+
+    template.field_blocks[0].shift = 4
+    shifted = ImageInstanceOps.draw_template_layout(image, template, draw_qvals=True)
+    assert len(plans.layouts) == 2
+    # the boxes moved with the shift, the block name above them did not
+    assert np.array_equal(shifted[55:, 4:], first[55:, :-4])
+
+    template.field_blocks[0].shift = 0
+    q_vals = plans.get_layout(template, True, True, -1).get_bubble_means(image)
+    assert np.array_equal(
+        ImageInstanceOps.draw_template_layout(
+            image, template, draw_qvals=True, q_vals=q_vals
+        ),
+        first,
+    )
+    assert len(plans.layouts) == 2
@@ -0,0 +1,59 @@
+from src.utils.scanner import WorkPlan, normalize_path, scan_directory
+
+
+def make_tree(root):
+    for relative_path in [
+        "template.json",
+        "b.JPG",
+        "a.png",
+        "c.Jpeg",
+        ".hidden.jpg",
+        "notes.txt",
+        "second/evaluation.json",
+        "second/z.jpg",
+        "first/config.json",
+        "first/nested/y.png",
+    ]:
+        path = root.joinpath(relative_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+
+
+def test_scan_directory_classifies_entries(tmp_path):
+    make_tree(tmp_path)
+
+    directory_scan = scan_directory(tmp_path)
+
+    assert directory_scan.subdirs == [
+        tmp_path.joinpath("first"),
+        tmp_path.joinpath("second"),
+    ]
+    assert directory_scan.images == [
+        tmp_path.joinpath(name) for name in ["a.png", "b.JPG", "c.Jpeg"]
+    ]
+    assert directory_scan.has_template
+    assert not directory_scan.has_config
+    assert not directory_scan.has_evaluation
+
+
+def test_work_plan_lists_parents_before_children(tmp_path):
+    make_tree(tmp_path)
+
+    work_plan = WorkPlan.scan(tmp_path)
+
+    assert [directory_scan.path for directory_scan in work_plan] == [
+        tmp_path,
+        tmp_path.joinpath("first"),
+        tmp_path.joinpath("first", "nested"),
+        tmp_path.joinpath("second"),
+    ]
+    assert work_plan.image_count == 5
+    assert work_plan.template_dirs == [tmp_path]
+    assert work_plan[tmp_path.joinpath("first")].has_config
+    assert work_plan[tmp_path.joinpath("second")].has_evaluation
+
+
+def test_normalized_paths_match_across_spellings(tmp_path):
+    assert normalize_path(tmp_path.joinpath("a", "..", "b.jpg")) == normalize_path(
+        str(tmp_path.joinpath("b.jpg"))
+    )
@@ -0,0 +1,158 @@
+import argparse
+import os
+from pathlib import Path
+
+import pytest
+
+from src.tests.utils import make_raw_read
+from src.utils.file import append_csv_rows
+from src.utils.raw_reads import RawReadStore, load_results_raw_reads
+from src.utils.scanner import WorkPlan
+from src.utils.shards import merge_shards, parse_shard, select_shard
+
+HEADER = ["file_id", "input_path", "output_path", "score"]
+
+
+def test_shards_are_disjoint_and_cover_all_files():
+    omr_files = [f"{index:03}.jpg" for index in range(10)]
+
+    shards = [select_shard(omr_files, (index, 3)) for index in [1, 2, 3]]
+
+    assert shards[0] == ["000.jpg", "003.jpg", "006.jpg", "009.jpg"]
+    assert sorted(sum(shards, [])) == omr_files
+
+
+def test_shards_stay_balanced_across_small_directories(tmp_path):
+    for index in range(40):
+        batch_dir = tmp_path.joinpath(f"batch{index:02}")
+        batch_dir.mkdir()
+        for image_index in range(1 + index % 2):
+            batch_dir.joinpath(f"{image_index}.jpg").write_bytes(b"scan")
+    work_plan = WorkPlan.scan(tmp_path)
+    offsets = work_plan.image_offsets()
+
+    shards = [
+        [
+            file_path
+            for directory_scan in work_plan
+            for file_path in select_shard(
+                directory_scan.images, (shard_index, 4), offsets[directory_scan.path]
+            )
+        ]
+        for shard_index in [1, 2, 3, 4]
+    ]
+
+    assert [len(shard) for shard in shards] == [15, 15, 15, 15]
+    assert sorted(sum(shards, [])) == sorted(
+        file_path for directory_scan in work_plan for file_path in directory_scan.images
+    )
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for value in ["0/4", "5/4", "2-4"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(value)
+
+
+def write_shard_outputs(
+    output_dir, shard_name, file_names, results_name="Results_10AM.csv", mtime=None
+):
+    shard_dir = output_dir.joinpath(shard_name, "school")
+    shard_dir.joinpath("Results").mkdir(parents=True)
+    shard_dir.joinpath("CheckedOMRs").mkdir()
+    rows = [HEADER]
+    for file_name in file_names:
+        output_path = shard_dir.joinpath("CheckedOMRs", file_name)
+        output_path.write_bytes(file_name.encode())
+        rows.append([file_name, f"inputs/school/{file_name}", output_path, 1])
+    results_path = shard_dir.joinpath("Results", results_name)
+    append_csv_rows(results_path, rows)
+    if mtime is not None:
+        os.utime(results_path, (mtime, mtime))
+    return results_path
+
+
+def get_expected_results(output_dir, names):
+    checked_dir = output_dir.joinpath("school", "CheckedOMRs")
+    return [
+        '"file_id","input_path","output_path","score"',
+        *[
+            f'"{name}","inputs/school/{name}","{checked_dir}{os.sep}{name}","1"'
+            for name in names
+        ],
+    ]
+
+
+def test_merge_restores_single_run_layout(tmp_path):
+    write_shard_outputs(tmp_path, "shard-1-of-2", ["a.jpg", "c.jpg"])
+    write_shard_outputs(tmp_path, "shard-2-of-2", ["b.jpg"])
+
+    merge_shards(tmp_path)
+
+    results = tmp_path.joinpath("school", "Results", "Results_10AM.csv")
+    checked_dir = tmp_path.joinpath("school", "CheckedOMRs")
+    assert results.read_text().splitlines() == get_expected_results(
+        tmp_path, ["a.jpg", "b.jpg", "c.jpg"]
+    )
+    assert sorted(os.listdir(checked_dir)) == ["a.jpg", "b.jpg", "c.jpg"]
+
+
+def test_merge_joins_results_of_different_hours(tmp_path):
+    write_shard_outputs(
+        tmp_path, "shard-1-of-2", ["b.jpg", "d.jpg"], "Results_01PM.csv", 2000
+    )
+    write_shard_outputs(tmp_path, "shard-2-of-2", ["a.jpg", "c.jpg"], mtime=1000)
+
+    merge_shards(tmp_path)
+
+    results_dir = tmp_path.joinpath("school", "Results")
+    # a single csv, named after the latest shard run
+    assert os.listdir(results_dir) == ["Results_01PM.csv"]
+    assert results_dir.joinpath(
+        "Results_01PM.csv"
+    ).read_text().splitlines() == get_expected_results(
+        tmp_path, ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+    )
+
+
+def test_merge_relocates_relative_output_paths(tmp_path, monkeypatch):
+    # the shards ran with a relative -o, the merge gets an absolute one
+    monkeypatch.chdir(tmp_path)
+    results_path = write_shard_outputs(Path("outputs"), "shard-1-of-1", ["a.jpg"])
+    outside_row = ["z.jpg", "inputs/school/z.jpg", "/elsewhere/z.jpg", "1"]
+    append_csv_rows(results_path, [outside_row])
+
+    merge_shards(tmp_path.joinpath("outputs"))
+
+    results = tmp_path.joinpath("outputs", "school", "Results", "Results_10AM.csv")
+    assert results.read_text().splitlines() == [
+        *get_expected_results(tmp_path.joinpath("outputs"), ["a.jpg"]),
+        '"z.jpg","inputs/school/z.jpg","/elsewhere/z.jpg","1"',
+    ]
+
+
+def test_merge_keeps_the_raw_reads_of_every_shard(tmp_path):
+    for shard_name, file_name, value in [
+        ("shard-1-of-2", "a.jpg", 10.0),
+        ("shard-2-of-2", "b.jpg", 20.0),
+    ]:
+        results_path = write_shard_outputs(tmp_path, shard_name, [file_name])
+        # both shards ran in the same hour
+        store = RawReadStore(str(results_path.with_name("RawReads_10AM.npz")))
+        store.add(f"inputs/school/{file_name}", make_raw_read(value))
+        store.save()
+
+    merge_shards(tmp_path)
+
+    raw_reads = load_results_raw_reads(tmp_path.joinpath("school", "Results"))
+    assert raw_reads["input_paths"].tolist() == [
+        "inputs/school/a.jpg",
+        "inputs/school/b.jpg",
+    ]
+    assert raw_reads["bubble_values"][:, 0].tolist() == [10.0, 20.0]
+
+
+def test_merge_without_shards_fails(tmp_path):
+    with pytest.raises(Exception):
+        merge_shards(tmp_path)
@@ -0,0 +1,64 @@
+import pytest
+
+from src.utils.instrumentation import NULL_CLOCK, StageTimings
+
+
+def test_disabled_timings_record_nothing():
+    timings = StageTimings()
+    assert timings.clock("read") is NULL_CLOCK
+    with timings.measure("decode"):
+        pass
+    assert timings.summary() == {}
+
+
+def test_clock_records_consecutive_stages_and_failures():
+    timings = StageTimings()
+    timings.enabled = True
+    for _ in range(3):
+        clock = timings.clock("read")
+        clock.start("sample")
+        clock.start("threshold")
+        clock.stop()
+    clock = timings.clock("read")
+    clock.start("sample")
+    clock.stop(failed=True)
+
+    summary = timings.summary()
+    assert summary["read.sample"]["count"] == 4
+    assert summary["read.sample"]["failures"] == 1
+    assert summary["read.threshold"]["count"] == 3
+    assert summary["read.threshold"]["failures"] == 0
+
+    with pytest.raises(ValueError):
+        with timings.measure("decode"):
+            raise ValueError()
+    assert timings.summary()["decode"]["failures"] == 1
+
+
+def test_summary_percentiles():
+    timings = StageTimings()
+    timings.enabled = True
+    for duration in range(1, 101):
+        timings.record("stage", 0, duration)
+    stats = timings.summary()["stage"]
+    assert stats["p50"] == 50
+    assert stats["p95"] == 95
+    assert stats["max"] == 100
+    assert stats["mean"] == 50.5
+
+
+def test_listeners_receive_stages_while_disabled():
+    timings = StageTimings()
+    received = []
+
+    def listener(stage, start, end, failed):
+        received.append(stage)
+
+    timings.add_listener(listener)
+    with timings.measure("decode"):
+        pass
+    timings.remove_listener(listener)
+    with timings.measure("decode"):
+        pass
+    assert received == ["decode"]
+    assert timings.summary() == {}
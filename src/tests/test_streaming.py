@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+
+import pytest
+
+from src.defaults import CONFIG_DEFAULTS
+from src.utils.parsing import open_config_with_defaults
+from src.utils.streaming import PipelineOptions, ordered_map, prefetch
+
+
+def test_ordered_map_keeps_input_order():
+    def slow_for_even(item):
+        time.sleep(0.02 if item % 2 == 0 else 0)
+        return item * 10
+
+    results = list(ordered_map(slow_for_even, prefetch(range(20), 2), 4, 2))
+    assert results == [item * 10 for item in range(20)]
+
+
+def test_ordered_map_bounds_items_in_flight():
+    lock = threading.Lock()
+    # started by a worker but not yet consumed
+    in_flight, max_in_flight = 0, 0
+
+    def track(item):
+        nonlocal in_flight, max_in_flight
+        with lock:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        return item
+
+    consumed = 0
+    for _ in ordered_map(track, range(50), 3, 2):
+        time.sleep(0.002)
+        with lock:
+            in_flight -= 1
+        consumed += 1
+    assert consumed == 50
+    assert max_in_flight <= 3 + 2
+
+
+def test_errors_are_raised_at_their_position():
+    def fail_on_three(item):
+        if item == 3:
+            raise ValueError("bad sheet")
+        return item
+
+    received = []
+    with pytest.raises(ValueError, match="bad sheet"):
+        for item in ordered_map(fail_on_three, prefetch(range(10), 2), 2, 2):
+            received.append(item)
+    assert received == [0, 1, 2]
+
+    def failing_source():
+        yield 1
+        raise OSError("unreadable")
+
+    with pytest.raises(OSError, match="unreadable"):
+        list(prefetch(failing_source(), 1))
+
+
+def test_pipeline_options():
+    assert PipelineOptions.from_args({}) == PipelineOptions()
+    options = PipelineOptions.from_args({"workers": 3, "queue_size": 0})
+    assert options == PipelineOptions(workers=3, queue_size=1)
+    assert options.for_tuning_config(CONFIG_DEFAULTS) == options
+
+
+def test_pipeline_options_limit_decoded_images():
+    options = PipelineOptions(workers=4, queue_size=4)
+    assert options.limit_decoded_images(0) == options
+    assert options.limit_decoded_images(12) == options
+    limited = options.limit_decoded_images(8)
+    assert limited == PipelineOptions(workers=4, queue_size=2)
+    assert limited.get_max_decoded_images() <= 8
+    assert options.limit_decoded_images(3) == PipelineOptions(workers=1, queue_size=1)
+    with pytest.raises(Exception, match="at least 3"):
+        options.limit_decoded_images(2)
+    assert PipelineOptions(workers=0, queue_size=4).limit_decoded_images(
+        5
+    ) == PipelineOptions(workers=0, queue_size=2)
+
+
+def test_config_rejects_decoded_image_limits_below_one_per_stage(tmp_path):
+    config_path = tmp_path.joinpath("config.json")
+    for max_decoded_images, valid in [(0, True), (2, False), (3, True)]:
+        config_path.write_text(
+            json.dumps({"memory": {"max_decoded_images": max_decoded_images}})
+        )
+        if valid:
+            open_config_with_defaults(config_path)
+        else:
+            with pytest.raises(Exception, match="config JSON is Invalid"):
+                open_config_with_defaults(config_path)
@@ -157,3 +157,13 @@ def test_safe_missing_label_columns(mocker):
 
     exception = write_jsons_and_run(mocker, modify_template=modify_template)
     assert str(exception) == "No Error"
+
+
+def test_unknown_pre_processor(mocker):
+    def modify_template(template):
+        template["preProcessors"] = [{"name": "CropOnMarker", "options": {}}]
+
+    exception = write_jsons_and_run(mocker, modify_template=modify_template)
+    assert str(exception).startswith(
+        "Unknown pre-processor 'CropOnMarker' in template. Available pre-processors: ["
+    )
@@ -0,0 +1,151 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src.tests.test_samples.sample2.boilerplate import (
+    CONFIG_BOILERPLATE,
+    TEMPLATE_BOILERPLATE,
+)
+from main import entry_point_for_args
+from src.utils.instrumentation import STAGE_TIMINGS, SheetContext
+from src.utils.tracing import TRACER, InMemoryExporter, JsonLinesExporter, Span
+
+
+def get_attributes(span):
+    return {
+        attribute["key"]: next(iter(attribute["value"].values()))
+        for attribute in span["attributes"]
+    }
+
+
+def setup_inputs(tmp_path):
+    input_dir = tmp_path.joinpath("inputs")
+    input_dir.mkdir()
+    sample_dir = Path("src/tests/test_samples/sample2")
+    for file_name in ["omr_marker.jpg", "sample.jpg"]:
+        shutil.copy(sample_dir.joinpath(file_name), input_dir)
+    for file_name, boilerplate in [
+        ("template.json", TEMPLATE_BOILERPLATE),
+        ("config.json", CONFIG_BOILERPLATE),
+    ]:
+        with open(input_dir.joinpath(file_name), "w") as f:
+            json.dump(boilerplate, f)
+    return {
+        "autoAlign": False,
+        "debug": False,
+        "input_paths": [str(input_dir)],
+        "output_dir": str(tmp_path.joinpath("outputs")),
+        "setLayout": False,
+    }
+
+
+def test_pipeline_spans_nest_directory_sheet_and_stages(tmp_path):
+    args = setup_inputs(tmp_path)
+    exporter = InMemoryExporter()
+    TRACER.exporter = exporter
+    try:
+        # not under freeze_time, it fakes perf_counter() on some threads only
+        entry_point_for_args(args)
+    finally:
+        TRACER.exporter = None
+
+    spans_by_id = {span["spanId"]: span for span in exporter.spans}
+    (directory_span,) = [s for s in exporter.spans if s["name"] == "omr.directory"]
+    (sheet_span,) = [s for s in exporter.spans if s["name"] == "omr.sheet"]
+    assert directory_span["parentSpanId"] == ""
+    assert sheet_span["parentSpanId"] == directory_span["spanId"]
+    assert {span["traceId"] for span in exporter.spans} == {directory_span["traceId"]}
+
+    sheet_attributes = get_attributes(sheet_span)
+    assert sheet_attributes["omr.sheet"] == "sample.jpg"
+    assert int(sheet_attributes["omr.image.width"]) > 0
+    assert sheet_attributes["omr.marker_scale"] > 0
+    assert sheet_attributes["omr.outcome"] == "results"
+
+    stage_names = {
+        span["name"]
+        for span in exporter.spans
+        if span["parentSpanId"] == sheet_span["spanId"]
+    }
+    assert {
+        "decode",
+        "preprocess.CropOnMarkers",
+        "read.align",
+        "read.sample",
+        "read.threshold",
+        "write.csv",
+    } <= stage_names
+    for span in exporter.spans:
+        if span["parentSpanId"]:
+            parent = spans_by_id[span["parentSpanId"]]
+            assert int(parent["startTimeUnixNano"]) <= int(span["startTimeUnixNano"])
+        assert int(span["startTimeUnixNano"]) <= int(span["endTimeUnixNano"])
+
+
+def test_failed_sheet_span_is_exported_with_an_error_status(tmp_path, monkeypatch):
+    args = setup_inputs(tmp_path)
+
+    def fail_to_write(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr("src.entry.write_sheet_outputs", fail_to_write)
+    exporter = InMemoryExporter()
+    TRACER.exporter = exporter
+    try:
+        with pytest.raises(RuntimeError):
+            entry_point_for_args(args)
+    finally:
+        TRACER.exporter = None
+
+    spans_by_id = {span["spanId"]: span for span in exporter.spans}
+    (sheet_span,) = [s for s in exporter.spans if s["name"] == "omr.sheet"]
+    assert sheet_span["status"]["code"] == "STATUS_CODE_ERROR"
+    for span in exporter.spans:
+        assert span["parentSpanId"] in ["", *spans_by_id]
+
+
+def test_sheet_span_of_a_sheet_failing_before_its_outputs_is_exported(tmp_path):
+    # the "sheet" stage is never recorded, e.g. when reading the sheet raises
+    exporter = InMemoryExporter()
+    TRACER.exporter = exporter
+    try:
+        with TRACER.trace_pipeline("omr.directory"):
+            with STAGE_TIMINGS.sheet(SheetContext("a.jpg")):
+                with STAGE_TIMINGS.measure("decode"):
+                    pass
+    finally:
+        TRACER.exporter = None
+
+    decode_span, sheet_span, directory_span = exporter.spans
+    assert decode_span["parentSpanId"] == sheet_span["spanId"]
+    assert sheet_span["parentSpanId"] == directory_span["spanId"]
+    assert sheet_span["status"]["code"] == "STATUS_CODE_ERROR"
+    assert int(sheet_span["startTimeUnixNano"]) == int(
+        decode_span["startTimeUnixNano"]
+    )
+
+
+def test_json_lines_exporter_appends_one_span_per_line(tmp_path):
+    trace_path = tmp_path.joinpath("trace.jsonl")
+    exporter = JsonLinesExporter(trace_path)
+    for name in ["decode", "read.sample"]:
+        span = Span(name, "0" * 32, None, 1, {"omr.sheet": "a.jpg", "omr.count": 2})
+        span.end(2, failed=name == "read.sample")
+        exporter.export(span)
+    # the handle stays open between spans
+    assert exporter.file is not None
+    exporter.close()
+
+    with open(trace_path) as f:
+        spans = [json.loads(line) for line in f]
+    assert [span["name"] for span in spans] == ["decode", "read.sample"]
+    assert spans[0]["attributes"][1] == {
+        "key": "omr.count",
+        "value": {"intValue": "2"},
+    }
+    assert [span["status"]["code"] for span in spans] == [
+        "STATUS_CODE_OK",
+        "STATUS_CODE_ERROR",
+    ]
@@ -0,0 +1,124 @@
+import csv
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from main import entry_point_for_args
+from src import entry
+from src.tests.test_samples.sample2.boilerplate import (
+    CONFIG_BOILERPLATE,
+    TEMPLATE_BOILERPLATE,
+)
+from src.utils.watcher import DirectoryWatcher
+
+
+def test_reports_new_images_once_settled(tmp_path):
+    existing = tmp_path.joinpath("existing.jpg")
+    existing.write_bytes(b"scan")
+    watcher = DirectoryWatcher(tmp_path, known_files=[existing], settle_time=0)
+    assert watcher.poll() == []
+
+    new_image = tmp_path.joinpath("new.jpg")
+    new_image.write_bytes(b"part")
+    tmp_path.joinpath("notes.txt").write_bytes(b"not an image")
+    # first sighting, the size is not known to be stable yet
+    assert watcher.poll() == []
+
+    with open(new_image, "ab") as f:
+        f.write(b" of a scan")
+    assert watcher.poll() == []
+    assert watcher.poll() == [new_image]
+    assert watcher.poll() == []
+
+
+def test_picks_up_new_sub_directories(tmp_path):
+    watcher = DirectoryWatcher(tmp_path, settle_time=0)
+    nested_image = tmp_path.joinpath("batch", "day1", "a.png")
+    nested_image.parent.mkdir(parents=True)
+    nested_image.write_bytes(b"scan")
+
+    assert watcher.poll() == []
+    assert watcher.poll() == [nested_image]
+
+
+def test_waits_for_settle_time(tmp_path):
+    watcher = DirectoryWatcher(tmp_path, settle_time=60)
+    tmp_path.joinpath("a.jpg").write_bytes(b"scan")
+
+    assert watcher.poll() == []
+    assert watcher.poll() == []
+
+
+def test_rejects_an_output_dir_inside_the_watched_dir(tmp_path):
+    args = {
+        "autoAlign": False,
+        "debug": False,
+        "input_paths": [str(tmp_path)],
+        "setLayout": False,
+        "watch": True,
+    }
+    for output_dir in [tmp_path, tmp_path.joinpath("outputs")]:
+        with pytest.raises(Exception, match="outside of the watched"):
+            entry_point_for_args({**args, "output_dir": str(output_dir)})
+
+
+def test_corrupt_image_goes_to_the_errors_csv(tmp_path):
+    input_dir = tmp_path.joinpath("inputs")
+    input_dir.mkdir()
+    sample_dir = Path("src/tests/test_samples/sample2")
+    for file_name in ["omr_marker.jpg", "sample.jpg"]:
+        shutil.copy(sample_dir.joinpath(file_name), input_dir)
+    # a scan still being copied over a slow share
+    input_dir.joinpath("truncated.jpg").write_bytes(
+        sample_dir.joinpath("sample.jpg").read_bytes()[:100]
+    )
+    for file_name, boilerplate in [
+        ("template.json", TEMPLATE_BOILERPLATE),
+        ("config.json", CONFIG_BOILERPLATE),
+    ]:
+        with open(input_dir.joinpath(file_name), "w") as f:
+            json.dump(boilerplate, f)
+    output_dir = tmp_path.joinpath("outputs")
+
+    entry_point_for_args(
+        {
+            "autoAlign": False,
+            "debug": False,
+            "input_paths": [str(input_dir)],
+            "output_dir": str(output_dir),
+            "setLayout": False,
+        }
+    )
+
+    with open(output_dir.joinpath("Manual", "ErrorFiles.csv")) as f:
+        error_rows = list(csv.reader(f))[1:]
+    assert [row[0] for row in error_rows] == ["truncated.jpg"]
+
+
+def test_watch_keeps_polling_after_a_failed_batch(tmp_path, monkeypatch):
+    new_image = tmp_path.joinpath("a.jpg")
+    polls = iter([[new_image], [new_image]])
+
+    class FakeWatcher:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def poll(self):
+            new_files = next(polls, None)
+            if new_files is None:
+                raise KeyboardInterrupt
+            return new_files
+
+    batches = []
+
+    def fail_to_process(input_dir, curr_dir, omr_files, *args):
+        batches.append(omr_files)
+        raise AttributeError("'NoneType' object has no attribute 'shape'")
+
+    monkeypatch.setattr(entry, "DirectoryWatcher", FakeWatcher)
+    monkeypatch.setattr(entry, "process_new_files", fail_to_process)
+    entry.watch_dir(tmp_path, {}, [], {})
+
+    assert batches == [[new_image], [new_image]]
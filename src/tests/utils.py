@@ -95,3 +95,14 @@ def generate_write_jsons_and_run(
         return exception
 
     return write_jsons_and_run
+
+
+def make_raw_read(value):
+    return {
+        "bubble_values": [value] * 5,
+        "strip_lengths": [2, 3],
+        "strip_thresholds": [value, value],
+        "global_threshold": value,
+        "global_std_threshold": 1.0,
+        "shifts": [0],
+    }
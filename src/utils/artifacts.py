@@ -0,0 +1,140 @@
+"""
+Write-behind output of annotated images and debug stacks.
+
+Encoding a full page image takes about as long as reading its bubbles, so
+read_omr_response hands the images to an ArtifactWriter and returns right away.
+The writer's thread pool encodes and writes them; at most max_pending images
+wait in its queue, submit() blocks beyond that.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from src.utils.image import ImageUtils
+from src.utils.instrumentation import STAGE_TIMINGS
+
+
+def get_output_file_name(file_name, outputs_config):
+    """Name of the annotated image for an input file, with the extension of
+    the configured image_format"""
+    image_format = outputs_config.image_format
+    if image_format == "same_as_input":
+        return file_name
+    return f"{os.path.splitext(file_name)[0]}.{image_format}"
+
+
+def get_stack_extension(outputs_config):
+    image_format = outputs_config.image_format
+    return "jpg" if image_format == "same_as_input" else image_format
+
+
+def get_imwrite_params(path, outputs_config):
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension in [".jpg", ".jpeg"]:
+        return [cv2.IMWRITE_JPEG_QUALITY, int(outputs_config.jpeg_quality)]
+    if extension == ".png" and outputs_config.png_compression is not None:
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(outputs_config.png_compression)]
+    if extension == ".webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(outputs_config.webp_quality)]
+    return []
+
+
+class ArtifactWriter:
+    def __init__(self, outputs_config, max_workers=2, max_pending=8):
+        self.outputs_config = outputs_config
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="omr-artifacts"
+        )
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, _exc_value, _traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # keep the original error, pending writes still complete
+            self.executor.shutdown(wait=True)
+
+    def save_img(self, path, image):
+        self.submit(
+            ImageUtils.save_img,
+            str(path),
+            image,
+            get_imwrite_params(path, self.outputs_config),
+        )
+
+    def submit(self, func, *args):
+        """Runs func(*args) on the writer threads, the arguments must not be
+        modified by the caller afterwards"""
+        self.slots.acquire()
+        try:
+            # the write is a stage of the sheet being worked on
+            future = self.executor.submit(
+                self.run, func, args, STAGE_TIMINGS.get_current_sheet()
+            )
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self.on_done)
+
+    @staticmethod
+    def run(func, args, sheet_context=None):
+        with STAGE_TIMINGS.sheet(sheet_context), STAGE_TIMINGS.measure(
+            "write.artifact"
+        ):
+            func(*args)
+
+    def on_done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+            if future.exception() is not None:
+                self.errors.append(future.exception())
+        self.slots.release()
+
+    def flush(self):
+        """Barrier: waits for everything submitted so far to be written and
+        re-raises the first failure"""
+        while True:
+            with self.lock:
+                pending = list(self.pending)
+            if not pending:
+                break
+            for future in pending:
+                future.exception()
+        with self.lock:
+            errors, self.errors = self.errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+class SynchronousWriter:
+    """Same interface as ArtifactWriter, writes on the calling thread"""
+
+    def __init__(self, outputs_config):
+        self.outputs_config = outputs_config
+
+    def save_img(self, path, image):
+        ImageUtils.save_img(
+            str(path), image, get_imwrite_params(path, self.outputs_config)
+        )
+
+    def submit(self, func, *args):
+        func(*args)
+
+    def flush(self):
+        pass
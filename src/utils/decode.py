@@ -0,0 +1,108 @@
+"""
+Decode planning: pick the cheapest cv2.imread mode that still yields at least
+the processing resolution.
+
+libjpeg can decode straight to 1/2, 1/4 or 1/8 of the size by scaling in the
+DCT domain (cv2.IMREAD_REDUCED_GRAYSCALE_*), which skips most of the inverse
+transform and never allocates the full resolution page. Other formats decode at
+full size anyway, so they keep the plain grayscale read.
+"""
+import struct
+
+import cv2
+
+REDUCED_GRAYSCALE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+}
+
+JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF
+}
+# markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def read_jpeg_size(f):
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        marker = f.read(1)
+        while marker == b"\xff":
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            # end of image or start of scan before any frame header
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        (length,) = struct.unpack(">H", length_bytes)
+        if marker in JPEG_SOF_MARKERS:
+            header = f.read(5)
+            if len(header) < 5:
+                return None
+            height, width = struct.unpack(">HH", header[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def read_png_size(f):
+    header = f.read(24)
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", header[16:24])
+    return width, height
+
+
+def read_image_header(file_path):
+    """Returns (format, (width, height)) from the file header without decoding,
+    or (None, None) for unknown or broken headers"""
+    try:
+        with open(file_path, "rb") as f:
+            signature = f.read(8)
+            f.seek(0)
+            if signature.startswith(b"\xff\xd8"):
+                return "jpeg", read_jpeg_size(f)
+            if signature == PNG_SIGNATURE:
+                return "png", read_png_size(f)
+    except OSError:
+        pass
+    return None, None
+
+
+def plan_decode_flag(file_path, processing_width, processing_height):
+    image_format, size = read_image_header(file_path)
+    if image_format != "jpeg" or not size:
+        return cv2.IMREAD_GRAYSCALE
+    # compare short and long sides, EXIF orientation may swap width and height
+    short_side, long_side = sorted(size)
+    target_short, target_long = sorted((processing_width, processing_height))
+    for factor, flag in REDUCED_GRAYSCALE_FLAGS.items():
+        # libjpeg rounds the scaled size up
+        if (
+            -(-short_side // factor) >= target_short
+            and -(-long_side // factor) >= target_long
+        ):
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode_image(file_path, tuning_config):
+    flag = cv2.IMREAD_GRAYSCALE
+    if tuning_config.dimensions.reduced_decode:
+        flag = plan_decode_flag(
+            file_path,
+            tuning_config.dimensions.processing_width,
+            tuning_config.dimensions.processing_height,
+        )
+    return cv2.imread(str(file_path), flag)
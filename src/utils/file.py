@@ -1,12 +1,11 @@
 import argparse
+import csv
 import json
 import os
-from csv import QUOTE_NONNUMERIC
 from time import localtime, strftime
 
-import pandas as pd
-
 from src.logger import logger
+from src.utils.instrumentation import STAGE_TIMINGS
 
 
 def load_json(path, **rest):
@@ -19,6 +18,40 @@ def load_json(path, **rest):
     return loaded
 
 
+def append_csv_rows(file_path_or_obj, rows):
+    """Appends rows to a csv file given by path or as an open file,
+    every value is written as a quoted string"""
+    rows = [["" if value is None else str(value) for value in row] for row in rows]
+    with STAGE_TIMINGS.measure("write.csv"):
+        if isinstance(file_path_or_obj, (str, os.PathLike)):
+            with open(file_path_or_obj, "a", newline="") as f:
+                write_csv_rows(f, rows)
+        else:
+            write_csv_rows(file_path_or_obj, rows)
+            file_path_or_obj.flush()
+
+
+def write_csv_rows(f, rows):
+    csv.writer(f, quoting=csv.QUOTE_NONNUMERIC, lineterminator=os.linesep).writerows(
+        rows
+    )
+
+
+def drop_csv_rows(file_path, should_drop):
+    """Rewrites a csv file without the data rows for which should_drop(row) is
+    true, the header row is kept. Returns the number of dropped rows"""
+    with open(file_path, "r", newline="") as f:
+        rows = list(csv.reader(f))
+    kept_rows = rows[:1] + [row for row in rows[1:] if not should_drop(row)]
+    dropped = len(rows) - len(kept_rows)
+    if dropped > 0:
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "w", newline="") as f:
+            write_csv_rows(f, kept_rows)
+        os.replace(temp_path, file_path)
+    return dropped
+
+
 class Paths:
     def __init__(self, output_dir):
         self.output_dir = output_dir
@@ -28,6 +61,8 @@ class Paths:
         self.evaluation_dir = output_dir.joinpath("Evaluation")
         self.errors_dir = self.manual_dir.joinpath("ErrorFiles")
         self.multi_marked_dir = self.manual_dir.joinpath("MultiMarkedFiles")
+        # sheets processed into this directory, see src/utils/manifest.py
+        self.manifest_path = self.results_dir.joinpath("ProcessedFiles.jsonl")
 
 
 def setup_dirs_for_paths(paths):
@@ -66,7 +101,8 @@ def setup_outputs_for_template(paths, template):
         "output_path",
         "score",
     ] + template.output_columns
-    ns.OUTPUT_SET = []
+    # set by process_dir when processed sheets should be recorded
+    ns.manifest = None
     ns.files_obj = {}
     TIME_NOW_HRS = strftime("%I%p", localtime())
     ns.filesMap = {
@@ -75,19 +111,26 @@ def setup_outputs_for_template(paths, template):
         "Errors": os.path.join(paths.manual_dir, "ErrorFiles.csv"),
     }
 
+    # Written at the end of the run when outputs.save_raw_reads is on
+    ns.raw_reads_path = os.path.join(paths.results_dir, f"RawReads_{TIME_NOW_HRS}.npz")
+
+    # Written at the end of the run when stage timings are enabled
+    ns.stage_timings_path = os.path.join(
+        paths.results_dir, f"StageTimings_{TIME_NOW_HRS}.json"
+    )
+
+    # Prefix of the .prof, .collapsed.txt and .json files written with --profile
+    ns.profile_path_prefix = os.path.join(paths.results_dir, f"Profile_{TIME_NOW_HRS}")
+
+    # Written at the end of the run with --memory or memory.tracemalloc
+    ns.memory_path = os.path.join(paths.results_dir, f"Memory_{TIME_NOW_HRS}.json")
+
     for file_key, file_name in ns.filesMap.items():
         if not os.path.exists(file_name):
             logger.info(f"Created new file: '{file_name}'")
-            # moved handling of files to pandas csv writer
             ns.files_obj[file_key] = file_name
             # Create Header Columns
-            pd.DataFrame([ns.sheetCols], dtype=str).to_csv(
-                ns.files_obj[file_key],
-                mode="a",
-                quoting=QUOTE_NONNUMERIC,
-                header=False,
-                index=False,
-            )
+            append_csv_rows(ns.files_obj[file_key], [ns.sheetCols])
         else:
             logger.info(f"Present : appending to '{file_name}'")
             ns.files_obj[file_key] = open(file_name, "a")
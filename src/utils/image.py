@@ -7,38 +7,46 @@
 
 """
 import os
+import sys
 import tempfile
 
-mpl_config_dir = os.environ.setdefault(
-    "MPLCONFIGDIR",
-    os.path.join(tempfile.gettempdir(), "omr-checker-matplotlib"),
-)
-os.makedirs(mpl_config_dir, exist_ok=True)
-
 import cv2
-import matplotlib.pyplot as plt
 import numpy as np
 
 from src.logger import logger
 
-plt.rcParams["figure.figsize"] = (10.0, 8.0)
 CLAHE_HELPER = cv2.createCLAHE(clipLimit=5.0, tileGridSize=(8, 8))
 
 
+def get_pyplot():
+    # matplotlib is slow to import and only needed for the debug plots
+    # (show_image_level >= 5), so it is loaded on first use
+    if "matplotlib.pyplot" not in sys.modules:
+        mpl_config_dir = os.environ.setdefault(
+            "MPLCONFIGDIR",
+            os.path.join(tempfile.gettempdir(), "omr-checker-matplotlib"),
+        )
+        os.makedirs(mpl_config_dir, exist_ok=True)
+        import matplotlib.pyplot as plt
+
+        plt.rcParams["figure.figsize"] = (10.0, 8.0)
+    return sys.modules["matplotlib.pyplot"]
+
+
 class ImageUtils:
     """A Static-only Class to hold common image processing utilities & wrappers over OpenCV functions"""
 
     @staticmethod
-    def save_img(path, final_marked):
+    def save_img(path, final_marked, params=None):
         logger.info(f"Saving Image to '{path}'")
-        cv2.imwrite(path, final_marked)
+        cv2.imwrite(path, final_marked, params or [])
 
     @staticmethod
-    def resize_util(img, u_width, u_height=None):
+    def resize_util(img, u_width, u_height=None, dst=None):
         if u_height is None:
             h, w = img.shape[:2]
             u_height = int(h * u_width / w)
-        return cv2.resize(img, (int(u_width), int(u_height)))
+        return cv2.resize(img, (int(u_width), int(u_height)), dst=dst)
 
     @staticmethod
     def resize_util_h(img, u_height, u_width=None):
@@ -78,8 +86,8 @@ class ImageUtils:
         return cnts
 
     @staticmethod
-    def normalize_util(img, alpha=0, beta=255):
-        return cv2.normalize(img, alpha, beta, norm_type=cv2.NORM_MINMAX)
+    def normalize_util(img, alpha=0, beta=255, dst=None):
+        return cv2.normalize(img, dst, alpha, beta, norm_type=cv2.NORM_MINMAX)
 
     @staticmethod
     def auto_canny(image, sigma=0.93):
@@ -95,7 +103,7 @@ class ImageUtils:
         return edged
 
     @staticmethod
-    def adjust_gamma(image, gamma=1.0):
+    def adjust_gamma(image, gamma=1.0, dst=None):
         # build a lookup table mapping the pixel values [0, 255] to
         # their adjusted gamma values
         inv_gamma = 1.0 / gamma
@@ -104,7 +112,7 @@ class ImageUtils:
         ).astype("uint8")
 
         # apply gamma correction using the lookup table
-        return cv2.LUT(image, table)
+        return cv2.LUT(image, table, dst)
 
     @staticmethod
     def four_point_transform(image, pts):
@@ -0,0 +1,163 @@
+"""
+Stage timing instrumentation for the processing pipeline.
+
+Disabled by default: measure() and clock() then hand out shared no-op objects,
+so the instrumented code paths only pay for an attribute lookup and a call.
+"""
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+
+class NullClock:
+    def start(self, stage):
+        pass
+
+    def stop(self, failed=False):
+        pass
+
+
+NULL_CLOCK = NullClock()
+NULL_CONTEXT = nullcontext()
+
+
+class StageClock:
+    """Times consecutive stages of one function: start() closes the running
+    stage and opens the next one, stop() closes the running stage"""
+
+    def __init__(self, timings, prefix):
+        self.timings = timings
+        self.prefix = prefix
+        self.stage = None
+        self.started = None
+
+    def start(self, stage):
+        now = perf_counter()
+        if self.stage is not None:
+            self.timings.record(self.stage, self.started, now)
+        self.stage, self.started = f"{self.prefix}.{stage}", now
+
+    def stop(self, failed=False):
+        if self.stage is not None:
+            self.timings.record(self.stage, self.started, perf_counter(), failed)
+            self.stage = None
+
+
+class SheetContext:
+    """The sheet a thread is working on, read by the listeners of its stages.
+    A sheet moves between threads, each stage enters its context again"""
+
+    def __init__(self, name):
+        self.name = name
+        # e.g. image size and detected scale, see StageTimings.annotate()
+        self.attributes = {}
+
+
+class StageTimings:
+    def __init__(self):
+        self.enabled = False
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    @property
+    def active(self):
+        return self.enabled or len(self.listeners) > 0
+
+    def reset(self):
+        with self.lock:
+            self.durations = defaultdict(list)
+            self.failures = defaultdict(int)
+
+    def add_listener(self, listener):
+        """listener(stage, start, end, failed) is called for every recorded stage,
+        start and end are perf_counter() values"""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def record(self, stage, start, end, failed=False):
+        if self.enabled:
+            with self.lock:
+                self.durations[stage].append(end - start)
+                if failed:
+                    self.failures[stage] += 1
+        for listener in self.listeners:
+            listener(stage, start, end, failed)
+
+    @contextmanager
+    def sheet(self, sheet_context):
+        previous = getattr(self.local, "sheet", None)
+        self.local.sheet = sheet_context
+        try:
+            yield sheet_context
+        finally:
+            self.local.sheet = previous
+
+    def get_current_sheet(self):
+        return getattr(self.local, "sheet", None)
+
+    def annotate(self, key, value):
+        """Attaches an attribute to the sheet of this thread, while listened to"""
+        sheet_context = self.get_current_sheet()
+        if self.listeners and sheet_context is not None:
+            sheet_context.attributes[key] = value
+
+    def measure(self, stage):
+        if not self.active:
+            return NULL_CONTEXT
+        return self._measure(stage)
+
+    @contextmanager
+    def _measure(self, stage):
+        start = perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.record(stage, start, perf_counter(), failed=True)
+            raise
+        self.record(stage, start, perf_counter())
+
+    def clock(self, prefix):
+        if not self.active:
+            return NULL_CLOCK
+        return StageClock(self, prefix)
+
+    def summary(self):
+        summary = {}
+        with self.lock:
+            stages = {stage: sorted(values) for stage, values in self.durations.items()}
+            failures = dict(self.failures)
+        for stage, values in stages.items():
+            count = len(values)
+            summary[stage] = {
+                "count": count,
+                "failures": failures.get(stage, 0),
+                "mean": round(sum(values) / count, 6),
+                "p50": round(percentile(values, 50), 6),
+                "p95": round(percentile(values, 95), 6),
+                "max": round(values[-1], 6),
+                "total": round(sum(values), 6),
+            }
+        return summary
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
+
+
+def percentile(sorted_values, q):
+    # nearest-rank percentile over already sorted values
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+# Singleton export
+STAGE_TIMINGS = StageTimings()
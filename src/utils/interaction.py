@@ -61,12 +61,8 @@ def get_monitor_window() -> Optional[object]:
 @dataclass
 class ImageMetrics:
     # TODO: Move TEXT_SIZE, etc here and find a better class name
-    monitor_window = get_monitor_window()
-    if monitor_window:
-        window_width, window_height = monitor_window.width, monitor_window.height
-    else:
-        # Default values for headless environment
-        window_width, window_height = 1920, 1080
+    # Default values until the monitor is looked up on the first show()
+    window_width, window_height = 1920, 1080
     # for positioning image windows
     window_x, window_y = 0, 0
     reset_pos = [0, 0]
@@ -85,6 +81,8 @@ class InteractionUtils:
             return
             
         image_metrics = InteractionUtils.image_metrics
+        image_metrics.window_width = monitor_window.width
+        image_metrics.window_height = monitor_window.height
         if origin is None:
             logger.info(f"'{name}' - NoneType image to show!")
             if pause:
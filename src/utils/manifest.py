@@ -0,0 +1,119 @@
+"""
+Append-only record of the sheets processed into an output directory, used by
+--resume to skip the sheets that are unchanged since they were last processed.
+
+Each line is a json object: the path of the sheet relative to its input
+directory, its size and mtime, the hash of the template setup it was read with,
+and the outcome (which csv it was written to). Later lines win.
+
+Every run records its sheets, so record() only stats them: reading each sheet
+again to hash it would double the input I/O. Manifests written by earlier
+versions also carry a content hash, compared when the mtime differs.
+"""
+import hashlib
+import json
+import os
+
+from src.logger import logger
+
+OUTCOME_RESULTS = "results"
+OUTCOME_MULTI_MARKED = "multi_marked"
+OUTCOME_ERROR = "error"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_template_setup(template, tuning_config, evaluation_config=None):
+    """Hash of everything that decides how a sheet gets read and scored"""
+    digest = hashlib.sha1()
+    for path in [template.path, evaluation_config and evaluation_config.path]:
+        if path is not None:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    digest.update(
+        json.dumps(tuning_config.toDict(), sort_keys=True, default=str).encode()
+    )
+    return digest.hexdigest()
+
+
+class ProcessedFilesManifest:
+    def __init__(self, manifest_path, input_dir, template_hash):
+        self.manifest_path = manifest_path
+        self.input_dir = input_dir
+        self.template_hash = template_hash
+        self.entries = self.load_entries(manifest_path)
+        # checked before the first append, see ends_with_partial_line
+        self.line_end_checked = False
+
+    @staticmethod
+    def load_entries(manifest_path):
+        entries = {}
+        if not os.path.exists(manifest_path):
+            return entries
+        with open(manifest_path, "r") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    entry = json.loads(line)
+                    entries[entry["path"]] = entry
+                except (json.decoder.JSONDecodeError, KeyError, TypeError):
+                    # a run that crashed mid-write may leave a partial last line
+                    logger.warning(
+                        f"Skipping unreadable line {line_number} of '{manifest_path}'"
+                    )
+        return entries
+
+    @staticmethod
+    def ends_with_partial_line(manifest_path):
+        if not os.path.exists(manifest_path) or os.path.getsize(manifest_path) == 0:
+            return False
+        with open(manifest_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def relative_path(self, file_path):
+        return os.path.relpath(file_path, self.input_dir)
+
+    def is_unchanged(self, file_path):
+        entry = self.entries.get(self.relative_path(file_path))
+        if entry is None or entry.get("template") != self.template_hash:
+            return False
+        stat = os.stat(file_path)
+        if stat.st_size != entry.get("size"):
+            return False
+        if stat.st_mtime_ns == entry.get("mtime_ns"):
+            return True
+        if "sha1" not in entry:
+            return False
+        # touched or copied over, compare the content before reprocessing
+        return hash_file(file_path) == entry["sha1"]
+
+    def filter_changed(self, omr_files):
+        return [
+            file_path for file_path in omr_files if not self.is_unchanged(file_path)
+        ]
+
+    def record(self, file_path, outcome):
+        stat = os.stat(file_path)
+        entry = {
+            "path": self.relative_path(file_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "template": self.template_hash,
+            "outcome": outcome,
+        }
+        self.entries[entry["path"]] = entry
+        line = json.dumps(entry) + "\n"
+        if not self.line_end_checked:
+            # the partial line of a crashed run would swallow this entry
+            if self.ends_with_partial_line(self.manifest_path):
+                line = "\n" + line
+            self.line_end_checked = True
+        with open(self.manifest_path, "a") as f:
+            f.write(line)
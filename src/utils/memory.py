@@ -0,0 +1,202 @@
+"""
+Memory usage of a run: RSS sampling, a peak-RSS guardrail and, with
+memory.tracemalloc, the traced allocations per pipeline stage.
+
+A thread samples the RSS of the process while the sheets of a directory are
+processed. The first time it goes above memory.max_rss_mb (or --maxRssMb) the
+degrade callbacks run once, e.g. the debug image stacks stop being kept, so the
+run goes on with less memory instead of being killed.
+With tracemalloc the traced memory is recorded at the end of every stage of
+STAGE_TIMINGS, and a snapshot taken at the traced peak gives the top
+allocation sites in Memory_*.json.
+"""
+import gc
+import json
+import os
+import sys
+import threading
+import tracemalloc
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from src.logger import logger
+from src.utils.instrumentation import STAGE_TIMINGS
+
+MB = 2**20
+# a new snapshot is taken when the traced memory grows this much past the last one
+SNAPSHOT_GROWTH = 1.1
+TOP_ALLOCATIONS = 10
+
+
+def read_rss():
+    """Current RSS in bytes, the peak RSS where /proc is missing, None on Windows"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def to_mb(size):
+    return None if size is None else round(size / MB, 1)
+
+
+@dataclass(frozen=True)
+class MemoryOptions:
+    # saves Memory_*.json next to the Results CSV
+    report: bool = False
+    # None takes memory.max_rss_mb of config.json, 0 for no limit
+    max_rss_mb: Optional[int] = None
+    tracemalloc: bool = False
+    # seconds between two RSS samples
+    sample_interval: float = 0.1
+
+    @staticmethod
+    def from_args(args):
+        max_rss_mb = args.get("max_rss_mb")
+        return MemoryOptions(
+            report=bool(args.get("memory", False)),
+            max_rss_mb=None if max_rss_mb is None else max(0, int(max_rss_mb)),
+        )
+
+    def for_tuning_config(self, tuning_config):
+        memory_config = tuning_config.memory
+        return replace(
+            self,
+            max_rss_mb=memory_config.max_rss_mb
+            if self.max_rss_mb is None
+            else self.max_rss_mb,
+            tracemalloc=self.tracemalloc or memory_config.tracemalloc,
+        )
+
+
+class MemoryMonitor:
+    """Context manager sampling the RSS of the process, see the module docstring.
+    `degrade_actions` are (description, callback) pairs run when the limit is hit."""
+
+    def __init__(self, options, degrade_actions=()):
+        self.options = options
+        self.degrade_actions = list(degrade_actions)
+        self.rss_samples = 0
+        self.start_rss = self.peak_rss = self.end_rss = None
+        self.limit_hit = False
+        self.degraded = []
+        self.summary = None
+        self.started_tracemalloc = False
+        self.stage_traced = {}
+        self.snapshot = None
+        self.snapshot_traced = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="omr-memory-sampler", daemon=True
+        )
+
+    def __enter__(self):
+        if self.options.tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        if self.options.tracemalloc:
+            STAGE_TIMINGS.add_listener(self.record_stage)
+        self.start_rss = self.sample()
+        self.thread.start()
+        return self
+
+    def __exit__(self, _exc_type, _exc_value, _traceback):
+        self.stopped.set()
+        self.thread.join()
+        self.end_rss = self.sample()
+        if self.options.tracemalloc:
+            STAGE_TIMINGS.remove_listener(self.record_stage)
+            self.take_snapshot()
+        self.summary = self.get_summary()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+
+    def run(self):
+        while not self.stopped.wait(self.options.sample_interval):
+            self.sample()
+            if self.options.tracemalloc:
+                self.take_snapshot()
+
+    def sample(self):
+        rss = read_rss()
+        if rss is None:
+            return None
+        limit = (self.options.max_rss_mb or 0) * MB
+        with self.lock:
+            self.rss_samples += 1
+            self.peak_rss = rss if self.peak_rss is None else max(self.peak_rss, rss)
+            should_degrade = limit and rss > limit and not self.limit_hit
+            if should_degrade:
+                self.limit_hit = True
+        if should_degrade:
+            self.degrade(rss)
+        return rss
+
+    def degrade(self, rss):
+        logger.warning(
+            f"RSS of {to_mb(rss)} MB is above the limit of {self.options.max_rss_mb} MB, "
+            f"{', '.join(name for name, _ in self.degrade_actions) or 'nothing to release'}"
+        )
+        for name, callback in self.degrade_actions:
+            callback()
+            self.degraded.append(name)
+        gc.collect()
+
+    def record_stage(self, stage, _start, _end, _failed):
+        traced, _peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            self.stage_traced[stage] = max(self.stage_traced.get(stage, 0), traced)
+
+    def take_snapshot(self):
+        if not tracemalloc.is_tracing():
+            return
+        traced, _peak = tracemalloc.get_traced_memory()
+        if traced > self.snapshot_traced * SNAPSHOT_GROWTH:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_traced = traced
+
+    def get_top_allocations(self):
+        if self.snapshot is None:
+            return []
+        snapshot = self.snapshot.filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        return [
+            {
+                "site": f"{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}",
+                "size_mb": to_mb(statistic.size),
+                "count": statistic.count,
+            }
+            for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        ]
+
+    def get_summary(self):
+        summary = {
+            "start_rss_mb": to_mb(self.start_rss),
+            "peak_rss_mb": to_mb(self.peak_rss),
+            "end_rss_mb": to_mb(self.end_rss),
+            "max_rss_mb": self.options.max_rss_mb or None,
+            "limit_hit": self.limit_hit,
+            "degraded": list(self.degraded),
+        }
+        if self.options.tracemalloc:
+            summary["traced_peak_mb"] = to_mb(tracemalloc.get_traced_memory()[1])
+            summary["stage_traced_mb"] = {
+                stage: to_mb(traced)
+                for stage, traced in sorted(self.stage_traced.items())
+            }
+            summary["top_allocations"] = self.get_top_allocations()
+        return summary
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary, f, indent=2)
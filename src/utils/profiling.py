@@ -0,0 +1,240 @@
+"""
+--profile: runs process_files under cProfile and a stack sampler.
+
+cProfile only sees the thread that enabled it, so every thread started while
+profiling (the prefetch thread, the compute workers, the artifact writers)
+gets a profile of its own, and they are merged into one .prof file.
+The sampler reads the stacks of all threads every few milliseconds and
+writes them in the collapsed format of flamegraph.pl and speedscope, each
+stack rooted at the sheet being read (or the thread) and its pipeline stage:
+
+    sheet_0001.jpg;preprocess.CropOnMarkers;...;CropOnMarkers.getBestMatch 42
+
+A function filter (a regular expression, e.g. "CropOnMarkers.getBestMatch" or
+"preprocess.CropOnMarkers") keeps only the matching stacks and hot functions.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+# functions that start a pipeline stage, see STAGE_TIMINGS for the same names
+STAGE_FUNCTIONS = {
+    "decode_image": "decode",
+    "ImageInstanceOps.read_omr_response": "read",
+    "evaluate_concatenated_response": "evaluate",
+    "append_csv_rows": "write.csv",
+    "ArtifactWriter.run": "write.artifact",
+}
+# functions whose file_path local is the sheet being worked on
+SHEET_FUNCTIONS = {"decode_image", "read_omr_sheet", "write_sheet_outputs"}
+# threads that wait for work are left out of the samples and the hot functions
+IDLE_FILE_NAMES = {"threading.py", "queue.py", "thread.py", "_base.py"}
+IDLE_FUNCTIONS = {
+    "<method 'acquire' of '_thread.lock' objects>",
+    "<method 'acquire' of '_thread.RLock' objects>",
+    "<method 'get' of '_queue.SimpleQueue' objects>",
+}
+
+
+@dataclass(frozen=True)
+class ProfileOptions:
+    enabled: bool = False
+    # hot functions kept in the summary
+    top_n: int = 20
+    # regular expression on "module.Class.function" and stage names
+    function_filter: Optional[str] = None
+    # seconds between two stack samples
+    sample_interval: float = 0.005
+
+    @staticmethod
+    def from_args(args):
+        defaults = ProfileOptions()
+        top_n = args.get("profile_top")
+        return ProfileOptions(
+            enabled=bool(args.get("profile", False)),
+            top_n=defaults.top_n if top_n is None else max(1, int(top_n)),
+            function_filter=args.get("profile_filter") or None,
+        )
+
+
+def get_qualname(frame):
+    code = frame.f_code
+    qualname = getattr(code, "co_qualname", None)
+    if qualname is not None:
+        return qualname
+    # co_qualname is new in Python 3.11, before it the class of a method is
+    # taken from its self (or cls) argument
+    if code.co_argcount > 0 and code.co_varnames[0] in ["self", "cls"]:
+        owner = frame.f_locals.get(code.co_varnames[0])
+        if owner is not None:
+            owner = owner if isinstance(owner, type) else type(owner)
+            return f"{owner.__name__}.{code.co_name}"
+    return code.co_name
+
+
+def get_frame_label(code, qualname):
+    module_name = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module_name}.{qualname}"
+
+
+def get_stage(qualname):
+    if qualname.endswith(".apply_filter"):
+        return f"preprocess.{qualname.split('.')[0]}"
+    return STAGE_FUNCTIONS.get(qualname)
+
+
+class StackSampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stage_samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="omr-profile-sampler", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            thread_names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.sample(frame, thread_names.get(thread_id, str(thread_id)))
+
+    def sample(self, frame, thread_name):
+        if os.path.basename(frame.f_code.co_filename) in IDLE_FILE_NAMES:
+            return
+        labels, root, stage = [], thread_name, None
+        while frame is not None:
+            code, qualname = frame.f_code, get_qualname(frame)
+            labels.append(get_frame_label(code, qualname))
+            if stage is None:
+                stage = get_stage(qualname)
+            if code.co_name in SHEET_FUNCTIONS and root == thread_name:
+                file_path = frame.f_locals.get("file_path")
+                if file_path is not None:
+                    root = os.path.basename(str(file_path))
+            frame = frame.f_back
+        labels.reverse()
+        stage = stage or "other"
+        self.stacks[";".join([root, stage] + labels)] += 1
+        self.stage_samples[stage] += 1
+
+
+class PipelineProfiler:
+    """Context manager writing <path_prefix>.prof, <path_prefix>.collapsed.txt
+    and the summary <path_prefix>.json"""
+
+    def __init__(self, path_prefix, options):
+        self.path_prefix = path_prefix
+        self.options = options
+        self.filter_pattern = (
+            re.compile(options.function_filter) if options.function_filter else None
+        )
+        self.main_profile = cProfile.Profile()
+        self.thread_profiles = []
+        self.lock = threading.Lock()
+        self.sampler = StackSampler(options.sample_interval)
+        self.summary = None
+
+    def profile_thread(self, _frame, _event, _arg):
+        # installed by threading.setprofile in every new thread, hands over to
+        # a cProfile of that thread on its first event
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles all threads with the profile of the main one
+            return
+        with self.lock:
+            self.thread_profiles.append(profile)
+
+    def __enter__(self):
+        # started first, the sampler itself is not profiled
+        self.sampler.start()
+        threading.setprofile(self.profile_thread)
+        self.main_profile.enable()
+        return self
+
+    def __exit__(self, _exc_type, _exc_value, _traceback):
+        self.main_profile.disable()
+        threading.setprofile(None)
+        self.sampler.stop()
+        self.save()
+
+    def matches(self, text):
+        return self.filter_pattern is None or self.filter_pattern.search(text)
+
+    def get_stats(self):
+        stats = pstats.Stats(self.main_profile)
+        with self.lock:
+            thread_profiles = list(self.thread_profiles)
+        for profile in thread_profiles:
+            profile.create_stats()
+            if profile.stats:
+                stats.add(profile)
+        return stats
+
+    def get_hot_functions(self, stats):
+        hot_functions = []
+        for (file_name, _line, function_name), entry in stats.stats.items():
+            _primitive_calls, calls, own_time, cumulative_time, _callers = entry
+            if (
+                function_name in IDLE_FUNCTIONS
+                or os.path.basename(file_name) in IDLE_FILE_NAMES
+            ):
+                continue
+            module_name = os.path.splitext(os.path.basename(file_name))[0]
+            # built-in functions have no file
+            label = (
+                function_name if module_name == "~" else f"{module_name}.{function_name}"
+            )
+            if self.matches(label):
+                hot_functions.append(
+                    {
+                        "function": label,
+                        "calls": calls,
+                        "own_s": round(own_time, 6),
+                        "cumulative_s": round(cumulative_time, 6),
+                    }
+                )
+        hot_functions.sort(key=lambda item: -item["own_s"])
+        return hot_functions[: self.options.top_n]
+
+    def save(self):
+        stats = self.get_stats()
+        stats.dump_stats(f"{self.path_prefix}.prof")
+        stacks = {
+            stack: count
+            for stack, count in self.sampler.stacks.items()
+            if self.matches(stack)
+        }
+        with open(f"{self.path_prefix}.collapsed.txt", "w") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        self.summary = {
+            "function_filter": self.options.function_filter,
+            "sample_interval_s": self.options.sample_interval,
+            "samples": sum(stacks.values()),
+            "stage_samples": dict(self.sampler.stage_samples.most_common()),
+            "hot_functions": self.get_hot_functions(stats),
+        }
+        with open(f"{self.path_prefix}.json", "w") as f:
+            json.dump(self.summary, f, indent=2)
@@ -0,0 +1,190 @@
+"""
+Raw-read store: what read_omr_response measured on each sheet, kept so that
+`main.py rescore` can apply new thresholds or a new answer key without reading
+the images again.
+
+One .npz per output directory and run hour, with a row per sheet:
+  input_paths        (N,)    the sheet's input path
+  bubble_values      (N, B)  mean intensity of every bubble, in traversal order
+  strip_thresholds   (N, S)  local threshold of every strip of bubbles
+  global_thresholds  (N, 2)  global threshold and global std-dev threshold
+  shifts             (N, F)  alignment shift of every field block
+  read_times         (N,)    unix time the sheet was read at
+and the strip layout shared by the rows:
+  strip_lengths      (S,)    bubbles per strip, sums to B
+
+The stores are named after the hour of their run, which says nothing about
+which one is newer (RawReads_01PM sorts before RawReads_10AM, and the 10AM
+store of a later day is appended to): the latest read of a sheet is picked by
+its read_times. Stores saved without them count as read at their mtime.
+"""
+import os
+from time import time
+
+import numpy as np
+
+from src.logger import logger
+
+RAW_READ_ARRAYS = [
+    "input_paths",
+    "bubble_values",
+    "strip_thresholds",
+    "global_thresholds",
+    "shifts",
+    "read_times",
+]
+
+
+# the manifest lists a sheet as soon as its csv row is written, so --resume
+# skips it: a crash loses the raw reads of at most this many of them
+FLUSH_SIZE = 50
+
+
+class RawReadStore:
+    """The raw reads of a run, saved every flush_size sheets and on exit"""
+
+    def __init__(self, store_path, flush_size=FLUSH_SIZE):
+        self.store_path = store_path
+        self.flush_size = flush_size
+        self.input_paths, self.raw_reads, self.read_times = [], [], []
+
+    def add(self, file_path, raw_read):
+        self.input_paths.append(str(file_path))
+        self.raw_reads.append(raw_read)
+        self.read_times.append(time())
+        if len(self.raw_reads) >= self.flush_size:
+            self.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+    def to_arrays(self):
+        raw_reads = self.raw_reads
+        return {
+            "input_paths": np.array(self.input_paths, dtype=str),
+            "bubble_values": np.array(
+                [raw_read["bubble_values"] for raw_read in raw_reads], dtype=np.float64
+            ),
+            "strip_thresholds": np.array(
+                [raw_read["strip_thresholds"] for raw_read in raw_reads],
+                dtype=np.float64,
+            ),
+            "global_thresholds": np.array(
+                [
+                    [raw_read["global_threshold"], raw_read["global_std_threshold"]]
+                    for raw_read in raw_reads
+                ],
+                dtype=np.float64,
+            ),
+            "shifts": np.array(
+                [raw_read["shifts"] for raw_read in raw_reads], dtype=np.int32
+            ),
+            "read_times": np.array(self.read_times, dtype=np.float64),
+            "strip_lengths": np.array(raw_reads[0]["strip_lengths"], dtype=np.int32),
+        }
+
+    def save(self):
+        if not self.raw_reads:
+            return
+        arrays = self.to_arrays()
+        if os.path.exists(self.store_path):
+            arrays = merge_raw_reads(load_raw_reads(self.store_path), arrays)
+        save_raw_reads(self.store_path, arrays)
+        logger.info(f"Saved raw reads of {len(self.raw_reads)} sheet(s)")
+        self.input_paths, self.raw_reads, self.read_times = [], [], []
+
+
+def is_raw_reads_store(file_name):
+    return file_name.startswith("RawReads_") and file_name.endswith(".npz")
+
+
+def save_raw_reads(store_path, arrays):
+    # np.savez adds the extension to names without it
+    temp_path = f"{os.path.splitext(store_path)[0]}.tmp.npz"
+    np.savez_compressed(temp_path, **arrays)
+    os.replace(temp_path, store_path)
+
+
+def load_raw_reads(store_path):
+    with np.load(store_path) as store:
+        raw_reads = {key: store[key] for key in store.files}
+    if "read_times" not in raw_reads:
+        raw_reads["read_times"] = np.full(
+            len(raw_reads["input_paths"]), os.path.getmtime(store_path)
+        )
+    return raw_reads
+
+
+def load_results_raw_reads(results_dir):
+    """The raw reads of all the RawReads_*.npz of a Results directory, the latest
+    read of each sheet wins (their names do not sort by time), None without any"""
+    store_names = sorted(
+        (
+            file_name
+            for file_name in os.listdir(results_dir)
+            if is_raw_reads_store(file_name)
+        ),
+        key=lambda file_name: os.path.getmtime(os.path.join(results_dir, file_name)),
+    )
+    if not store_names:
+        return None
+    raw_reads = load_raw_reads(os.path.join(results_dir, store_names[0]))
+    for store_name in store_names[1:]:
+        raw_reads = merge_raw_reads(
+            raw_reads, load_raw_reads(os.path.join(results_dir, store_name))
+        )
+    return raw_reads
+
+
+def get_sheet_raw_read(raw_reads, input_path):
+    """The row of a sheet as read_omr_response fills its raw_read, None if the
+    sheet has none"""
+    rows = np.flatnonzero(raw_reads["input_paths"] == str(input_path))
+    if len(rows) == 0:
+        return None
+    row = rows[-1]
+    global_threshold, global_std_threshold = raw_reads["global_thresholds"][row]
+    return {
+        "bubble_values": raw_reads["bubble_values"][row].tolist(),
+        "strip_lengths": raw_reads["strip_lengths"].tolist(),
+        "strip_thresholds": raw_reads["strip_thresholds"][row].tolist(),
+        "global_threshold": float(global_threshold),
+        "global_std_threshold": float(global_std_threshold),
+        "shifts": raw_reads["shifts"][row].tolist(),
+    }
+
+
+def merge_raw_reads(older, newer):
+    """The latest read of every input path, newer wins a tie"""
+    if not np.array_equal(older["strip_lengths"], newer["strip_lengths"]):
+        if older["read_times"].max(initial=0) > newer["read_times"].max(initial=0):
+            older, newer = newer, older
+        logger.warning("Dropping earlier raw reads made with a different template")
+        return newer
+    merged = {
+        key: np.concatenate([older[key], newer[key]]) for key in RAW_READ_ARRAYS
+    }
+    input_paths = merged["input_paths"]
+    if len(input_paths) == 0:
+        return merged
+    positions = np.arange(len(input_paths))
+    # by path, then by read time and position: the last row of a path wins
+    order = np.lexsort((positions, merged["read_times"], input_paths))
+    sorted_paths = input_paths[order]
+    is_latest = np.append(sorted_paths[1:] != sorted_paths[:-1], True)
+    keep = np.sort(order[is_latest])
+    merged = {key: merged[key][keep] for key in RAW_READ_ARRAYS}
+    merged["strip_lengths"] = newer["strip_lengths"]
+    return merged
+
+
+def split_strips(bubble_values, strip_lengths):
+    """The bubble values of one sheet as a list of strips, like read_omr_response
+    samples them"""
+    return [
+        strip.tolist()
+        for strip in np.split(bubble_values, np.cumsum(strip_lengths)[:-1])
+    ]
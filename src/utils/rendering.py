@@ -0,0 +1,249 @@
+"""
+Cached drawing plans of the marks and layouts drawn on the sheets.
+
+read_omr_response marks the bubbles of every sheet and draw_template_layout
+draws the whole grid of the template, with coordinates that only depend on the
+template and its field block shifts. They are computed once per template (and
+set of shifts for the layouts) into a list of cv2 operations that is replayed
+on each sheet; a run of unmarked bubbles filling the same box draws it once.
+The cv2 calls and their order are kept: putText blends its anti-aliased edges
+with the pixels under it, the images stay the same pixel for pixel.
+"""
+import threading
+import weakref
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import src.constants as constants
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+MARK_TEXT_COLOR = (20, 20, 10)
+MARK_TEXT_THICKNESS = int(1 + 3.5 * constants.TEXT_SIZE)
+QVAL_TEXT_SIZE = 0.6
+QVAL_TEXT_THICKNESS = 2
+NAME_TEXT_THICKNESS = 4
+# layouts kept per template, a new one for every set of field block shifts
+LAYOUT_CACHE_SIZE = 8
+
+RECTANGLE, TEXT, QVAL = "rectangle", "text", "qval"
+
+
+def get_box(x, y, box_w, box_h, inset):
+    return (int(x + box_w / inset), int(y + box_h / inset)), (
+        int(x + box_w - box_w / inset),
+        int(y + box_h - box_h / inset),
+    )
+
+
+def get_bubbles(template):
+    """(field_block, bubble) in the order of classify_bubbles"""
+    for field_block in template.field_blocks:
+        for field_block_bubbles in field_block.traverse_bubbles:
+            for bubble in field_block_bubbles:
+                yield field_block, bubble
+
+
+class MarksPlan:
+    """The marks of read_omr_response: the box and value of marked bubbles,
+    a gray box for unmarked ones"""
+
+    def __init__(self, template):
+        block_indices = {
+            id(field_block): index
+            for index, field_block in enumerate(template.field_blocks)
+        }
+        # (x, y, box_w, box_h, value, block index) of every bubble
+        self.bubbles = [
+            (
+                bubble.x,
+                bubble.y,
+                *field_block.bubble_dimensions,
+                str(bubble.field_value),
+                block_indices[id(field_block)],
+            )
+            for field_block, bubble in get_bubbles(template)
+        ]
+        dimensions = np.array(
+            [bubble[2:4] for bubble in self.bubbles], dtype=float
+        ).reshape(-1, 2)
+        self.dimensions_changed = np.ones(len(self.bubbles), bool)
+        self.dimensions_changed[1:] = np.any(dimensions[1:] != dimensions[:-1], axis=1)
+
+    def draw(self, image, shifts, marks):
+        if not self.bubbles:
+            return
+        marks = np.asarray(marks, bool)
+        # An unmarked bubble is filled at the last marked bubble before it (at
+        # the last sampled bubble before the first one), as the drawing loop of
+        # read_omr_response always did. Filling the same box again over a run
+        # of unmarked bubbles changes nothing, only the first fill is drawn.
+        fills = ~marks
+        fills[1:] &= marks[:-1] | self.dimensions_changed[1:]
+        x, y, *_, block_index = self.bubbles[-1]
+        x += shifts[block_index]
+        for index in np.flatnonzero(marks | fills).tolist():
+            bubble_x, bubble_y, box_w, box_h, value, block_index = self.bubbles[index]
+            if marks[index]:
+                x, y = bubble_x + shifts[block_index], bubble_y
+                cv2.rectangle(
+                    image,
+                    *get_box(x, y, box_w, box_h, 12),
+                    constants.CLR_DARK_GRAY,
+                    3,
+                )
+                cv2.putText(
+                    image,
+                    value,
+                    (x, y),
+                    FONT,
+                    constants.TEXT_SIZE,
+                    MARK_TEXT_COLOR,
+                    MARK_TEXT_THICKNESS,
+                )
+            else:
+                cv2.rectangle(
+                    image, *get_box(x, y, box_w, box_h, 10), constants.CLR_GRAY, -1
+                )
+
+
+class LayoutPlan:
+    """The operations of draw_template_layout for one set of field block shifts,
+    a QVAL operation writes the mean value of a bubble"""
+
+    def __init__(self, template, shifted, draw_qvals, border):
+        self.operations = []
+        self.bubble_rects = []
+        for field_block in template.field_blocks:
+            s, d = field_block.origin, field_block.dimensions
+            box_w, box_h = field_block.bubble_dimensions
+            shift = field_block.shift if shifted else 0
+            self.operations.append(
+                (
+                    RECTANGLE,
+                    (s[0] + shift, s[1]),
+                    (s[0] + shift + d[0], s[1] + d[1]),
+                    constants.CLR_BLACK,
+                    3,
+                )
+            )
+            for field_block_bubbles in field_block.traverse_bubbles:
+                for pt in field_block_bubbles:
+                    x, y = pt.x + shift, pt.y
+                    self.operations.append(
+                        (
+                            RECTANGLE,
+                            *get_box(x, y, box_w, box_h, 10),
+                            constants.CLR_GRAY,
+                            border,
+                        )
+                    )
+                    if draw_qvals:
+                        self.operations.append(
+                            (
+                                QVAL,
+                                len(self.bubble_rects),
+                                (x + 2, y + (box_h * 2) // 3),
+                            )
+                        )
+                        self.bubble_rects.append((x, y, box_w, box_h))
+            if shifted:
+                text_in_px = cv2.getTextSize(
+                    field_block.name, FONT, constants.TEXT_SIZE, NAME_TEXT_THICKNESS
+                )
+                self.operations.append(
+                    (
+                        TEXT,
+                        field_block.name,
+                        (
+                            int(s[0] + d[0] - text_in_px[0][0]),
+                            int(s[1] - text_in_px[0][1]),
+                        ),
+                        constants.TEXT_SIZE,
+                        constants.CLR_BLACK,
+                        NAME_TEXT_THICKNESS,
+                    )
+                )
+
+    def get_bubble_means(self, img):
+        return [
+            cv2.mean(img[y : y + box_h, x : x + box_w])[0]
+            for x, y, box_w, box_h in self.bubble_rects
+        ]
+
+    def draw(self, image, q_vals):
+        for operation in self.operations:
+            kind = operation[0]
+            if kind == RECTANGLE:
+                cv2.rectangle(image, *operation[1:])
+            elif kind == QVAL:
+                _, index, origin = operation
+                cv2.putText(
+                    image,
+                    f"{int(q_vals[index])}",
+                    origin,
+                    FONT,
+                    QVAL_TEXT_SIZE,
+                    constants.CLR_BLACK,
+                    QVAL_TEXT_THICKNESS,
+                )
+            else:
+                _, value, origin, scale, color, thickness = operation
+                cv2.putText(image, value, origin, FONT, scale, color, thickness)
+
+
+class TemplatePlans:
+    """The plans of one template, see get_plans"""
+
+    def __init__(self, template):
+        self.lock = threading.Lock()
+        self.marks = MarksPlan(template)
+        self.layouts = OrderedDict()
+
+    def get_layout(self, template, shifted, draw_qvals, border):
+        shifts = tuple(field_block.shift for field_block in template.field_blocks)
+        key = (shifted, draw_qvals, border, shifts if shifted else None)
+        with self.lock:
+            layout = self.layouts.get(key)
+            if layout is None:
+                layout = LayoutPlan(template, shifted, draw_qvals, border)
+                self.layouts[key] = layout
+                if len(self.layouts) > LAYOUT_CACHE_SIZE:
+                    self.layouts.popitem(last=False)
+            else:
+                self.layouts.move_to_end(key)
+            return layout
+
+
+# the plans go away with their template
+PLANS = weakref.WeakKeyDictionary()
+PLANS_LOCK = threading.Lock()
+
+
+def get_plans(template):
+    with PLANS_LOCK:
+        plans = PLANS.get(template)
+        if plans is None:
+            plans = PLANS[template] = TemplatePlans(template)
+        return plans
+
+
+def draw_marks(image, template, bubble_marks):
+    """Draws the bubble_marks of classify_bubbles on image, in place"""
+    get_plans(template).marks.draw(
+        image,
+        [field_block.shift for field_block in template.field_blocks],
+        [bubble_is_marked for _, _, bubble_is_marked in bubble_marks],
+    )
+
+
+def draw_layout(img, template, shifted, draw_qvals, border, q_vals=None):
+    """A copy of img with the layout of the template, q_vals are the bubble
+    means written with draw_qvals (read from img when None)"""
+    layout = get_plans(template).get_layout(template, shifted, draw_qvals, border)
+    if draw_qvals and q_vals is None:
+        q_vals = layout.get_bubble_means(img)
+    final_align = img.copy()
+    layout.draw(final_align, q_vals)
+    return final_align
@@ -0,0 +1,106 @@
+"""
+Directory scanning for process_dir: one os.scandir pass per directory, which
+classifies images by extension (case-insensitive) and notes the OMRChecker json
+files present. WorkPlan walks a whole input tree up front so that the
+directories and their image lists can be shared out before processing starts.
+"""
+import os
+from pathlib import Path
+
+from src import constants
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class DirectoryScan:
+    def __init__(self, path, subdirs, images, file_names):
+        self.path = path
+        self.subdirs = subdirs
+        self.images = images
+        self.file_names = file_names
+
+    def has_file(self, file_name):
+        return file_name in self.file_names
+
+    @property
+    def has_template(self):
+        return self.has_file(constants.TEMPLATE_FILENAME)
+
+    @property
+    def has_config(self):
+        return self.has_file(constants.CONFIG_FILENAME)
+
+    @property
+    def has_evaluation(self):
+        return self.has_file(constants.EVALUATION_FILENAME)
+
+
+def scan_directory(directory):
+    directory = Path(directory)
+    subdirs, images, file_names = [], [], set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                subdirs.append(directory.joinpath(entry.name))
+            elif entry.is_file():
+                file_names.add(entry.name)
+                # hidden files are skipped, like the glob patterns used before
+                if (
+                    not entry.name.startswith(".")
+                    and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+                ):
+                    images.append(directory.joinpath(entry.name))
+    subdirs.sort()
+    images.sort()
+    return DirectoryScan(directory, subdirs, images, file_names)
+
+
+def normalize_path(path):
+    # cheap and syscall free, good enough to compare paths built from the same root
+    return os.path.normpath(os.path.abspath(path))
+
+
+class WorkPlan:
+    """Scans of every directory under root_dir, in processing order
+    (a directory comes before its sub-directories)"""
+
+    def __init__(self, root_dir, scans):
+        self.root_dir = root_dir
+        self.scans = scans
+
+    @staticmethod
+    def scan(root_dir):
+        scans = {}
+        pending = [Path(root_dir)]
+        while pending:
+            directory_scan = scan_directory(pending.pop())
+            scans[directory_scan.path] = directory_scan
+            pending.extend(reversed(directory_scan.subdirs))
+        return WorkPlan(root_dir, scans)
+
+    def __getitem__(self, directory):
+        return self.scans[Path(directory)]
+
+    def __contains__(self, directory):
+        return Path(directory) in self.scans
+
+    def __iter__(self):
+        return iter(self.scans.values())
+
+    @property
+    def image_count(self):
+        return sum(len(directory_scan.images) for directory_scan in self)
+
+    def image_offsets(self):
+        """directory -> running index of its first image in the whole plan"""
+        offsets, offset = {}, 0
+        for directory_scan in self:
+            offsets[directory_scan.path] = offset
+            offset += len(directory_scan.images)
+        return offsets
+
+    @property
+    def template_dirs(self):
+        return [
+            directory_scan.path for directory_scan in self if directory_scan.has_template
+        ]
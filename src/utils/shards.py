@@ -0,0 +1,202 @@
+"""
+Splitting a batch across machines with --shard K/N, and merging the shard
+outputs back into the layout of a single run (`main.py merge`).
+
+Shard K takes every N-th image of the input tree, starting at the K-th one, in
+the order of the WorkPlan (a running index across all directories, so that a
+tree of many small directories is spread as evenly as one large directory).
+The shards are disjoint, cover every image and need no coordination. Each
+shard writes to <output_dir>/shard-K-of-N.
+"""
+import argparse
+import csv
+import os
+import re
+import shutil
+from pathlib import Path
+
+from src.logger import logger
+from src.utils.file import write_csv_rows
+from src.utils.raw_reads import (
+    is_raw_reads_store,
+    load_raw_reads,
+    merge_raw_reads,
+    save_raw_reads,
+)
+
+SHARD_DIR_PATTERN = re.compile(r"^shard-(\d+)-of-(\d+)$")
+MANUAL_CSV_NAMES = ["MultiMarkedFiles.csv", "ErrorFiles.csv"]
+MANIFEST_NAME = "ProcessedFiles.jsonl"
+
+
+def parse_shard(value):
+    """argparse type for 'K/N', K counts from 1"""
+    match = re.fullmatch(r"(\d+)/(\d+)", value.strip())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Expected a shard as K/N, got '{value}'")
+    shard_index, shard_count = int(match.group(1)), int(match.group(2))
+    if not 1 <= shard_index <= shard_count:
+        raise argparse.ArgumentTypeError(f"Shard {shard_index} is not in 1..{shard_count}")
+    return shard_index, shard_count
+
+
+def select_shard(omr_files, shard, first_index=0):
+    """The omr_files of shard K/N, first_index being the running index of the
+    first of them in the whole input tree (see WorkPlan.image_offsets)"""
+    shard_index, shard_count = shard
+    return [
+        file_path
+        for index, file_path in enumerate(omr_files, start=first_index)
+        if index % shard_count == shard_index - 1
+    ]
+
+
+def get_shard_output_dir(output_dir, shard):
+    shard_index, shard_count = shard
+    return Path(output_dir, f"shard-{shard_index}-of-{shard_count}")
+
+
+def is_results_csv(relative_path):
+    name = relative_path.name
+    return (
+        relative_path.parent.name == "Results"
+        and name.startswith("Results_")
+        and name.endswith(".csv")
+    )
+
+
+def is_merged_csv(relative_path):
+    return is_results_csv(relative_path) or (
+        relative_path.parent.name == "Manual" and relative_path.name in MANUAL_CSV_NAMES
+    )
+
+
+def read_csv_rows(file_path):
+    with open(file_path, "r", newline="") as f:
+        return list(csv.reader(f))
+
+
+def input_order_key(row):
+    # a single run appends the rows in the sorted order of the input paths
+    return Path(row[1]) if len(row) > 1 else Path()
+
+
+def relocate_output_path(row, shard_dir, output_dir):
+    """Moves the output_path (third column) from under shard_dir to under
+    output_dir, returns False when it is not under shard_dir"""
+    if len(row) <= 2:
+        return True
+    try:
+        relative_path = Path(row[2]).resolve().relative_to(shard_dir.resolve())
+    except ValueError:
+        return False
+    row[2] = str(output_dir.joinpath(relative_path))
+    return True
+
+
+def find_shard_dirs(output_dir):
+    shard_dirs = []
+    for entry in sorted(os.listdir(output_dir)):
+        match = SHARD_DIR_PATTERN.match(entry)
+        if match and os.path.isdir(os.path.join(output_dir, entry)):
+            shard_dirs.append((int(match.group(1)), int(match.group(2)), entry))
+    shard_counts = {shard_count for _, shard_count, _ in shard_dirs}
+    if len(shard_counts) > 1:
+        logger.critical(f"Found shard directories of different runs: {shard_dirs}")
+        raise Exception(f"Mixed shard counts {sorted(shard_counts)} in '{output_dir}'")
+    if shard_dirs:
+        (shard_count,) = shard_counts
+        missing = set(range(1, shard_count + 1)) - {index for index, _, _ in shard_dirs}
+        if missing:
+            logger.warning(f"Merging without the outputs of shard(s) {sorted(missing)}")
+    return [Path(output_dir, name) for _, _, name in sorted(shard_dirs)]
+
+
+def merge_shards(output_dir):
+    """Combines <output_dir>/shard-K-of-N into <output_dir>. The csv files are
+    rewritten from the shards, so merging again after a shard re-ran is fine"""
+    output_dir = Path(output_dir)
+    shard_dirs = find_shard_dirs(output_dir) if output_dir.is_dir() else []
+    if not shard_dirs:
+        logger.critical(f"No shard-K-of-N directories to merge in '{output_dir}'")
+        raise Exception(f"No shard outputs found in '{output_dir}'")
+
+    # relative path -> [header, rows] for csvs, lines for manifests. The Results
+    # csvs are named after the hour of their run, the ones of a directory are
+    # merged into one, named after the latest of them.
+    merged_csvs, merged_manifests, copied_files = {}, {}, set()
+    # relative path -> arrays, the raw reads of every shard are kept
+    merged_raw_reads = {}
+    results_names = {}
+    for shard_dir in shard_dirs:
+        logger.info(f"Merging '{shard_dir}'")
+        for root, _dirs, file_names in os.walk(shard_dir):
+            for file_name in sorted(file_names):
+                source_path = Path(root, file_name)
+                relative_path = source_path.relative_to(shard_dir)
+                if is_merged_csv(relative_path):
+                    header, *rows = read_csv_rows(source_path) or [[]]
+                    if is_results_csv(relative_path):
+                        mtime = os.path.getmtime(source_path)
+                        latest = results_names.get(relative_path.parent)
+                        if latest is None or mtime > latest[0]:
+                            results_names[relative_path.parent] = (mtime, file_name)
+                        relative_path = relative_path.parent
+                    merged = merged_csvs.setdefault(relative_path, [header, []])
+                    not_relocated = [
+                        row
+                        for row in rows
+                        if not relocate_output_path(row, shard_dir, output_dir)
+                    ]
+                    if not_relocated:
+                        logger.warning(
+                            f"{len(not_relocated)} output path(s) of '{source_path}' are not under '{shard_dir}' and were left as they are, e.g. '{not_relocated[0][2]}'"
+                        )
+                    merged[1].extend(rows)
+                elif file_name == MANIFEST_NAME:
+                    with open(source_path, "r") as f:
+                        # a crashed shard may have left a partial last line
+                        merged_manifests.setdefault(relative_path, []).extend(
+                            line if line.endswith("\n") else f"{line}\n"
+                            for line in f
+                        )
+                elif is_raw_reads_store(file_name):
+                    raw_reads = load_raw_reads(source_path)
+                    if relative_path in merged_raw_reads:
+                        raw_reads = merge_raw_reads(
+                            merged_raw_reads[relative_path], raw_reads
+                        )
+                    merged_raw_reads[relative_path] = raw_reads
+                elif relative_path not in copied_files:
+                    # annotated images, stacks and per-sheet evaluations
+                    copied_files.add(relative_path)
+                    destination_path = output_dir.joinpath(relative_path)
+                    destination_path.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copy2(source_path, destination_path)
+
+    written_csvs = {}
+    for key, (header, rows) in merged_csvs.items():
+        relative_path = (
+            key.joinpath(results_names[key][1]) if key in results_names else key
+        )
+        rows = sorted(rows, key=input_order_key)
+        destination_path = output_dir.joinpath(relative_path)
+        destination_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(destination_path, "w", newline="") as f:
+            write_csv_rows(f, [header] + rows)
+        written_csvs[relative_path] = [header, rows]
+    for relative_path, lines in merged_manifests.items():
+        destination_path = output_dir.joinpath(relative_path)
+        destination_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(destination_path, "w") as f:
+            f.writelines(lines)
+
+    for relative_path, raw_reads in merged_raw_reads.items():
+        destination_path = output_dir.joinpath(relative_path)
+        destination_path.parent.mkdir(parents=True, exist_ok=True)
+        save_raw_reads(str(destination_path), raw_reads)
+
+    logger.info(
+        f"Merged {len(shard_dirs)} shard(s) into '{output_dir}': {len(written_csvs)} csv file(s), {len(merged_raw_reads)} raw read store(s), {len(copied_files)} other file(s)"
+    )
+    return written_csvs
@@ -0,0 +1,139 @@
+"""
+Generator building blocks for the staged sheet pipeline in src/entry.py:
+decode (prefetch thread) -> preprocess + read (compute workers) -> evaluate + write
+(consumer, in input order). Every stage is bounded, so at most about
+2 * queue_size + workers decoded sheets are alive at any time.
+"""
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from src.logger import logger
+
+_END = object()
+# one decoded sheet per stage: decode queue, worker, write queue
+MIN_DECODED_IMAGES = 3
+
+
+@dataclass(frozen=True)
+class PipelineOptions:
+    # compute threads for preprocess + read, 0 runs them on the consumer thread
+    workers: int = min(4, os.cpu_count() or 1)
+    # decoded sheets waiting for a worker, and processed sheets waiting to be written
+    queue_size: int = 4
+
+    @staticmethod
+    def from_args(args):
+        defaults = PipelineOptions()
+        workers, queue_size = args.get("workers"), args.get("queue_size")
+        return PipelineOptions(
+            workers=defaults.workers if workers is None else max(0, int(workers)),
+            queue_size=defaults.queue_size
+            if queue_size is None
+            else max(1, int(queue_size)),
+        )
+
+    def for_tuning_config(self, tuning_config):
+        options = self
+        if tuning_config.outputs.show_image_level > 0:
+            # image windows have to stay on the main thread
+            options = PipelineOptions(workers=0, queue_size=self.queue_size)
+        elif (
+            tuning_config.outputs.save_image_level > 0
+            or tuning_config.alignment_params.auto_align
+        ):
+            # the debug image stacks and the field block shifts are shared per
+            # template, so sheets have to be read one at a time
+            options = PipelineOptions(
+                workers=min(1, self.workers), queue_size=self.queue_size
+            )
+        return options.limit_decoded_images(tuning_config.memory.max_decoded_images)
+
+    def limit_decoded_images(self, max_decoded_images):
+        """Fewer workers first, then shorter queues, down to one sheet per stage:
+        limits below MIN_DECODED_IMAGES cannot be honoured and are rejected"""
+        if max_decoded_images and max_decoded_images < MIN_DECODED_IMAGES:
+            logger.critical(
+                f"memory.max_decoded_images is {max_decoded_images}, the pipeline keeps one sheet per stage"
+            )
+            raise Exception(
+                f"max_decoded_images must be 0 (no limit) or at least {MIN_DECODED_IMAGES}"
+            )
+        if (
+            not max_decoded_images
+            or self.get_max_decoded_images() <= max_decoded_images
+        ):
+            return self
+        min_workers = min(1, self.workers)
+        workers = min(self.workers, max(min_workers, max_decoded_images - 2))
+        queue_size = max(1, (max_decoded_images - workers) // 2)
+        return PipelineOptions(workers=workers, queue_size=queue_size)
+
+    def get_max_decoded_images(self):
+        return 2 * self.queue_size + self.workers
+
+
+def prefetch(iterable, queue_size):
+    """Runs the iterable on a background thread, at most queue_size items ahead
+    of the consumer. Exceptions are re-raised in the consumer."""
+    items = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as error:
+            put((None, error))
+            return
+        put((_END, None))
+
+    producer = threading.Thread(target=produce, name="omr-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def ordered_map(func, iterable, workers, queue_size):
+    """Yields func(item) for each item in input order, computed on `workers`
+    threads with at most workers + queue_size items in flight. An exception
+    raised by func is re-raised at that item's position."""
+    if workers <= 0:
+        yield from map(func, iterable)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="omr-worker")
+    pending = deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= workers + queue_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
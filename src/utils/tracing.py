@@ -0,0 +1,256 @@
+"""
+Span tracing of the pipeline: job (or directory) -> sheet -> stage.
+
+The spans have the shape of the spans of OTLP/JSON (traceId, spanId,
+parentSpanId, name, startTimeUnixNano, endTimeUnixNano, attributes, status),
+so they load into OpenTelemetry tooling without a collector in between.
+They are appended one per line to a file by JsonLinesExporter (--trace,
+OMR_TRACE_FILE in the API) or kept by InMemoryExporter.
+
+Disabled while TRACER has no exporter. Once enabled, the stages recorded by
+STAGE_TIMINGS become spans under a span per sheet, with the attributes the
+pipeline attached to the sheet (image size, marker scale, outcome).
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from time import perf_counter
+
+from src.utils.instrumentation import STAGE_TIMINGS
+
+STATUS_OK = "STATUS_CODE_OK"
+STATUS_ERROR = "STATUS_CODE_ERROR"
+
+
+def new_id(size):
+    return os.urandom(size).hex()
+
+
+def to_attribute_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 values are strings in OTLP/JSON
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    def __init__(
+        self, name, trace_id, parent_span_id, start_ns, attributes=None, span_id=None
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id or new_id(8)
+        self.parent_span_id = parent_span_id
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.failed = False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, end_ns, failed=False):
+        self.end_ns = end_ns
+        self.failed = failed
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": to_attribute_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": STATUS_ERROR if self.failed else STATUS_OK},
+        }
+
+
+class InMemoryExporter:
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def export(self, span):
+        with self.lock:
+            self.spans.append(span.to_dict())
+
+
+class JsonLinesExporter:
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.file = None
+        atexit.register(self.close)
+
+    def export(self, span):
+        line = (json.dumps(span.to_dict()) + "\n").encode("utf-8")
+        with self.lock:
+            if self.file is None:
+                # unbuffered: one write per line, the --dirWorkers processes
+                # append to the same file
+                self.file = open(self.path, "ab", buffering=0)
+            self.file.write(line)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        atexit.unregister(self.close)
+
+
+class Tracer:
+    def __init__(self):
+        self.exporter = None
+        self.local = threading.local()
+        # perf_counter() of STAGE_TIMINGS to unix time
+        self.clock_offset_ns = time.time_ns() - time.perf_counter_ns()
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def export_to(self, path):
+        if not isinstance(self.exporter, JsonLinesExporter) or (
+            self.exporter.path != str(path)
+        ):
+            if isinstance(self.exporter, JsonLinesExporter):
+                self.exporter.close()
+            self.exporter = JsonLinesExporter(path)
+
+    def to_unix_ns(self, perf_counter_value):
+        return self.clock_offset_ns + int(perf_counter_value * 1e9)
+
+    def now_ns(self):
+        # on the clock of the stage spans, whatever happens to the wall clock
+        return self.to_unix_ns(perf_counter())
+
+    def get_current_span(self):
+        return getattr(self.local, "span", None)
+
+    @contextmanager
+    def span(self, name, attributes=None):
+        """A child of the current span of this thread, yields None when disabled"""
+        if not self.enabled:
+            yield None
+            return
+        parent = self.get_current_span()
+        span = Span(
+            name,
+            parent.trace_id if parent else new_id(16),
+            parent.span_id if parent else None,
+            self.now_ns(),
+            attributes,
+        )
+        self.local.span = span
+        failed = False
+        try:
+            yield span
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.local.span = parent
+            span.end(self.now_ns(), failed)
+            self.exporter.export(span)
+
+    @contextmanager
+    def trace_pipeline(self, name, attributes=None):
+        """A span around a pipeline run, with the sheets and their stages under it"""
+        with self.span(name, attributes) as span:
+            if span is None:
+                yield None
+                return
+            pipeline_tracer = PipelineTracer(self, span)
+            STAGE_TIMINGS.add_listener(pipeline_tracer.record_stage)
+            try:
+                yield span
+            finally:
+                STAGE_TIMINGS.remove_listener(pipeline_tracer.record_stage)
+                pipeline_tracer.end_open_sheets()
+
+
+class PipelineTracer:
+    """STAGE_TIMINGS listener: a span per stage, under a span per sheet that is
+    exported with the "sheet" stage recorded once its csv row is written, or
+    with an error status by end_open_sheets() if the sheet never got there"""
+
+    def __init__(self, tracer, parent):
+        self.tracer = tracer
+        self.parent = parent
+        self.sheet_span_ids = {}
+        # start of the first stage of the sheets whose span is not exported yet
+        self.open_sheets = {}
+        self.lock = threading.Lock()
+
+    def get_sheet_span_id(self, sheet_context, start):
+        # kept for the whole run, artifact writes can end after their sheet
+        with self.lock:
+            if sheet_context not in self.sheet_span_ids:
+                self.sheet_span_ids[sheet_context] = new_id(8)
+                self.open_sheets[sheet_context] = start
+            return self.sheet_span_ids[sheet_context]
+
+    def export_sheet_span(self, sheet_context, start_ns, end_ns, failed):
+        span = Span(
+            "omr.sheet",
+            self.parent.trace_id,
+            self.parent.span_id,
+            start_ns,
+            {"omr.sheet": sheet_context.name, **sheet_context.attributes},
+            span_id=self.get_sheet_span_id(sheet_context, start_ns),
+        )
+        with self.lock:
+            self.open_sheets.pop(sheet_context, None)
+        span.end(end_ns, failed)
+        self.tracer.exporter.export(span)
+
+    def end_open_sheets(self):
+        """Exports the spans of the sheets that failed before their "sheet" stage,
+        so that their stage spans keep a parent"""
+        with self.lock:
+            open_sheets = list(self.open_sheets.items())
+        end_ns = self.tracer.now_ns()
+        for sheet_context, start_ns in open_sheets:
+            self.export_sheet_span(sheet_context, start_ns, end_ns, failed=True)
+
+    def record_stage(self, stage, start, end, failed):
+        sheet_context = STAGE_TIMINGS.get_current_sheet()
+        if sheet_context is None:
+            parent_span_id = self.parent.span_id
+        elif stage == "sheet":
+            self.export_sheet_span(
+                sheet_context,
+                self.tracer.to_unix_ns(start),
+                self.tracer.to_unix_ns(end),
+                failed,
+            )
+            return
+        else:
+            parent_span_id = self.get_sheet_span_id(
+                sheet_context, self.tracer.to_unix_ns(start)
+            )
+        span = Span(
+            stage,
+            self.parent.trace_id,
+            parent_span_id,
+            self.tracer.to_unix_ns(start),
+        )
+        span.end(self.tracer.to_unix_ns(end), failed)
+        self.tracer.exporter.export(span)
+
+
+# Singleton export
+TRACER = Tracer()
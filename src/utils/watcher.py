@@ -0,0 +1,72 @@
+"""
+Polling watcher for --watch: reports images that appear under a directory tree
+once they are completely written.
+
+Only directories whose mtime changed get listed again (adding, removing or
+renaming an entry updates it), so a poll of an idle tree costs one stat per
+directory. A new image is reported once its size and mtime stayed the same for
+settle_time seconds, scanners write files in several chunks.
+"""
+import os
+from pathlib import Path
+from time import monotonic
+
+from src.utils.scanner import scan_directory
+
+
+class DirectoryWatcher:
+    def __init__(self, root_dir, known_files=(), settle_time=0.5):
+        self.root_dir = Path(root_dir)
+        self.settle_time = settle_time
+        self.known_files = set(known_files)
+        # directory -> mtime_ns at its last listing
+        self.dir_mtimes = {}
+        # new file -> ((size, mtime_ns), monotonic time it was last seen changing)
+        self.pending = {}
+        self.refresh(self.root_dir)
+
+    def poll(self):
+        """Returns the new images that finished writing since the last poll, in
+        path order"""
+        for directory in list(self.dir_mtimes):
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                del self.dir_mtimes[directory]
+                continue
+            if mtime_ns != self.dir_mtimes[directory]:
+                self.refresh(directory)
+        return self.collect_settled()
+
+    def refresh(self, directory):
+        try:
+            self.dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+            directory_scan = scan_directory(directory)
+        except FileNotFoundError:
+            self.dir_mtimes.pop(directory, None)
+            return
+        for file_path in directory_scan.images:
+            if file_path not in self.known_files and file_path not in self.pending:
+                self.pending[file_path] = (None, monotonic())
+        for subdir in directory_scan.subdirs:
+            if subdir not in self.dir_mtimes:
+                self.refresh(subdir)
+
+    def collect_settled(self):
+        now = monotonic()
+        settled = []
+        for file_path, (last_state, since) in list(self.pending.items()):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                # renamed or removed before it settled
+                del self.pending[file_path]
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            if state != last_state or stat.st_size == 0:
+                self.pending[file_path] = (state, now)
+            elif now - since >= self.settle_time:
+                del self.pending[file_path]
+                self.known_files.add(file_path)
+                settled.append(file_path)
+        return sorted(settled)